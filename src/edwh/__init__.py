@@ -54,10 +54,12 @@ from .meta import is_installed  # noqa E402 - must be below monkeypatch
 from .tasks import (  # noqa E402 - must be below monkeypatch
     TomlConfig,
     check_env,
+    check_envs,
     get_env_value,
     get_task,
     read_dotenv,
     set_env_value,
+    set_env_values,
     task_for_namespace,
 )
 
@@ -81,6 +83,7 @@ __all__ = [
     "add_alias",
     "arg_was_passed",
     "check_env",
+    "check_envs",
     "confirm",
     "dc_config",
     "docker_inspect",
@@ -107,6 +110,7 @@ __all__ = [
     "print_box",
     "read_dotenv",
     "set_env_value",
+    "set_env_values",
     "shorten",
     "task",
     "task_for_namespace",
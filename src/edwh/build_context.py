@@ -0,0 +1,316 @@
+"""
+Digests of docker build contexts, so edwh can tell which images actually need building.
+
+A digest covers what docker would send to the builder (the context minus
+.dockerignore), the Dockerfile and the build args. It is recorded per image tag
+after every build edwh does, so the next `build` only passes services whose
+digest moved. Build args (which can be secrets) are only recorded as an HMAC
+with a random key of this user, so their values can't be guessed from the cache.
+"""
+
+import contextlib
+import functools
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import typing as t
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .constants import AnyDict
+from .hashing import FileManifest, hash_file, hash_files, merkle_digest
+from .helpers import atomic_write_text, edwh_cache_dir
+
+# never part of a meaningful build context change
+ALWAYS_IGNORED = {".git", "__pycache__"}
+
+type IgnorePatterns = list[tuple[bool, re.Pattern[str]]]
+
+
+def build_image_tag(project: str, service_name: str, service: AnyDict) -> str:
+    """
+    The tag `docker compose build` gives an image: the explicit `image:` or `<project>-<service>`.
+    """
+    return t.cast(str, service.get("image") or f"{project}-{service_name}")
+
+
+def _build_section(service: AnyDict) -> AnyDict:
+    build = service.get("build") or {}
+    return {"context": build} if isinstance(build, str) else t.cast(AnyDict, build)
+
+
+def context_path(service: AnyDict) -> Path | None:
+    """
+    Local build context directory of a service, or None for image-only services and remote (git/url) contexts.
+    """
+    if not (build := _build_section(service)):
+        return None
+
+    path = Path(build.get("context", "."))
+    return path if path.is_dir() else None
+
+
+def dockerfile_path(service: AnyDict, context: Path) -> Path:
+    dockerfile = Path(_build_section(service).get("dockerfile") or "Dockerfile")
+    return dockerfile if dockerfile.is_absolute() else context / dockerfile
+
+
+def _translate_dockerignore(pattern: str) -> re.Pattern[str]:
+    """
+    Turn one .dockerignore line into a regex over posix paths relative to the context.
+
+    Like docker: `*` and `?` stay within one path segment, `**` spans any number of them,
+    and a pattern that matches a directory also matches everything inside it.
+    """
+    regex = ""
+    idx = 0
+    while idx < len(pattern):
+        char = pattern[idx]
+        if pattern.startswith("**/", idx):
+            regex += "(?:.*/)?"
+            idx += 3
+            continue
+        elif pattern.startswith("**", idx):
+            regex += ".*"
+            idx += 2
+            continue
+        elif char == "*":
+            regex += "[^/]*"
+        elif char == "?":
+            regex += "[^/]"
+        elif char == "[" and (end := pattern.find("]", idx)) > idx:
+            regex += pattern[idx : end + 1].replace("[!", "[^")
+            idx = end + 1
+            continue
+        else:
+            regex += re.escape(char)
+        idx += 1
+
+    return re.compile(f"^{regex}(?:/.*)?$")
+
+
+def parse_dockerignore(text: str) -> IgnorePatterns:
+    patterns = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        negated = line.startswith("!")
+        line = os.path.normpath(line.removeprefix("!").strip()).lstrip("/")
+        if line in {"", "."}:
+            continue
+
+        patterns.append((negated, _translate_dockerignore(line)))
+    return patterns
+
+
+def dockerignore_patterns(context: Path, dockerfile: Path) -> IgnorePatterns:
+    """
+    Like BuildKit: `<Dockerfile>.dockerignore` next to the Dockerfile wins over `<context>/.dockerignore`.
+    """
+    for candidate in (dockerfile.with_name(f"{dockerfile.name}.dockerignore"), context / ".dockerignore"):
+        if candidate.is_file():
+            return parse_dockerignore(candidate.read_text())
+    return []
+
+
+def is_ignored(relative_path: str, patterns: IgnorePatterns) -> bool:
+    """
+    The last matching pattern decides, so a later `!pattern` can re-include an ignored path.
+    """
+    ignored = False
+    for negated, regex in patterns:
+        if regex.match(relative_path):
+            ignored = not negated
+    return ignored
+
+
+def context_files(context: Path, patterns: IgnorePatterns | None = None) -> list[Path]:
+    """
+    All files docker would send for this context.
+    """
+    patterns = patterns or []
+    # with exceptions (!pattern), something inside an ignored directory could still be included
+    can_prune = not any(negated for negated, _ in patterns)
+
+    files = []
+    for root_path, dirs, filenames in context.walk():
+        relative_root = root_path.relative_to(context).as_posix()
+        prefix = "" if relative_root == "." else f"{relative_root}/"
+
+        dirs[:] = [
+            directory
+            for directory in dirs
+            if directory not in ALWAYS_IGNORED and not (can_prune and is_ignored(prefix + directory, patterns))
+        ]
+        files.extend(root_path / name for name in filenames if not is_ignored(prefix + name, patterns))
+
+    return files
+
+
+@functools.cache
+def _secret_key(directory: Path) -> bytes:
+    """
+    The random key (created once, only readable by this user) for the digests of build inputs in `directory`.
+    """
+    path = directory / "build-inputs.key"
+    if not path.exists():
+        tmp = directory / f".build-inputs.key.{os.getpid()}.tmp"
+        tmp.touch(mode=0o600)
+        tmp.write_bytes(secrets.token_bytes(32))
+        with contextlib.suppress(FileExistsError):
+            # a link is created completely or not at all, so other processes never read half a key
+            path.hardlink_to(tmp)
+        tmp.unlink()
+    return path.read_bytes()
+
+
+def _hash_value(value: t.Any) -> str:
+    # build args can be secrets: only a keyed digest ends up in the cache (a plain hash can be brute forced)
+    return hmac.new(_secret_key(edwh_cache_dir()), str(value).encode(), hashlib.sha256).hexdigest()
+
+
+@dataclass
+class ContextDigest:
+    digest: str
+    # {file in context or <special input>: digest}, used to explain what changed
+    parts: dict[str, str] = field(default_factory=dict)
+
+
+def context_digest(service: AnyDict) -> ContextDigest | None:
+    """
+    Digest of everything that goes into building this service, None if there is no local context to hash.
+    """
+    if not (context := context_path(service)):
+        return None
+
+    build = _build_section(service)
+    dockerfile = dockerfile_path(service, context)
+    patterns = dockerignore_patterns(context, dockerfile)
+
+    manifest = FileManifest.for_directory(context, f"build-{dockerfile.name}")
+    parts = hash_files(context, context_files(context, patterns), manifest)
+    manifest.save()
+
+    if inline := build.get("dockerfile_inline"):
+        parts["<dockerfile>"] = _hash_value(inline)
+    elif dockerfile.is_file():
+        parts["<dockerfile>"] = hash_file(dockerfile)
+
+    for name, value in sorted((build.get("args") or {}).items()):
+        parts[f"<build-arg {name}>"] = _hash_value(value)
+    if target := build.get("target"):
+        parts["<target>"] = _hash_value(target)
+
+    return ContextDigest(merkle_digest(parts), parts)
+
+
+def explain_changes(old: t.Mapping[str, str], new: t.Mapping[str, str], limit: int = 10) -> list[str]:
+    """
+    Human readable list of added/removed/modified inputs between two `ContextDigest.parts`.
+    """
+    changes = [f"added {name}" for name in sorted(new.keys() - old.keys())]
+    changes += [f"removed {name}" for name in sorted(old.keys() - new.keys())]
+    changes += [f"modified {name}" for name in sorted(old.keys() & new.keys()) if old[name] != new[name]]
+
+    if len(changes) > limit:
+        changes = [*changes[:limit], f"... and {len(changes) - limit} more"]
+    return changes
+
+
+class BuildDigests:
+    """
+    Context digest per image tag, as of the last build edwh did for it.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        if path is None:
+            path = edwh_cache_dir() / "build-digests.v2.json"
+            # the previous version had plain hashes of the build args
+            (path.parent / "build-digests.json").unlink(missing_ok=True)
+        self.path = path
+        try:
+            self.digests: dict[str, AnyDict] = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.digests = {}
+
+    def get(self, tag: str) -> ContextDigest | None:
+        if not isinstance(entry := self.digests.get(tag), dict):
+            return None
+        return ContextDigest(entry.get("digest", ""), entry.get("parts", {}))
+
+    def changed(self, tag: str, current: ContextDigest | None) -> bool:
+        """
+        Unknown contexts (None) never count as changed; images edwh never built always do.
+        """
+        previous = self.get(tag)
+        return current is not None and (previous is None or previous.digest != current.digest)
+
+    def why(self, tag: str, current: ContextDigest | None) -> list[str]:
+        if current is None:
+            return []
+        elif (previous := self.get(tag)) is None:
+            return ["never built by edwh"]
+        return explain_changes(previous.parts, current.parts)
+
+    def record(self, digests: t.Mapping[str, ContextDigest | None]) -> None:
+        updates = {
+            tag: {"digest": current.digest, "parts": current.parts}
+            for tag, current in digests.items()
+            if current and self.changed(tag, current)
+        }
+        if updates:
+            self.digests |= updates
+            atomic_write_text(self.path, json.dumps(self.digests))
+
+
+@dataclass
+class BuildCheck:
+    service: str
+    image_tag: str
+    current: ContextDigest | None
+    reasons: list[str]
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.reasons)
+
+
+def check_builds(
+    config: AnyDict,
+    services: t.Collection[str] | None = None,
+    image_exists: t.Callable[[str], bool] | None = None,
+) -> list[BuildCheck]:
+    """
+    For every (selected) service with a build section, whether its context changed since edwh last built it.
+
+    `config` is the output of `docker compose config` (see `dc_config`).
+    `image_exists(tag)` is asked for the images that are otherwise up to date, since they may have been removed since.
+    """
+    project = config.get("name", "")
+    digests = BuildDigests()
+
+    checks = []
+    for name, service in sorted(config.get("services", {}).items()):
+        if not service.get("build") or (services is not None and name not in services):
+            continue
+
+        tag = build_image_tag(project, name, service)
+        current = context_digest(service)
+        if current is None:
+            # remote context: can't tell, so let docker decide
+            reasons = ["context is not a local directory"]
+        elif digests.changed(tag, current):
+            reasons = digests.why(tag, current)
+        elif image_exists and not image_exists(tag):
+            reasons = [f"image {tag} doesn't exist (anymore)"]
+        else:
+            reasons = []
+
+        checks.append(BuildCheck(name, tag, current, reasons))
+
+    return checks
@@ -13,6 +13,10 @@ from .__about__ import __version__
 class EddieApp(ewok.App):
     # = fabric.Fab = invoke.Program
 
+    _terminal_fixed = False
+    # everything after ` -- `, for tasks that run another edwh command (`edwh each`)
+    remainder = ""
+
     def _fix_invoke_terminal_corruption(self) -> None:
         """
         Restore TTY settings after Invoke commands using pty=True.
@@ -47,9 +51,21 @@ class EddieApp(ewok.App):
 
     def run(self, argv: list[str] | None = None, exit: bool = True) -> None:  # noqa: A002
         """Run the application with terminal‑safety fixes enabled."""
-        self._fix_invoke_terminal_corruption()
+        if not self._terminal_fixed:
+            # `edwh batch` runs the app again in the same process, install the handlers only once
+            self._fix_invoke_terminal_corruption()
+            self._terminal_fixed = True
         return super().run(argv=argv, exit=exit)
 
+    def execute(self) -> None:
+        """
+        Keep ` -- <command>` for `edwh each` instead of letting fabric run it on (no) hosts.
+        """
+        self.remainder = ""
+        if self.core.remainder and not self.args.hosts.value and any(_.name == "each" for _ in self.tasks):
+            self.remainder, self.core.remainder = self.core.remainder, ""
+        return super().execute()
+
     def run_fmt(self, argv: list[str] | None = None, exit: bool = True):  # noqa: A002
         """
         Process arguments for the fmt command with special handling:
@@ -0,0 +1,43 @@
+"""
+A project's .toml config as last validated (every [services] key present), kept between runs.
+
+The entry is only used while the .toml's stat (size, mtime, inode) is unchanged,
+so any edit (by hand or by `edwh setup`) means it is read and checked again.
+"""
+
+import hashlib
+import json
+import typing as t
+from pathlib import Path
+
+from .hashing import StatKey, stat_key
+from .helpers import AnyDict, atomic_write_text, edwh_cache_dir
+
+
+class TomlConfigCache:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    @classmethod
+    def for_file(cls, toml_path: Path) -> "TomlConfigCache":
+        file_id = hashlib.sha256(str(toml_path.resolve()).encode()).hexdigest()[:16]
+        return cls(edwh_cache_dir("toml") / f"{file_id}.json")
+
+    def lookup(self, toml_path: Path) -> AnyDict | None:
+        try:
+            raw = json.loads(self.path.read_text())
+            if tuple(raw["stamp"]) == stat_key(toml_path):
+                return t.cast(AnyDict, raw["config"])
+        except (OSError, ValueError, TypeError, KeyError):
+            # missing or corrupt cache (or no .toml): it will simply be read again
+            pass
+        return None
+
+    def store(self, toml_path: Path, config: t.Mapping[str, t.Any]) -> None:
+        try:
+            stamp: StatKey = stat_key(toml_path)
+            data = json.dumps({"stamp": stamp, "config": config})
+        except (OSError, TypeError):
+            # gone in the meantime, or values JSON can't hold (e.g. toml datetimes): just don't cache
+            return
+        atomic_write_text(self.path, data)
@@ -1,16 +1,23 @@
+import copy
 import json
-import re
 import sys
 import typing as t
+from concurrent import futures
 from contextlib import contextmanager
 from pathlib import Path
 from typing import TypedDict
 
 import humanize
+import tabulate
 from ewok import Context
+from fabric import Connection
 from termcolor import colored, cprint
 
+from .disk_usage import disk_usage
+from .envstore import env_store
 from .helpers import AnyDict, dc_config, dump_set_as_list, noop
+from .inventory import Inventory, Output, Stamp, project_stamp
+from .traefik import DomainIndex, RouterDict, service_routers
 
 
 def indent(text: str, prefix: str = "  ") -> str:
@@ -46,19 +53,16 @@ def terminal_link(url: str, text: str | None = None) -> str:
     return escape_mask.format(url, text)
 
 
-HOST_RE = re.compile(r"`(.*?)`")
-
-
-def strip_host(s: str) -> str:
-    matches: list[str] = HOST_RE.findall(s.strip())
-    return matches[0]
+DEFAULT_DISCOVER_JOBS = 8
 
 
 class ServiceDict(TypedDict, total=False):
     name: str
+    image: str
     exposes: list[int]
     ports: list[str]
     domains: set[str]
+    routers: dict[str, RouterDict]
 
 
 class ProjectDict(TypedDict, total=False):
@@ -66,6 +70,7 @@ class ProjectDict(TypedDict, total=False):
     hostingdomain: str
     disk_usage_human: str
     disk_usage_raw: int
+    disk_usage_largest: list[tuple[str, int]]
     settings: AnyDict
     services: list[ServiceDict]
 
@@ -76,27 +81,28 @@ class DataDict(TypedDict):
 
 
 def get_hosts_for_service(docker_service: AnyDict) -> set[str]:
-    domains = set()
-
-    for label, value in docker_service.get("labels", {}).items():
-        if "Host" not in value:
-            # irrelevant
-            continue
+    """
+    Every host (and HostRegexp pattern) in the traefik rules of a compose service.
+    """
+    return {
+        host for router in service_routers(docker_service).values() for host in [*router["hosts"], *router["regexps"]]
+    }
 
-        if "||" in value:
-            # OR
-            for host in value.split("||"):
-                domains.add(strip_host(host))
-        else:
-            # only one
-            domains.add(strip_host(value))
 
-    return domains
+def project_context(ctx: Context) -> Context:
+    """
+    A copy of `ctx` with its own `cd()` stack, so threads can each `cd` into their own project.
+    """
+    clone = copy.copy(ctx)
+    clone._set(command_cwds=list(ctx.command_cwds))
+    return clone
 
 
 class Discover:
     i: str
     data: DataDict
+    # (message, cprint kwargs) for a project discovered on a worker thread, printed in order afterwards
+    output: Output | None = None
 
     def __init__(
         self,
@@ -108,17 +114,30 @@ class Discover:
         short: bool = False,
         settings: bool = False,
         as_json: bool = False,
+        jobs: int = DEFAULT_DISCOVER_JOBS,
+        du_top: int = 0,
+        du_cache: bool = False,
+        cached: bool = False,
+        refresh: bool = False,
+        ndjson: bool = False,
     ):
         self.ctx = ctx
         self.du = du
+        self.du_top = du_top
+        self.du_cache = du_cache
+        self.cached = cached
+        self.refresh = refresh
+        self.ndjson = ndjson
         self.exposes = exposes
         self.ports = ports
         self.host_labels = host_labels
         self.short = short
         self.settings = settings
-        self.as_json = as_json
+        # ndjson records have the same content as --json
+        self.as_json = as_json or ndjson
+        self.jobs = jobs
 
-        print_fn = noop if as_json else cprint
+        print_fn = noop if self.as_json else cprint
 
         self.print_fn = t.cast(t.Callable[..., None], print_fn)
         self.reset()
@@ -142,9 +161,45 @@ class Discover:
     def print(self, *args: t.Any, **kwargs: t.Any) -> None:
         sep = kwargs.pop("sep", " ")
         msg = sep.join([self.i, *args])
-        self.print_fn(msg, **kwargs)
+        if self.output is None:
+            self.print_fn(msg, **kwargs)
+        else:
+            self.output.append((msg, kwargs))
+
+    @property
+    def is_local(self) -> bool:
+        """
+        Discovering this machine (files can be read directly) instead of a remote host (`-H`)?
+        """
+        return not isinstance(self.ctx, Connection)
+
+    def read_project_dotenv(self) -> dict[str, str] | None:
+        """
+        The current project's .env, read in-process (and cached per path) when discovering this machine.
+
+        None for remote hosts (`-H`), where the file can't be read directly.
+        """
+        if not self.is_local:
+            return None
+
+        # only the project's own .env, not one in a parent folder like read_dotenv would
+        return env_store.load(Path(self.ctx.cwd or ".") / ".env")
+
+    def read_project_settings(self) -> dict[str, str] | None:
+        """
+        The .env `edwh settings` shows for the current project (which can be in a parent folder),
+        read in-process when discovering this machine. None for remote hosts (`-H`).
+        """
+        if not self.is_local:
+            return None
+
+        found = env_store.locate(cwd=Path(self.ctx.cwd or "."))
+        return env_store.load(found) if found else {}
 
     def get_hostingdomain_from_env(self) -> str:
+        if (env := self.read_project_dotenv()) is not None:
+            return env.get("HOSTINGDOMAIN", "")
+
         if ran := self.ctx.run("cat .env | grep HOSTINGDOMAIN", echo=False, hide=True, warn=True):
             hosting_domain = ran.stdout.strip()
         else:
@@ -170,19 +225,35 @@ class Discover:
         else:
             return ""
 
-    def get_disk_usage(self) -> tuple[str, int]:
-        if ran := self.ctx.run("du -sh . --block-size=1", echo=False, hide=True):
-            usage_raw = ran.stdout.strip().split("\t")[0]
-            usage = humanize.naturalsize(usage_raw, binary=True)
-            self.print(f"Disk usage: {usage}", color="red", attrs=["bold"])
-
-            return usage, int(usage_raw)
+    def get_disk_usage(self) -> tuple[str, int, list[tuple[str, int]]]:
+        """
+        Disk usage of the current project, and its largest subdirectories (with --du-top).
+        """
+        largest: list[tuple[str, int]] = []
+        if self.is_local:
+            usage_data = disk_usage(Path(self.ctx.cwd or "."), top=self.du_top, cached=self.du_cache)
+            usage_raw, largest = usage_data.total, usage_data.largest
+        elif ran := self.ctx.run("du -sh . --block-size=1", echo=False, hide=True):
+            usage_raw = int(ran.stdout.strip().split("\t")[0])
         else:
             raise EnvironmentError("Failed running `du`")
 
+        usage = humanize.naturalsize(usage_raw, binary=True)
+        self.print(f"Disk usage: {usage}", color="red", attrs=["bold"])
+        with self.indent():
+            for folder, size in largest:
+                self.print(f"{humanize.naturalsize(size, binary=True):>10}  {folder}")
+
+        return usage, usage_raw, largest
+
     def get_settings(self, folder: str) -> AnyDict | None:
         json_flag = "--json" if self.as_json else ""
-        if ran := self.ctx.run(f"~/.local/bin/edwh settings {json_flag}", echo=False, hide=True):
+        if (env := self.read_project_settings()) is not None:
+            # same output as `edwh settings`, without starting edwh for every project
+            if self.as_json:
+                return dict(env)
+            settings_output = tabulate.tabulate(env.items(), headers=["Setting", "Value"])
+        elif ran := self.ctx.run(f"~/.local/bin/edwh settings {json_flag}", echo=False, hide=True):
             settings_output = ran.stdout.strip()
         else:
             settings_output = ""
@@ -201,6 +272,8 @@ class Discover:
 
     def process_docker_service(self, name: str, docker_service: AnyDict, hosting_domain: str) -> ServiceDict:
         service: ServiceDict = {"name": name}
+        if image := docker_service.get("image"):
+            service["image"] = image
         if not self.short:
             self.print(name, color="green")
         with self.indent():
@@ -219,6 +292,7 @@ class Discover:
 
             service["domains"] = set()
             if self.host_labels and not self.short:
+                service["routers"] = service_routers(docker_service)
                 service["domains"] = get_hosts_for_service(docker_service)
                 for domain in service["domains"]:
                     self.print(
@@ -250,9 +324,11 @@ class Discover:
                 return None
 
             if self.du and not self.short:
-                usage, usage_raw = self.get_disk_usage()
+                usage, usage_raw, largest = self.get_disk_usage()
                 project["disk_usage_human"] = usage
                 project["disk_usage_raw"] = usage_raw
+                if self.du_top:
+                    project["disk_usage_largest"] = largest
 
             if self.settings and (settings := self.get_settings(folder)) and not self.short:
                 project["settings"] = settings
@@ -265,24 +341,116 @@ class Discover:
 
         return project
 
-    def process_compose_file(self, compose_file_path: Path) -> None:
-        folder = compose_file_path.parent
-        with self.ctx.cd(folder):
-            if project := self.process_omgeving(str(folder)):
-                self.data["projects"].append(project)
+    def process_compose_file(self, compose_file_path: Path) -> tuple[ProjectDict | None, Output]:
+        return self.process_folder(compose_file_path.parent)
 
-    def discover(self) -> None:
+    def process_folder(self, folder: Path) -> tuple[ProjectDict | None, Output]:
+        """
+        Discover one project on a copy of this Discover (own context and output), so it can run on any thread.
+        """
+        worker = copy.copy(self)
+        worker.ctx = project_context(self.ctx)
+        worker.i = ""
+        worker.output = []
+
+        try:
+            with worker.ctx.cd(folder):
+                project = worker.process_omgeving(str(folder))
+        except Exception as e:
+            # one broken project should not hide the others
+            project = None
+            if self.as_json:
+                print(f"Error discovering {self.data['server']}/{folder}: {e}", file=sys.stderr)
+            else:
+                worker.print(f"Error discovering {folder}: {e}", color="red")
+
+        return project, worker.output
+
+    @property
+    def options(self) -> str:
+        """
+        The options that change what is found per project: inventory entries are only reused for the same ones.
+
+        How the result is shown (--json, --ndjson, find-domain) doesn't matter,
+        except for the settings, which are either part of the project (json) or of its output.
+        """
+        settings = ("json" if self.as_json else "text") if self.settings else None
+        return json.dumps([self.du, self.du_top, self.exposes, self.ports, self.host_labels, self.short, settings])
+
+    def discover_project(
+        self, folder: str, inventory: Inventory | None
+    ) -> tuple[ProjectDict | None, Output, Stamp | None]:
+        """
+        Like process_folder, but reuse the inventory entry of a project that didn't change (--refresh),
+        or of any project that was discovered with the same options before (--cached).
+
+        Also returns the project's stamp when it was scanned, for the inventory.
+        """
+        if inventory is None:
+            return *self.process_folder(Path(folder)), None
+
+        stamp = project_stamp(Path(self.ctx.cwd or ".") / folder)
+        if (self.refresh or self.cached) and (
+            entry := inventory.lookup(folder, None if self.cached else stamp, self.options)
+        ):
+            return t.cast(ProjectDict, entry["project"]), entry["output"], None
+        return *self.process_folder(Path(folder)), stamp
+
+    def scan(self) -> DataDict:
         self.reset()
 
         self.print(self.data["server"], attrs=["bold"])
 
-        compose_file_paths = self.find_compose_files()
+        # the inventory is kept for this machine only, remote hosts are always scanned
+        inventory = Inventory.for_directory(Path(self.ctx.cwd or ".")) if self.is_local else None
 
-        for compose_file in compose_file_paths:
-            self.process_compose_file(Path(compose_file))
+        if self.cached and inventory and inventory.exists:
+            # don't even look for projects
+            folders = list(inventory.entries)
+        else:
+            folders = [str(Path(_).parent) for _ in self.find_compose_files() if _]
+
+        with futures.ThreadPoolExecutor(max_workers=max(1, min(self.jobs, len(folders)))) as executor:
+            results: t.Iterable[tuple[str, tuple[ProjectDict | None, Output, Stamp | None]]]
+            if self.ndjson:
+                # every record is written as soon as its project is done, whatever the order
+                pending = {executor.submit(self.discover_project, folder, inventory): folder for folder in folders}
+                results = ((pending[future], future.result()) for future in futures.as_completed(pending))
+            else:
+                # map yields in order: every project is printed as soon as it and the ones before it are done
+                results = zip(folders, executor.map(lambda folder: self.discover_project(folder, inventory), folders))
+
+            for folder, (project, output, stamp) in results:
+                for msg, kwargs in output:
+                    self.print_fn(msg, **kwargs)
+                if project and self.ndjson:
+                    record = {"server": self.data["server"], **project}
+                    print(json.dumps(record, default=dump_set_as_list), flush=True)
+                elif project:
+                    self.data["projects"].append(project)
+                if inventory and project and stamp is not None:
+                    inventory.store(folder, stamp, self.options, dict(project), output)
+
+        if inventory:
+            inventory.save(self.data["server"], folders)
+
+        return self.data
+
+    def print_duplicate_domains(self) -> None:
+        duplicates = DomainIndex.from_projects(t.cast(list[AnyDict], self.data["projects"])).duplicates()
+        for domain, routes in sorted(duplicates.items()):
+            claimed_by = ", ".join(f"{route.project}/{route.service}" for route in routes)
+            self.print(f"{domain} is claimed by more than one project: {claimed_by}", color="yellow")
 
-        if self.as_json:
+    def discover(self) -> None:
+        self.scan()
+
+        if self.ndjson:
+            return
+        elif self.as_json:
             print(json.dumps({"data": self.data}, indent=2, default=dump_set_as_list))
+        elif self.host_labels and not self.short:
+            self.print_duplicate_domains()
 
 
 def discover(
@@ -294,6 +462,12 @@ def discover(
     short: bool = False,
     settings: bool = False,
     as_json: bool = False,
+    jobs: int = DEFAULT_DISCOVER_JOBS,
+    du_top: int = 0,
+    du_cache: bool = False,
+    cached: bool = False,
+    refresh: bool = False,
+    ndjson: bool = False,
 ) -> None:
     d = Discover(
         ctx,
@@ -304,6 +478,35 @@ def discover(
         short=short,
         settings=settings,
         as_json=as_json,
+        jobs=jobs,
+        du_top=du_top,
+        du_cache=du_cache,
+        cached=cached,
+        refresh=refresh,
+        ndjson=ndjson,
     )
 
     return d.discover()
+
+
+def find_domain(ctx: Context, domain: str, jobs: int = DEFAULT_DISCOVER_JOBS, as_json: bool = False) -> bool:
+    """
+    Which project, service and traefik router serve `domain`?
+
+    Uses the discover inventory, so only projects that changed since the previous run are scanned.
+    """
+    data = Discover(ctx, as_json=True, refresh=True, jobs=jobs).scan()
+    routes = DomainIndex.from_projects(t.cast(list[AnyDict], data["projects"])).find(domain)
+
+    if as_json:
+        print(json.dumps([route.__dict__ for route in routes], indent=2))
+    elif routes:
+        print(
+            tabulate.tabulate(
+                [(route.domain, route.project, route.service, route.router) for route in routes],
+                headers=["Domain", "Project", "Service", "Router"],
+            )
+        )
+    else:
+        cprint(f"No project on {data['server']} serves {domain}", color="red")
+    return bool(routes)
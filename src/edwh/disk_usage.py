@@ -0,0 +1,215 @@
+"""
+Disk usage of a project directory, like `du -s --block-size=1` but in-process.
+
+- hardlinked files are counted once (by device and inode);
+- other filesystems (mounted volumes) are not entered;
+- the top level subdirectories are walked in parallel;
+- optionally, what was found directly inside each directory is remembered by the directory's mtime,
+  so directories that didn't get entries added, removed or renamed are not listed again.
+  Files that grow in place (logs, databases) don't change their directory's mtime,
+  so a cached total can lag behind until something is added or removed next to them.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import typing as t
+from concurrent import futures
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .helpers import atomic_write_text, edwh_cache_dir
+
+DEFAULT_DU_JOBS = 4
+DEFAULT_DU_DEPTH = 4
+
+# st_blocks is always in 512 byte units, whatever the filesystem's block size
+BLOCK_SIZE = 512
+
+type HardLink = tuple[int, int, int]  # st_dev, st_ino, bytes
+
+
+@dataclass
+class DirectoryListing:
+    """
+    What is directly inside one directory.
+    """
+
+    mtime_ns: int
+    own: int  # bytes of the directory itself and its (not hardlinked) files
+    links: list[HardLink] = field(default_factory=list)
+    subdirs: list[str] = field(default_factory=list)
+
+
+class DiskUsageCache:
+    """
+    DirectoryListing per directory (relative to the project), valid as long as the directory's mtime is unchanged.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, DirectoryListing] = {}
+        self.seen: set[str] = set()
+        self.dirty = False
+        self._lock = threading.Lock()
+
+        try:
+            raw = json.loads(path.read_text())
+            self.entries = {
+                name: DirectoryListing(mtime_ns, own, [t.cast(HardLink, tuple(_)) for _ in links], subdirs)
+                for name, (mtime_ns, own, links, subdirs) in raw.items()
+            }
+        except (OSError, ValueError, TypeError):
+            # missing or corrupt cache: everything will simply be scanned
+            self.entries = {}
+
+    @classmethod
+    def for_directory(cls, directory: Path) -> "DiskUsageCache":
+        directory_id = hashlib.sha256(str(directory.resolve()).encode()).hexdigest()[:16]
+        return cls(edwh_cache_dir("du") / f"{directory_id}.json")
+
+    def lookup(self, name: str, mtime_ns: int) -> DirectoryListing | None:
+        with self._lock:
+            self.seen.add(name)
+            if (listing := self.entries.get(name)) and listing.mtime_ns == mtime_ns:
+                return listing
+            return None
+
+    def store(self, name: str, listing: DirectoryListing) -> None:
+        with self._lock:
+            self.seen.add(name)
+            self.entries[name] = listing
+            self.dirty = True
+
+    def save(self) -> None:
+        """
+        Write the cache if anything changed, forgetting directories that weren't seen this run.
+        """
+        if stale := set(self.entries) - self.seen:
+            for name in stale:
+                del self.entries[name]
+            self.dirty = True
+
+        if not self.dirty:
+            return
+
+        raw = {
+            name: (listing.mtime_ns, listing.own, listing.links, listing.subdirs)
+            for name, listing in self.entries.items()
+        }
+        atomic_write_text(self.path, json.dumps(raw))
+        self.dirty = False
+
+
+def list_directory(path: Path, device: int, stat: os.stat_result) -> DirectoryListing:
+    listing = DirectoryListing(stat.st_mtime_ns, stat.st_blocks * BLOCK_SIZE)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                entry_stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                # removed while scanning, or no permission: du would skip it too
+                continue
+
+            if entry.is_dir(follow_symlinks=False):
+                if entry_stat.st_dev == device:
+                    listing.subdirs.append(entry.name)
+            elif entry_stat.st_nlink > 1:
+                listing.links.append((entry_stat.st_dev, entry_stat.st_ino, entry_stat.st_blocks * BLOCK_SIZE))
+            else:
+                listing.own += entry_stat.st_blocks * BLOCK_SIZE
+    return listing
+
+
+@dataclass
+class DiskUsage:
+    total: int
+    # (path relative to the project, bytes) of the largest directories, biggest first
+    largest: list[tuple[str, int]] = field(default_factory=list)
+
+
+class DiskUsageScan:
+    def __init__(self, root: Path, cache: DiskUsageCache | None = None, depth: int = DEFAULT_DU_DEPTH) -> None:
+        self.root = root
+        self.cache = cache
+        self.depth = depth
+        self.device = root.stat().st_dev
+        self.sizes: dict[str, int] = {}  # per directory up to `depth`, for `largest`
+        self._seen_links: set[tuple[int, int]] = set()
+        self._lock = threading.Lock()
+
+    def listing(self, path: Path, name: str) -> DirectoryListing | None:
+        try:
+            stat = path.stat(follow_symlinks=False)
+            if stat.st_dev != self.device:
+                return None  # a mount point
+            if self.cache and (cached := self.cache.lookup(name, stat.st_mtime_ns)):
+                return cached
+            listing = list_directory(path, self.device, stat)
+        except OSError:
+            return None
+
+        if self.cache:
+            self.cache.store(name, listing)
+        return listing
+
+    def walk(self, path: Path, name: str, level: int = 0) -> int:
+        if not (listing := self.listing(path, name)):
+            return 0
+
+        total = listing.own
+        with self._lock:
+            for device, inode, size in listing.links:
+                if (device, inode) not in self._seen_links:
+                    self._seen_links.add((device, inode))
+                    total += size
+
+        total += sum(self.walk(path / sub, f"{name}/{sub}".removeprefix("./"), level + 1) for sub in listing.subdirs)
+
+        if 0 < level <= self.depth:
+            with self._lock:
+                self.sizes[name] = total
+        return total
+
+    def run(self, jobs: int = DEFAULT_DU_JOBS) -> int:
+        """
+        Walk the root itself here and its subdirectories (each with everything below it) on `jobs` threads.
+        """
+        if not (listing := self.listing(self.root, ".")):
+            return 0
+
+        root_only = DirectoryListing(listing.mtime_ns, listing.own, listing.links)
+        total = self.walk_listing(root_only)
+        with futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            total += sum(executor.map(lambda sub: self.walk(self.root / sub, sub, 1), listing.subdirs))
+        return total
+
+    def walk_listing(self, listing: DirectoryListing) -> int:
+        total = listing.own
+        with self._lock:
+            for device, inode, size in listing.links:
+                if (device, inode) not in self._seen_links:
+                    self._seen_links.add((device, inode))
+                    total += size
+        return total
+
+
+def disk_usage(
+    root: Path,
+    jobs: int = DEFAULT_DU_JOBS,
+    top: int = 0,
+    cached: bool = False,
+    depth: int = DEFAULT_DU_DEPTH,
+) -> DiskUsage:
+    """
+    Bytes used by `root` (and its `top` largest subdirectories, up to `depth` levels deep).
+    """
+    cache = DiskUsageCache.for_directory(root) if cached else None
+    scan = DiskUsageScan(root, cache, depth)
+    total = scan.run(jobs)
+    if cache:
+        cache.save()
+
+    largest = sorted(scan.sizes.items(), key=lambda item: (-item[1], item[0]))[:top]
+    return DiskUsage(total, largest)
@@ -0,0 +1,155 @@
+"""
+`edwh each`: run the same edwh command in many compose projects at once.
+
+Every project gets its own `edwh` process (so `cd`, .env and config.toml are its own),
+a few at a time, with their output interleaved line by line behind a coloured project prefix.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+import typing as t
+from concurrent import futures
+from dataclasses import dataclass
+from pathlib import Path
+
+import tabulate
+from termcolor import colored
+from termcolor._types import Color
+
+# the files `Discover.find_compose_files` looks for
+COMPOSE_FILES = ("docker-compose.yml", "docker-compose.yaml")
+
+PREFIX_COLORS: tuple[Color, ...] = (
+    "cyan",
+    "magenta",
+    "yellow",
+    "green",
+    "blue",
+    "light_cyan",
+    "light_magenta",
+    "light_yellow",
+    "light_green",
+    "light_blue",
+)
+
+DEFAULT_EACH_JOBS = 4
+
+
+def expand_glob(pattern: str) -> list[Path]:
+    """
+    Like shell globbing: relative (`../*`), absolute (`/srv/*`) and home (`~/projects/*`) patterns all work.
+    """
+    path = Path(pattern).expanduser()
+    if path.is_absolute():
+        return sorted(Path(path.anchor).glob(str(path.relative_to(path.anchor))))
+    return sorted(Path().glob(pattern))
+
+
+def find_projects(pattern: str = "*") -> list[Path]:
+    """
+    Directories matching `pattern` that contain a docker-compose file.
+    """
+    projects: dict[Path, Path] = {}
+    for path in expand_glob(pattern):
+        if path.is_dir() and any((path / name).is_file() for name in COMPOSE_FILES):
+            projects.setdefault(path.resolve(), path)
+    return list(projects.values())
+
+
+@dataclass
+class ProjectRun:
+    project: Path
+    exit_code: int
+    seconds: float
+    last_line: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+
+def project_labels(projects: t.Sequence[Path]) -> dict[Path, str]:
+    """
+    Short unique label per project: its directory name, or the path as given when names clash.
+    """
+    names = [project.name or str(project) for project in projects]
+    labels = [name if names.count(name) == 1 else str(project) for name, project in zip(names, projects)]
+    width = max((len(label) for label in labels), default=0)
+    return {
+        project: colored(f"{label:<{width}} |", PREFIX_COLORS[idx % len(PREFIX_COLORS)])
+        for idx, (project, label) in enumerate(zip(projects, labels))
+    }
+
+
+def run_in_project(
+    project: Path,
+    command: t.Sequence[str],
+    prefix: str,
+    lock: threading.Lock,
+    env: dict[str, str],
+) -> ProjectRun:
+    started = time.monotonic()
+    last_line = ""
+    try:
+        with subprocess.Popen(
+            command,
+            cwd=project,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            env=env,
+        ) as process:
+            for line in t.cast(t.IO[str], process.stdout):
+                if line := line.rstrip("\n"):
+                    last_line = line
+                with lock:
+                    print(prefix, line, flush=True)
+            exit_code = process.wait()
+    except OSError as e:
+        exit_code, last_line = 127, str(e)
+
+    return ProjectRun(project, exit_code, time.monotonic() - started, last_line)
+
+
+def run_each(
+    projects: t.Sequence[Path],
+    argv: t.Sequence[str],
+    jobs: int = DEFAULT_EACH_JOBS,
+    executable: t.Sequence[str] = (sys.executable, "-m", "edwh"),
+) -> list[ProjectRun]:
+    """
+    Run `<executable> <argv>` in every project, at most `jobs` at the same time.
+
+    The children can't share a terminal to ask questions, so they run non-interactive (defaults are used).
+    """
+    if not projects:
+        return []
+
+    lock = threading.Lock()
+    labels = project_labels(projects)
+    env = os.environ | {"EDWH_NON_INTERACTIVE": "1"}
+
+    with futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(projects)))) as executor:
+        pending = [
+            executor.submit(run_in_project, project, [*executable, *argv], labels[project], lock, env)
+            for project in projects
+        ]
+        return [future.result() for future in pending]
+
+
+def print_each_summary(runs: t.Iterable[ProjectRun]) -> None:
+    rows = [
+        (
+            str(run.project),
+            colored(str(run.exit_code), "green" if run.ok else "red"),
+            f"{run.seconds:.1f}s",
+            "" if run.ok else run.last_line,
+        )
+        for run in runs
+    ]
+    print(tabulate.tabulate(rows, headers=["Project", "Exit", "Time", "Last output"]))
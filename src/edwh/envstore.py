@@ -0,0 +1,174 @@
+"""
+Parsed .env files, shared by everything in this process and never stale.
+
+Every file is kept by resolved path together with its stat (size, mtime, inode): a lookup is one
+`stat()` and a dict hit, and a file that changed on disk is simply parsed again.
+edwh's own writes (set_env_value, check_env) update the store right away.
+
+`index(directory)` answers "which value does every neighbour project use for KEY" from one pass over
+`<directory>/*/.env`, kept until one of those files changes (or one is added or removed).
+"""
+
+import threading
+import typing as t
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+
+from dotenv import dotenv_values
+
+from .constants import DEFAULT_DOTENV_PATH
+from .hashing import StatKey, stat_key
+from .settings_search import SettingsSearch
+
+
+@dataclass(frozen=True)
+class EnvIndex:
+    """
+    KEY -> {project: value} for the .env files directly below one directory (project = the .env's folder name).
+    """
+
+    stamp: tuple[tuple[Path, StatKey], ...]
+    projects: tuple[str, ...]
+    keys: dict[str, dict[str, str]]
+
+    def lookup(self, key: str) -> dict[str, str | None]:
+        """
+        The value of `key` in every project, None where it isn't set.
+        """
+        values = self.keys.get(key.upper(), {})
+        return {project: values.get(project) for project in self.projects}
+
+    @cached_property
+    def rows(self) -> list[tuple[str, str, str]]:
+        """
+        (project, key, value) for every setting, by key.
+        """
+        return [(project, key, value) for key, values in sorted(self.keys.items()) for project, value in values.items()]
+
+    @cached_property
+    def search(self) -> SettingsSearch:
+        # built once per version of the .env files, for `settings --all-projects --find`
+        return SettingsSearch((key, value) for _, key, value in self.rows)
+
+
+class EnvStore:
+    def __init__(self) -> None:
+        self.files: dict[Path, tuple[StatKey, dict[str, str]]] = {}
+        # (working directory, requested path) -> the .env that read_dotenv ends up using
+        self.located: dict[tuple[Path, Path], Path | None] = {}
+        self.indexes: dict[Path, EnvIndex] = {}
+        self._lock = threading.Lock()
+
+    def load(self, path: Path) -> dict[str, str]:
+        """
+        The key/value pairs in `path` ({} if it doesn't exist). Callers get their own copy.
+        """
+        path = path.resolve()
+        try:
+            key = stat_key(path)
+        except OSError:
+            return {}
+
+        with self._lock:
+            if (entry := self.files.get(path)) and entry[0] == key:
+                return dict(entry[1])
+
+        values = t.cast(dict[str, str], dict(dotenv_values(path)))
+        with self._lock:
+            self.files[path] = (key, values)
+        return dict(values)
+
+    def locate(self, env_path: Path = DEFAULT_DOTENV_PATH, cwd: Path | None = None) -> Path | None:
+        """
+        `env_path` itself if it has content; for a plain `.env` otherwise the first non-empty one
+        in a parent directory, stopping at the directory of a (parent) project's docker-compose file.
+
+        Relative paths are looked up from `cwd` (defaults to the current directory).
+        """
+        if cwd is not None:
+            env_path = cwd / env_path
+        if exists_nonempty(env_path):
+            return env_path
+        elif env_path.name != DEFAULT_DOTENV_PATH.name:
+            return None
+
+        cwd = cwd.resolve() if cwd is not None else Path.cwd()
+        with self._lock:
+            if (cwd, env_path) in self.located:
+                found = self.located[(cwd, env_path)]
+                if found is None or exists_nonempty(found):
+                    return found
+
+        found = None
+        current_dir = cwd
+        while current_dir != current_dir.parent:  # Stop at filesystem root
+            if exists_nonempty(potential_env := current_dir / DEFAULT_DOTENV_PATH.name):
+                found = potential_env
+                break
+
+            # Check if we've reached a project root (docker-compose file exists)
+            if any(current_dir.glob("docker-compose.*")) and current_dir != cwd:
+                break
+
+            current_dir = current_dir.parent
+
+        with self._lock:
+            self.located[(cwd, env_path)] = found
+        return found
+
+    def index(self, directory: Path) -> EnvIndex:
+        """
+        EnvIndex over `directory/*/.env`: one glob and a stat per file when nothing changed.
+        """
+        directory = directory.resolve()
+        stamp: list[tuple[Path, StatKey]] = []
+        for env_path in sorted(directory.glob(f"*/{DEFAULT_DOTENV_PATH.name}")):
+            try:
+                stamp.append((env_path, stat_key(env_path)))
+            except OSError:
+                continue  # removed in the meantime, or a broken symlink
+
+        with self._lock:
+            if (index := self.indexes.get(directory)) and index.stamp == tuple(stamp):
+                return index
+
+        keys: dict[str, dict[str, str]] = defaultdict(dict)
+        for env_path, _ in stamp:
+            for key, value in self.load(env_path).items():
+                keys[key][env_path.parent.name] = value
+
+        index = EnvIndex(tuple(stamp), tuple(env_path.parent.name for env_path, _ in stamp), dict(keys))
+        with self._lock:
+            self.indexes[directory] = index
+        return index
+
+    def updated(self, path: Path) -> None:
+        """
+        Write-through after edwh changed `path` itself, so the next load is a plain dict hit again.
+        """
+        with self._lock:
+            # a new or emptied .env can change where the upward search ends
+            self.located.clear()
+            self.files.pop(path.resolve(), None)
+        self.load(path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.files.clear()
+            self.located.clear()
+            self.indexes.clear()
+
+
+def exists_nonempty(path: Path) -> bool:
+    """
+    Checks whether a given file path exists and is non-empty.
+    """
+    try:
+        return path.stat().st_size > 0
+    except OSError:
+        return False
+
+
+env_store = EnvStore()
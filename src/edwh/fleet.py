@@ -0,0 +1,277 @@
+"""
+`edwh fleet`: ask many hosts the same question (discover, health, ps) at once, over one SSH connection per host.
+
+Hosts come from an inventory file:
+
+    # inventory.toml
+    [hosts.web1]
+    host = "web1.example.com"
+    user = "deploy"
+
+    [hosts.db1]
+    host = "10.0.0.5"
+    port = 2222
+
+or simply `hosts = ["web1.example.com", "deploy@web2.example.com"]`.
+"""
+
+import json
+import re
+import threading
+import time
+import tomllib
+import typing as t
+from concurrent import futures
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import tabulate
+from ewok import Context
+from termcolor import colored
+
+from .constants import AnyDict
+from .health import HealthLevel, HealthStatus
+
+DEFAULT_FLEET_JOBS = 10
+DEFAULT_FLEET_TIMEOUT = 30
+
+ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+HEALTH_IN_STATUS_RE = re.compile(r"\((healthy|unhealthy|health: starting)\)")
+# where the next label starts in docker ps' comma separated Labels (values may contain commas themselves)
+LABEL_START_RE = re.compile(r"^[\w.\-/]+=")
+
+
+@dataclass
+class HostSpec:
+    name: str
+    host: str
+    user: str | None = None
+    port: int | None = None
+
+
+def _host_spec(name: str, value: str | AnyDict) -> HostSpec:
+    if isinstance(value, str):
+        user, _, host = value.rpartition("@")
+        return HostSpec(name, host, user or None)
+    return HostSpec(name, value.get("host", name), value.get("user"), value.get("port"))
+
+
+def load_inventory(hosts: str) -> list[HostSpec]:
+    """
+    Hosts from an inventory toml file, or from a comma separated list (`web1,deploy@web2`).
+    """
+    if not (path := Path(hosts).expanduser()).is_file():
+        return [_host_spec(host, host) for host in (_.strip() for _ in hosts.split(",")) if host]
+
+    inventory = tomllib.loads(path.read_text())
+    if isinstance(entries := inventory.get("hosts", []), dict):
+        return [_host_spec(name, value) for name, value in entries.items()]
+    return [_host_spec(host, host) for host in entries]
+
+
+class ConnectionPool:
+    """
+    One (lazily opened) SSH connection per host, shared by every command that runs on it.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: int = DEFAULT_FLEET_TIMEOUT,
+        factory: t.Callable[[HostSpec, int], Context] | None = None,
+    ) -> None:
+        self.connect_timeout = connect_timeout
+        self.factory = factory or self.connect
+        self.connections: dict[str, Context] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def connect(spec: HostSpec, connect_timeout: int) -> Context:
+        return Context(spec.host, user=spec.user, port=spec.port, connect_timeout=connect_timeout)
+
+    def get(self, spec: HostSpec) -> Context:
+        with self._lock:
+            if spec.name not in self.connections:
+                self.connections[spec.name] = self.factory(spec, self.connect_timeout)
+            return self.connections[spec.name]
+
+    def close(self) -> None:
+        with self._lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections.clear()
+
+    def __enter__(self) -> "ConnectionPool":
+        return self
+
+    def __exit__(self, *_: t.Any) -> None:
+        self.close()
+
+
+def parse_labels(labels: str) -> dict[str, str]:
+    """
+    "a=1,rule=Host(`x`, `y`)" to {"a": "1", "rule": "Host(`x`, `y`)"}: a part that doesn't start a new label
+    belongs to the value of the previous one.
+    """
+    parsed: dict[str, str] = {}
+    key = None
+    for part in labels.split(","):
+        if LABEL_START_RE.match(part):
+            key, _, value = part.partition("=")
+            parsed[key] = value
+        elif key is not None:
+            parsed[key] += f",{part}"
+    return parsed
+
+
+def parse_docker_ps(stdout: str) -> list[AnyDict]:
+    """
+    `docker ps -a --format '{{json .}}'` to [{host-independent container info}].
+    """
+    containers = []
+    for line in stdout.splitlines():
+        try:
+            info = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+
+        labels = parse_labels(info.get("Labels") or "")
+        status_text = info.get("Status", "")
+        state = info.get("State", "unknown")
+        if state == "exited" and "Exited (0)" in status_text:
+            state = "exited ok"
+        health = match.group(1).removeprefix("health: ") if (match := HEALTH_IN_STATUS_RE.search(status_text)) else None
+
+        containers.append(
+            {
+                "container": info.get("Names", ""),
+                "project": labels.get("com.docker.compose.project", ""),
+                "state": state,
+                "status": status_text,
+                "health": health,
+            }
+        )
+    return containers
+
+
+def parse_discover(stdout: str) -> AnyDict:
+    return t.cast(AnyDict, json.loads(stdout).get("data", {}))
+
+
+def container_health(container: AnyDict) -> HealthStatus:
+    return HealthStatus("", container["container"], container["state"], container["health"])
+
+
+@dataclass
+class FleetCommand:
+    command: str
+    parse: t.Callable[[str], t.Any]
+
+
+# health and ps look at every container on the host, not only one project, so they ask docker directly
+FLEET_COMMANDS: dict[str, FleetCommand] = {
+    "discover": FleetCommand("~/.local/bin/edwh discover --json", parse_discover),
+    "health": FleetCommand("docker ps -a --format '{{json .}}'", parse_docker_ps),
+    "ps": FleetCommand("docker ps -a --format '{{json .}}'", parse_docker_ps),
+}
+
+
+@dataclass
+class HostResult:
+    host: HostSpec
+    results: dict[str, t.Any] = field(default_factory=dict)
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def query_host(pool: ConnectionPool, spec: HostSpec, names: t.Sequence[str], timeout: int) -> HostResult:
+    """
+    Run the fleet commands `names` on one host; the first failure ends that host's run.
+    """
+    started = time.monotonic()
+    result = HostResult(spec)
+    outputs: dict[str, str] = {}  # health and ps share their docker call
+    try:
+        connection = pool.get(spec)
+        for name in names:
+            command = FLEET_COMMANDS[name]
+            if command.command not in outputs:
+                ran = connection.run(command.command, hide=True, warn=True, timeout=timeout)
+                if not ran.ok:
+                    raise EnvironmentError(ANSI_RE.sub("", ran.stderr or ran.stdout).strip() or f"exit {ran.exited}")
+                outputs[command.command] = ANSI_RE.sub("", ran.stdout)
+            result.results[name] = command.parse(outputs[command.command])
+    except Exception as e:
+        # unreachable hosts, auth failures and timeouts only fail this host
+        result.error = f"{type(e).__name__}: {e}".strip().rstrip(":")
+    result.seconds = time.monotonic() - started
+    return result
+
+
+def run_fleet(
+    pool: ConnectionPool,
+    hosts: t.Sequence[HostSpec],
+    names: t.Sequence[str],
+    jobs: int = DEFAULT_FLEET_JOBS,
+    timeout: int = DEFAULT_FLEET_TIMEOUT,
+) -> list[HostResult]:
+    if not hosts:
+        return []
+
+    with futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(hosts)))) as executor:
+        return list(executor.map(lambda spec: query_host(pool, spec, names, timeout), hosts))
+
+
+def fleet_as_json(results: t.Iterable[HostResult]) -> AnyDict:
+    return {
+        result.host.name: {"ok": result.ok, "error": result.error, "seconds": round(result.seconds, 2)} | result.results
+        for result in results
+    }
+
+
+def fleet_rows(name: str, result: HostResult, show_all: bool = False) -> list[tuple[str, ...]]:
+    host = result.host.name
+    match name:
+        case "discover":
+            return [
+                (host, project.get("name", ""), project.get("hostingdomain", ""), str(len(project.get("services", []))))
+                for project in result.results[name].get("projects", [])
+            ]
+        case "health":
+            statuses = [(container, container_health(container)) for container in result.results[name]]
+            return [
+                (host, container["project"], colored(container["container"], status.color), status.level.name.lower())
+                for container, status in sorted(statuses, key=lambda pair: pair[1].level)
+                # containers that finished successfully (e.g. migrate) are not a problem
+                if show_all or not (status.ok or status.level == HealthLevel.STOPPED)
+            ]
+        case _:
+            return [
+                (host, container["project"], container["container"], container["status"])
+                for container in result.results[name]
+            ]
+
+
+FLEET_HEADERS = {
+    "discover": ["Host", "Project", "Hosting domain", "Services"],
+    "health": ["Host", "Project", "Container", "Health"],
+    "ps": ["Host", "Project", "Container", "Status"],
+}
+
+
+def print_fleet(results: t.Sequence[HostResult], names: t.Sequence[str], show_all: bool = False) -> None:
+    for name in names:
+        rows = [row for result in results if result.ok for row in fleet_rows(name, result, show_all)]
+        print(colored(f"{name} ({sum(_.ok for _ in results)}/{len(results)} hosts)", attrs=["bold"]))
+        if rows:
+            print(tabulate.tabulate(rows, headers=FLEET_HEADERS[name]))
+        elif name == "health" and any(result.ok for result in results):
+            print(colored("Everything is healthy.", "green"))
+        print()
+
+    for result in results:
+        if not result.ok:
+            print(colored(f"{result.host.name}: {result.error} ({result.seconds:.1f}s)", "red"))
@@ -0,0 +1,140 @@
+"""
+Incremental file hashing: only files whose stat changed since the last run are read again.
+"""
+
+import hashlib
+import json
+import os
+import typing as t
+from concurrent import futures
+from pathlib import Path
+
+from .helpers import atomic_write_text, edwh_cache_dir
+
+# read files in 1 MiB chunks so big files don't have to fit in memory
+CHUNK_SIZE = 1024 * 1024
+
+# (size, mtime_ns, inode) - if any of these changed, the file has to be hashed again
+type StatKey = tuple[int, int, int]
+
+
+def stat_key(path: Path) -> StatKey:
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def hash_file(path: Path) -> str:
+    """
+    Streaming sha256 of a single file.
+    """
+    hasher = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def merkle_digest(digests: t.Mapping[str, str]) -> str:
+    """
+    Combine per-file digests into one, independent of the order they were calculated in.
+
+    The relative path is part of the input, so renaming a file also changes the result.
+    """
+    hasher = hashlib.sha256(b"")
+    for name in sorted(digests):
+        hasher.update(f"{name}\0{digests[name]}\n".encode())
+    return hasher.hexdigest()
+
+
+class FileManifest:
+    """
+    On-disk map of relative path -> (stat key, digest), stored in the edwh cache directory.
+
+    Usage:
+        manifest = FileManifest.for_directory(Path("shared_code"), "schema")
+        digests = hash_files(Path("shared_code"), files, manifest)
+        manifest.save()
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, tuple[StatKey, str]] = {}
+        self.seen: set[str] = set()
+        self.dirty = False
+
+        try:
+            raw = json.loads(path.read_text())
+            self.entries = {name: (t.cast(StatKey, tuple(key)), digest) for name, (key, digest) in raw.items()}
+        except (OSError, ValueError, TypeError):
+            # missing or corrupt manifest: everything will simply be rehashed
+            self.entries = {}
+
+    @classmethod
+    def for_directory(cls, directory: Path, purpose: str) -> "FileManifest":
+        """
+        One manifest per (absolute directory, purpose), so projects don't share entries.
+        """
+        directory_id = hashlib.sha256(str(directory.resolve()).encode()).hexdigest()[:16]
+        return cls(edwh_cache_dir("manifests") / f"{purpose}-{directory_id}.json")
+
+    def lookup(self, name: str, key: StatKey) -> str | None:
+        self.seen.add(name)
+        if (entry := self.entries.get(name)) and entry[0] == key:
+            return entry[1]
+        return None
+
+    def store(self, name: str, key: StatKey, digest: str) -> None:
+        self.seen.add(name)
+        self.entries[name] = (key, digest)
+        self.dirty = True
+
+    def save(self) -> None:
+        """
+        Write the manifest if anything changed, forgetting files that weren't seen this run.
+        """
+        if stale := set(self.entries) - self.seen:
+            for name in stale:
+                del self.entries[name]
+            self.dirty = True
+
+        if not self.dirty:
+            return
+
+        atomic_write_text(self.path, json.dumps(self.entries))
+        self.dirty = False
+
+
+def hash_files(
+    root: Path,
+    files: t.Iterable[Path],
+    manifest: FileManifest | None = None,
+    max_workers: int | None = None,
+) -> dict[str, str]:
+    """
+    Get {path relative to root: sha256} for files, reusing manifest entries whose stat did not change.
+
+    Files that do need hashing are read on a thread pool (hashlib releases the GIL for larger chunks).
+    """
+    digests: dict[str, str] = {}
+    todo: dict[str, tuple[Path, StatKey]] = {}
+
+    for path in files:
+        name = path.relative_to(root).as_posix()
+        key = stat_key(path)
+        if manifest and (digest := manifest.lookup(name, key)):
+            digests[name] = digest
+        else:
+            todo[name] = (path, key)
+
+    if len(todo) > 1:
+        with futures.ThreadPoolExecutor(max_workers=max_workers or min(32, (os.cpu_count() or 1) + 4)) as executor:
+            hashed = dict(zip(todo, executor.map(hash_file, [path for path, _ in todo.values()])))
+    else:
+        hashed = {name: hash_file(path) for name, (path, _) in todo.items()}
+
+    for name, digest in hashed.items():
+        digests[name] = digest
+        if manifest:
+            manifest.store(name, todo[name][1], digest)
+
+    return digests
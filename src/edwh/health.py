@@ -8,6 +8,7 @@ from ewok import Context
 from termcolor import colored, cprint, termcolor
 
 from .constants import DOCKER_COMPOSE, AnyDict
+from .memo import CONTAINERS, memoize
 
 StatusOptions = t.Literal[
     "created", "restarting", "running", "removing", "paused", "exited", "exited ok", "dead", "unknown"
@@ -165,6 +166,41 @@ def docker_inspect(ctx: Context, container_id: str, *args: str) -> AnyDict | lis
         raise EnvironmentError(f"docker inspect {container_id} failed")
 
 
+# the same queries, shared by the tasks of one invocation (see memo.py) and forgotten when they change containers.
+# The public functions above always ask docker, so plugins that poll them see every change.
+_find_container_ids = memoize(CONTAINERS, skip_args=1)(find_container_ids)
+_docker_inspect = memoize(CONTAINERS, skip_args=1)(docker_inspect)
+
+
+def health_from_inspect(info: AnyDict, container_name: str, multiple: bool = False) -> HealthStatus:
+    """
+    Turn the `docker inspect` output of one container into a HealthStatus.
+
+    With `multiple`, the replica number is added to the container name (e.g. py4web-2).
+    """
+    state = info["State"]
+
+    config = info.get("Config", {})
+    labels = config.get("Labels", {})
+    container_number = labels.get("com.docker.compose.container-number", "1")
+
+    health = state.get("Health", {})
+
+    container_status = state.get("Status")
+    health_status = health.get("Status")
+
+    if container_status == "exited" and str(state.get("ExitCode")) == "0":
+        # use exit code to know whether it was critical or not
+        container_status = "exited ok"
+
+    return HealthStatus(
+        info.get("Id", ""),
+        f"{container_name}-{container_number}" if multiple else container_name,
+        container_status,
+        health_status,
+    )
+
+
 def get_healths(ctx: Context, *container_names: str) -> list[HealthStatus]:
     """
     Retrieves the health statuses of specified containers.
@@ -207,28 +243,7 @@ def get_healths(ctx: Context, *container_names: str) -> list[HealthStatus]:
                 None,
             )
 
-        info = info_by_id[container_id]
-        state = info["State"]
-
-        config = info.get("Config", {})
-        labels = config.get("Labels", {})
-        container_number = labels.get("com.docker.compose.container-number", "1")
-
-        health = state.get("Health", {})
-
-        container_status = state.get("Status")
-        health_status = health.get("Status")
-
-        if container_status == "exited" and str(state.get("ExitCode")) == "0":
-            # use exit code to know whether it was critical or not
-            container_status = "exited ok"
-
-        return HealthStatus(
-            container_id,
-            f"{container_name}-{container_number}" if multiple else container_name,
-            container_status,
-            health_status,
-        )
+        return health_from_inspect(info_by_id[container_id], container_name, multiple=multiple)
 
     result = []
     for container_name in container_names:
@@ -3,6 +3,7 @@ This file contains re-usable helpers.
 """
 
 import abc
+import contextlib
 import datetime as dt
 import functools
 import io
@@ -10,6 +11,7 @@ import itertools
 import os
 import re
 import sys
+import threading
 import typing as t
 from pathlib import Path
 
@@ -20,7 +22,13 @@ import yaml
 from ewok import Context
 from more_itertools import flatten as _flatten
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None  # type: ignore[assignment]
+
 from .constants import DOCKER_COMPOSE, AnyDict
+from .memo import COMPOSE_CONFIG, memoize
 
 
 def confirm(prompt: str, default: bool = False, allowed: set[str] | None = None, strict: bool = False) -> bool:
@@ -393,6 +401,7 @@ def yaml_loads(text: str) -> AnyDict:
     return t.cast(AnyDict, dct)
 
 
+@memoize(COMPOSE_CONFIG, skip_args=1)
 def dc_config(ctx: Context) -> AnyDict:
     if ran := ctx.run(f"{DOCKER_COMPOSE} config", warn=True, echo=False, hide=True):
         return (
@@ -448,6 +457,74 @@ def shorten(text: str, max_chars: int) -> str:
         return f"{text[:max_chars]}..."
 
 
+def edwh_cache_dir(*parts: str) -> Path:
+    """
+    Where edwh keeps state it can rebuild (hash manifests, digests, ...).
+
+    Everything in here is safe to remove; it only makes the next run slower.
+    """
+    cache_root = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    path = cache_root.joinpath("edwh", *parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def atomic_write_text(path: Path, contents: str, mode: int | None = None) -> None:
+    """
+    Write via a temporary file in the same directory, then swap it in with a rename.
+
+    Readers see either the old or the new file, never a half-written one.
+    A symlink is followed (the file it points to is replaced, the link stays),
+    and an existing file keeps its permissions (unless `mode` is given) and owner.
+    Where that can't be done with a rename (a directory we can't write to, a file owned by someone else),
+    the file is written in place instead.
+    """
+    path = path.resolve()
+    try:
+        old = path.stat()
+    except FileNotFoundError:
+        old = None
+
+    if mode is None and old:
+        mode = old.st_mode & 0o7777
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        try:
+            tmp.write_text(contents)
+            if old and ((new := tmp.stat()).st_uid, new.st_gid) != (old.st_uid, old.st_gid):
+                os.chown(tmp, old.st_uid, old.st_gid)
+        except PermissionError:
+            path.write_text(contents)
+            return
+
+        if mode is not None:
+            tmp.chmod(mode)
+        tmp.replace(path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+@contextlib.contextmanager
+def directory_lock(directory: Path) -> t.Generator[None, None, None]:
+    """
+    Advisory lock on a directory, for read-modify-write of the files in it (across threads and processes).
+
+    The directory itself is locked (no lock files are left behind); where flock isn't available, this does nothing.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # closing the descriptor releases the lock
+        os.close(fd)
+
+
 def _fabric_resolve_home(path: str, user: str) -> str:
     if not path.startswith("~"):
         return path
@@ -0,0 +1,197 @@
+"""
+HTTP responses edwh asks for often (PyPI metadata, changelogs), kept on disk.
+
+A response younger than the TTL is used as is; an older one is revalidated with
+If-None-Match/If-Modified-Since, which PyPI answers with an empty 304 when nothing changed.
+Within one run every URL is fetched at most once. In offline mode only the cache is used.
+
+EDWH_HTTP_TTL sets the TTL in seconds (0: always revalidate), EDWH_OFFLINE=1 is offline mode (`--offline`).
+
+Requests share one keep-alive session (with retries), and `fetch_concurrently` runs many of them
+on a bounded number of threads, keeping the results of the ones that worked.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import typing as t
+from concurrent import futures
+from pathlib import Path
+
+import requests
+import yayarl as yarl
+from requests.adapters import HTTPAdapter
+from termcolor import cprint
+from urllib3.util.retry import Retry
+
+from .helpers import atomic_write_text, edwh_cache_dir
+
+DEFAULT_HTTP_TTL = 60 * 60  # seconds
+TTL_ENV = "EDWH_HTTP_TTL"
+OFFLINE_ENV = "EDWH_OFFLINE"
+
+DEFAULT_HTTP_JOBS = 8
+DEFAULT_HTTP_TIMEOUT = (5, 10)  # seconds to connect, seconds between bytes of the response
+HTTP_RETRIES = Retry(
+    total=2,
+    backoff_factor=0.2,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET", "HEAD"),
+    raise_on_status=False,  # the last response is returned as is
+)
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def http_session() -> requests.Session:
+    """
+    One session for the whole run, so requests to the same host reuse their (TLS) connection.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=DEFAULT_HTTP_JOBS, max_retries=HTTP_RETRIES)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def fetch_concurrently[K, V](
+    fetch: t.Callable[[K], V],
+    keys: t.Iterable[K],
+    jobs: int = DEFAULT_HTTP_JOBS,
+) -> dict[K, V]:
+    """
+    fetch(key) for every key on at most `jobs` threads.
+
+    Keys whose fetch failed are reported (on stderr) and left out, instead of losing every result.
+    """
+    keys = list(dict.fromkeys(keys))
+    results: dict[K, V] = {}
+    with futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(keys)))) as executor:
+        running = {executor.submit(fetch, key): key for key in keys}
+        for future in futures.as_completed(running):
+            try:
+                results[running[future]] = future.result()
+            except Exception as e:
+                cprint(f"Could not fetch {running[future]}: {e}", color="yellow", file=sys.stderr)
+
+    # in the order of `keys`, not of completion
+    return {key: results[key] for key in keys if key in results}
+
+
+def http_ttl() -> float:
+    try:
+        return float(os.environ.get(TTL_ENV, DEFAULT_HTTP_TTL))
+    except ValueError:
+        return DEFAULT_HTTP_TTL
+
+
+def is_offline() -> bool:
+    return os.environ.get(OFFLINE_ENV, "0") == "1"
+
+
+def go_offline() -> None:
+    os.environ[OFFLINE_ENV] = "1"
+
+
+class CachedResponse(t.TypedDict):
+    url: str
+    fetched: float
+    etag: str | None
+    last_modified: str | None
+    text: str
+
+
+class HttpCache:
+    def __init__(self, directory: Path | None = None) -> None:
+        self._directory = directory
+        # responses that were fetched or revalidated during this run
+        self.fresh: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> Path:
+        if self._directory is None:
+            return edwh_cache_dir("http")
+        self._directory.mkdir(parents=True, exist_ok=True)
+        return self._directory
+
+    def path(self, url: str) -> Path:
+        return self.directory / f"{hashlib.sha256(url.encode()).hexdigest()[:32]}.json"
+
+    def load(self, url: str) -> CachedResponse | None:
+        try:
+            entry = t.cast(CachedResponse, json.loads(self.path(url).read_text()))
+            return entry if entry["url"] == url else None
+        except (OSError, ValueError, TypeError, KeyError):
+            # missing or corrupt: fetched again
+            return None
+
+    def store(self, entry: CachedResponse) -> None:
+        atomic_write_text(self.path(entry["url"]), json.dumps(entry))
+        with self._lock:
+            self.fresh[entry["url"]] = entry["text"]
+
+    def get_text(
+        self,
+        url: yarl.URL | str,
+        timeout: float | tuple[float, float] = DEFAULT_HTTP_TIMEOUT,
+    ) -> str | None:
+        """
+        The body of a GET to `url`; None in offline mode when it isn't cached.
+
+        Error responses (e.g. a 404 for an unknown package) are returned but not cached;
+        when the request itself fails, a cached (outdated) response is better than nothing.
+        """
+        url = yarl.URL(str(url))
+        key = str(url)
+        with self._lock:
+            if key in self.fresh:
+                return self.fresh[key]
+
+        entry = self.load(key)
+        if entry and (is_offline() or time.time() - entry["fetched"] < http_ttl()):
+            with self._lock:
+                self.fresh[key] = entry["text"]
+            return entry["text"]
+        elif is_offline():
+            return None
+
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            response = url.get(session=http_session(), timeout=timeout, headers=headers)
+        except requests.RequestException:
+            if entry:
+                return entry["text"]
+            raise
+
+        fresh: CachedResponse
+        if response.status_code == 304 and entry:
+            fresh = {**entry, "fetched": time.time()}
+        elif response.ok:
+            fresh = {
+                "url": key,
+                "fetched": time.time(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "text": response.text,
+            }
+        else:
+            return t.cast(str, response.text)
+
+        self.store(fresh)
+        return fresh["text"]
+
+
+http_cache = HttpCache()
@@ -0,0 +1,95 @@
+"""
+What `discover` found per project, kept between runs (one inventory per discovered directory).
+
+`discover --refresh` only rescans projects whose compose files, .env or .toml files changed
+(or that were discovered with other options); `discover --cached` answers from the inventory alone.
+Disk usage and container state are not part of a project's stamp, so they are as old as the last scan.
+"""
+
+import hashlib
+import json
+import typing as t
+from pathlib import Path
+
+from .helpers import AnyDict, atomic_write_text, dump_set_as_list, edwh_cache_dir
+
+# files that change what discover reports about a project
+STAMP_PATTERNS = ("docker-compose*.yml", "docker-compose*.yaml", ".env", "*.toml")
+
+type Stamp = dict[str, list[int]]  # file name: [mtime_ns, size]
+type Output = list[tuple[str, AnyDict]]  # (message, cprint kwargs)
+
+
+def project_stamp(folder: Path) -> Stamp:
+    stamp: Stamp = {}
+    for pattern in STAMP_PATTERNS:
+        for path in folder.glob(pattern):
+            if path.is_file():
+                stat = path.stat()
+                stamp[path.name] = [stat.st_mtime_ns, stat.st_size]
+    return dict(sorted(stamp.items()))
+
+
+class InventoryEntry(t.TypedDict):
+    stamp: Stamp
+    options: str
+    project: AnyDict | None
+    output: Output
+
+
+class Inventory:
+    """
+    Discover results per project folder (as found from the discovered directory).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.server = ""
+        self.entries: dict[str, InventoryEntry] = {}
+        self.dirty = False
+
+        try:
+            raw = json.loads(path.read_text())
+            self.server = raw["server"]
+            self.entries = raw["projects"]
+        except (OSError, ValueError, TypeError, KeyError):
+            # missing or corrupt inventory: everything will simply be scanned
+            self.entries = {}
+
+    @classmethod
+    def for_directory(cls, directory: Path) -> "Inventory":
+        directory_id = hashlib.sha256(str(directory.resolve()).encode()).hexdigest()[:16]
+        return cls(edwh_cache_dir("inventory") / f"{directory_id}.json")
+
+    @property
+    def exists(self) -> bool:
+        return bool(self.entries)
+
+    def lookup(self, folder: str, stamp: Stamp | None, options: str) -> InventoryEntry | None:
+        """
+        The entry for `folder` if it was made with the same options and (unless `stamp` is None) files.
+        """
+        entry = self.entries.get(folder)
+        if entry and entry["options"] == options and stamp in (None, entry["stamp"]):
+            return entry
+        return None
+
+    def store(self, folder: str, stamp: Stamp, options: str, project: AnyDict | None, output: Output) -> None:
+        self.entries[folder] = {"stamp": stamp, "options": options, "project": project, "output": output}
+        self.dirty = True
+
+    def save(self, server: str, folders: t.Sequence[str]) -> None:
+        """
+        Write the inventory if anything changed, in the order of `folders`, forgetting projects that are gone.
+        """
+        if list(self.entries) != list(folders):
+            self.entries = {folder: self.entries[folder] for folder in folders if folder in self.entries}
+            self.dirty = True
+
+        if not self.dirty and server == self.server:
+            return
+
+        self.server = server
+        data = {"server": server, "projects": self.entries}
+        atomic_write_text(self.path, json.dumps(data, default=dump_set_as_list))
+        self.dirty = False
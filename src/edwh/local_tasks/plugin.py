@@ -2,7 +2,6 @@
 Extra namespace for plugin tasks such as plugin.add
 """
 
-import concurrent.futures
 import datetime as dt
 import importlib
 import json
@@ -30,6 +29,7 @@ from termcolor import colored, cprint
 from termcolor._types import Color
 
 from .. import confirm, interactive_selected_radio_value, kwargs_to_options
+from ..http_cache import fetch_concurrently, go_offline, http_cache
 from ..meta import (
     Version,
     _gather_package_metadata_threaded,
@@ -198,8 +198,8 @@ def gather_plugin_info(c: Context) -> list[Plugin]:
     return _gather_plugin_info(c, available_plugins)
 
 
-@task(name="list")
-def list_plugins(c: Context, verbose: bool = False) -> None:
+@task(name="list", help=dict(offline="only use PyPI metadata edwh has cached"))
+def list_plugins(c: Context, verbose: bool = False, offline: bool = False) -> None:
     """
     List installed plugins
 
@@ -207,7 +207,11 @@ def list_plugins(c: Context, verbose: bool = False) -> None:
     :type c: Context
 
     :param verbose: should all info such as installed version always be shown?
+    :param offline: don't go to PyPI, use what was cached before
     """
+    if offline:
+        go_offline()
+
     plugins = gather_plugin_info(c)
 
     old_plugins = []
@@ -384,20 +388,15 @@ def get_changelog(github_repo: str | yarl.URL) -> str:
     github_repo = github_repo.path.removeprefix("/")  # e.g. educationwarehouse/edwh
     changelog_url = GITHUB_RAW_URL / github_repo / "master/CHANGELOG.md"  # replace github.com with github raw
 
-    return changelog_url.get(timeout=10).text
+    return http_cache.get_text(changelog_url) or ""
 
 
 def get_changelogs_threaded(github_repos: dict[str, str]) -> dict[str, str]:
     """
-    For any package in packages, gather its metadata from pypi
+    For any package in packages, get its changelog from github (packages for which that failed are left out)
     """
-    all_data: dict[str, str] = {}
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        repo_urls = list(github_repos.values())
-        for result, package in zip(executor.map(get_changelog, repo_urls), github_repos.keys()):
-            all_data[package] = result
-
-    return all_data
+    changelogs = fetch_concurrently(get_changelog, github_repos.values())
+    return {package: changelogs[repo] for package, repo in github_repos.items() if repo in changelogs}
 
 
 def _filter_away_version(changelog_version: Version, _filter: str) -> bool:
@@ -643,8 +642,8 @@ def _changelog_all(ctx: Context, _: list[str], since: str, *__: t.Any) -> None:
     return _gather_and_display_changelogs(info, _since)
 
 
-@task(iterable=["plugin"])
-def changelog(ctx: Context, plugin: list[str], since: str = "5", new: bool = False) -> None:
+@task(iterable=["plugin"], help=dict(offline="only use PyPI metadata and changelogs edwh has cached"))
+def changelog(ctx: Context, plugin: list[str], since: str = "5", new: bool = False, offline: bool = False) -> None:
     """
     Show changelogs for edwh plugins.
     by default, changelogs from all plugins are shown.
@@ -653,7 +652,11 @@ def changelog(ctx: Context, plugin: list[str], since: str = "5", new: bool = Fal
     a version (releases starting from that version) or
     'major'/'minor'/'patch' to show releases since the latest version of that type.
     if 'new' is True, show only changes for outdated packages.
+    'offline' uses cached PyPI metadata and changelogs only.
     """
+    if offline:
+        go_offline()
+
     if new:
         return _changelog_new(ctx, plugin, since, new)
     elif plugin:
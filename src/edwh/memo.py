@@ -0,0 +1,102 @@
+"""
+Invocation-scoped memoization.
+
+One `edwh build up logs` (or one `edwh batch`) is one process, so its tasks can share the answers
+to docker queries and parsed files instead of asking again for every task.
+Entries are grouped in namespaces; tasks that change state drop the namespaces they affect:
+
+- COMPOSE_CONFIG: `docker compose config` and friends (changes with .env or the compose files)
+- CONTAINERS: `docker compose ps` and `docker inspect` snapshots (changes with up/down/stop/restart)
+
+Cached values are deep-copied on the way out, so callers can't change them for the next task.
+"""
+
+import copy
+import functools
+import threading
+import typing as t
+from pathlib import Path
+
+COMPOSE_CONFIG = "compose-config"
+CONTAINERS = "containers"
+
+P = t.ParamSpec("P")
+R = t.TypeVar("R")
+
+
+class InvocationCache:
+    def __init__(self) -> None:
+        self.entries: dict[str, dict[t.Hashable, t.Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def get(self, namespace: str, key: t.Hashable, factory: t.Callable[[], R]) -> R:
+        with self._lock:
+            entries = self.entries.setdefault(namespace, {})
+            if key in entries:
+                self.hits += 1
+                return t.cast(R, copy.deepcopy(entries[key]))
+
+        # don't hold the lock while running docker, other threads may want other keys
+        value = factory()
+        with self._lock:
+            self.misses += 1
+            self.entries.setdefault(namespace, {})[key] = value
+        return copy.deepcopy(value)
+
+    def invalidate(self, *namespaces: str) -> None:
+        """
+        Forget everything in `namespaces` (or everything at all if none are given).
+        """
+        with self._lock:
+            for namespace in namespaces or list(self.entries):
+                self.entries.pop(namespace, None)
+
+
+invocation_cache = InvocationCache()
+
+
+def _freeze(value: t.Any) -> t.Hashable:
+    """
+    Make lists/sets/dicts usable as (part of) a cache key.
+
+    Set members and dict keys are ordered by their repr, so mixed types (which can't be compared) work too.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(_) for _ in value)
+    elif isinstance(value, (set, frozenset)):
+        return tuple(sorted((_freeze(_) for _ in value), key=repr))
+    elif isinstance(value, dict):
+        return tuple(sorted(((key, _freeze(item)) for key, item in value.items()), key=lambda pair: repr(pair[0])))
+    return t.cast(t.Hashable, value)
+
+
+def _scope(ctx: t.Any) -> tuple[str, str, str]:
+    """
+    Where a query runs: the process' working directory, plus the context's `cd()` directory and host.
+    """
+    return str(Path.cwd()), str(getattr(ctx, "cwd", "") or ""), str(getattr(ctx, "host", "") or "")
+
+
+def memoize(namespace: str, skip_args: int = 0) -> t.Callable[[t.Callable[P, R]], t.Callable[P, R]]:
+    """
+    Cache a function's result for the rest of this invocation, per working directory (and host) and arguments.
+
+    `skip_args` leading positional arguments (like `ctx`) are not part of the key.
+    """
+
+    def decorator(fn: t.Callable[P, R]) -> t.Callable[P, R]:
+        @functools.wraps(fn)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            key = (
+                getattr(fn, "__qualname__", repr(fn)),
+                _scope(args[0] if skip_args else None),
+                _freeze(args[skip_args:]),
+                _freeze(kwargs),
+            )
+            return invocation_cache.get(namespace, key, lambda: fn(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -2,7 +2,8 @@
 This files contains everything to do with meta-tasks such as self-updating
 """
 
-import concurrent.futures
+import json
+import os
 import shlex
 import sys
 import typing as t
@@ -15,9 +16,13 @@ from packaging.version import parse as parse_package_version
 from termcolor import cprint
 
 from .helpers import AnyDict
+from .http_cache import TTL_ENV, fetch_concurrently, http_cache
 
 PYPI_URL_BASE = yarl.URL("https://pypi.python.org/pypi/")
 
+# packages that were looked up --offline without being cached (to warn only once)
+_not_cached: set[str] = set()
+
 
 def _python() -> str:
     """
@@ -50,11 +55,15 @@ def pip_uninstall(c: Context, *specifiers: str, **kw: t.Any) -> Result | None:
 
 def _get_pypi_info(package: str) -> AnyDict:
     """
-    Load metadata from pypi for a package
+    Load metadata from pypi for a package (via the http cache, see http_cache)
     """
     url = PYPI_URL_BASE / package / "json"
-    resp = url.get(timeout=10)
-    return t.cast(AnyDict, resp.json())
+    if (text := http_cache.get_text(url)) is None:
+        if package not in _not_cached:
+            _not_cached.add(package)
+            cprint(f"No cached PyPI metadata for {package} (--offline)", color="yellow", file=sys.stderr)
+        return {}
+    return t.cast(AnyDict, json.loads(text))
 
 
 def _get_latest_version_from_pypi(package: str) -> Version:
@@ -85,6 +94,9 @@ def _get_available_plugins_from_pypi(package: str, extra: str | None = None) ->
 
     """
     data = _get_pypi_info(package)
+    if not data.get("info"):
+        # unknown package, or offline without it in the cache
+        return []
     extras = data["info"]["requires_dist"]
 
     if extra:
@@ -95,15 +107,11 @@ def _get_available_plugins_from_pypi(package: str, extra: str | None = None) ->
 
 def _gather_package_metadata_threaded(packages: t.Iterable[str]) -> dict[str, AnyDict | None]:
     """
-    For any package in packages, gather its metadata from pypi
+    For any package in packages, gather its metadata from pypi (None if that failed)
     """
-    all_data: dict[str, AnyDict | None] = {}
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        pkg_names = [_.split("==")[0] for _ in packages]
-        for result, package in zip(executor.map(_get_pypi_info, pkg_names), packages):
-            all_data[package] = result
-
-    return all_data
+    packages = list(packages)
+    metadata = fetch_concurrently(_get_pypi_info, [_.split("==")[0] for _ in packages])
+    return {package: metadata.get(package.split("==")[0]) for package in packages}
 
 
 def _determine_newest_version(releases: t.Collection[str]) -> str:
@@ -162,17 +170,17 @@ def _parse_versions(installed: list[str]) -> dict[str, Version | None]:
     return versions
 
 
-@task()
-def plugins(c: Context, verbose: bool = False, changelog: bool = False) -> None:
+@task(help=dict(offline="only use PyPI metadata and changelogs edwh has cached"))
+def plugins(c: Context, verbose: bool = False, changelog: bool = False, offline: bool = False) -> None:
     """
     alias for plugin.list or plugin.changelog --new
     """
     from .local_tasks import plugin
 
     if changelog:
-        return plugin.changelog(c, [], new=True)
+        return plugin.changelog(c, [], new=True, offline=offline)
     else:
-        return plugin.list_plugins(c, verbose=verbose)
+        return plugin.list_plugins(c, verbose=verbose, offline=offline)
 
 
 def _self_update(c: Context, prerelease: bool = False, no_cache: bool = False) -> None:
@@ -182,6 +190,8 @@ def _self_update(c: Context, prerelease: bool = False, no_cache: bool = False) -
     from .local_tasks.plugin import list_installed_plugins
 
     pip_command = _pip()
+    # an update should never be decided on outdated PyPI metadata: revalidate (a 304 is cheap)
+    os.environ[TTL_ENV] = "0"
 
     edwh_packages = list_installed_plugins(c, pip_command)
     if not edwh_packages or (len(edwh_packages) == 1 and edwh_packages[0] == ""):
@@ -0,0 +1,150 @@
+"""
+Work out which services `up --smart` actually has to recreate.
+
+A running container is left alone when its compose config-hash, its image and
+(for services with a build section) its build context all still match.
+"""
+
+import json
+import typing as t
+from dataclasses import dataclass, field
+
+import tabulate
+from ewok import Context
+from termcolor import colored
+from termcolor._types import Color
+
+from .build_context import BuildDigests, ContextDigest, build_image_tag, context_digest
+from .constants import DOCKER_COMPOSE, AnyDict
+from .health import docker_inspect
+from .memo import COMPOSE_CONFIG, CONTAINERS, memoize
+
+T_PlanAction = t.Literal["create", "recreate", "keep"]
+
+CONFIG_HASH_LABEL = "com.docker.compose.config-hash"
+
+
+@dataclass
+class ServicePlan:
+    service: str
+    action: T_PlanAction = "keep"
+    reasons: list[str] = field(default_factory=list)
+    # set for services with a local build context, so the digest can be recorded after building
+    image_tag: str | None = None
+    context_digest: ContextDigest | None = None
+    needs_build: bool = False
+
+    def change(self, action: T_PlanAction, reason: str) -> None:
+        if self.action != "create":
+            self.action = action
+        self.reasons.append(reason)
+
+    @property
+    def changed(self) -> bool:
+        return self.action != "keep"
+
+
+@memoize(COMPOSE_CONFIG, skip_args=1)
+def config_hashes(ctx: Context) -> dict[str, str]:
+    """
+    {service: hash} as `docker compose up` would label the containers it creates.
+    """
+    ran = ctx.run(f"{DOCKER_COMPOSE} config --hash '*'", hide=True, warn=True)
+    hashes = {}
+    for line in (ran.stdout if ran and ran.ok else "").splitlines():
+        if len(parts := line.split()) == 2:
+            hashes[parts[0]] = parts[1]
+    return hashes
+
+
+@memoize(CONTAINERS, skip_args=1)
+def running_containers(ctx: Context, services: t.Collection[str]) -> dict[str, list[AnyDict]]:
+    """
+    {service: [docker inspect output per container]} for the selected services (including stopped ones).
+    """
+    ran = ctx.run(f"{DOCKER_COMPOSE} ps -aq {' '.join(services)}", hide=True, warn=True)
+    if not (ran and ran.ok and (container_ids := ran.stdout.split())):
+        return {}
+
+    try:
+        inspected = docker_inspect(ctx, " ".join(container_ids))
+    except EnvironmentError:
+        return {}
+
+    by_service: dict[str, list[AnyDict]] = {}
+    for info in inspected if isinstance(inspected, list) else []:
+        labels = info.get("Config", {}).get("Labels") or {}
+        by_service.setdefault(labels.get("com.docker.compose.service", ""), []).append(info)
+    return by_service
+
+
+def image_id(ctx: Context, image: str) -> str | None:
+    ran = ctx.run(f"docker image inspect --format '{{{{.Id}}}}' {image}", hide=True, warn=True)
+    return ran.stdout.strip() if ran and ran.ok else None
+
+
+def plan_services(ctx: Context, services: t.Collection[str], config: AnyDict) -> list[ServicePlan]:
+    """
+    Compare the current compose config with what is running for every service in `services`.
+
+    `config` is the output of `docker compose config` (see `dc_config`).
+    """
+    project = config.get("name", "")
+    service_configs: dict[str, AnyDict] = config.get("services", {})
+    hashes = config_hashes(ctx)
+    containers = running_containers(ctx, services)
+    build_digests = BuildDigests()
+
+    plans = []
+    for service in sorted(services):
+        plan = ServicePlan(service)
+        service_config = service_configs.get(service, {})
+
+        if service_config.get("build"):
+            plan.image_tag = build_image_tag(project, service, service_config)
+            plan.context_digest = context_digest(service_config)
+            if build_digests.changed(plan.image_tag, plan.context_digest):
+                plan.needs_build = True
+                plan.change("recreate", "build context changed")
+
+        if not (service_containers := containers.get(service)):
+            plan.change("create", "not running")
+            plans.append(plan)
+            continue
+
+        current_image = image_id(ctx, service_config["image"]) if service_config.get("image") else None
+
+        for info in service_containers:
+            name = info.get("Name", "").lstrip("/")
+            labels = info.get("Config", {}).get("Labels") or {}
+
+            if (state := info.get("State", {}).get("Status")) != "running":
+                plan.change("recreate", f"{name} is {state}")
+            if (expected := hashes.get(service)) and labels.get(CONFIG_HASH_LABEL) != expected:
+                plan.change("recreate", f"{name} config changed")
+            if current_image and info.get("Image") != current_image:
+                plan.change("recreate", f"{name} image changed")
+
+        plans.append(plan)
+
+    return plans
+
+
+def print_plan(plans: t.Iterable[ServicePlan], as_json: bool = False) -> None:
+    if as_json:
+        print(json.dumps({plan.service: {"action": plan.action, "reasons": plan.reasons} for plan in plans}, indent=2))
+        return
+
+    colors: dict[T_PlanAction, Color] = {"create": "green", "recreate": "yellow", "keep": "dark_grey"}
+    rows = [
+        (colored(plan.service, colors[plan.action]), plan.action, ", ".join(plan.reasons) or "up to date")
+        for plan in plans
+    ]
+    print(tabulate.tabulate(rows, headers=["Service", "Action", "Why"]))
+
+
+def record_builds(plans: t.Iterable[ServicePlan]) -> None:
+    """
+    Remember the context digests of services that were just built.
+    """
+    BuildDigests().record({plan.image_tag: plan.context_digest for plan in plans if plan.image_tag})
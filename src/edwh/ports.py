@@ -0,0 +1,151 @@
+"""
+Free TCP ports for new environments, without two setups running at the same time choosing the same one.
+
+A port is free when nothing listens on it (from /proc/net/tcp{,6}, checked once more with a bind),
+no neighbour project has it in its .env and no other edwh run (of any user) reserved it recently.
+Reservations are kept in a ledger shared by every user of the host (in the temp directory, or EDWH_PORTS_DIR),
+which is only read and written under a lock; they expire after a while,
+by then the port is in the new project's .env (or the setup was abandoned).
+"""
+
+import contextlib
+import json
+import os
+import socket
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+from .helpers import atomic_write_text, directory_lock
+
+PROC_NET_TCP = (Path("/proc/net/tcp"), Path("/proc/net/tcp6"))
+TCP_LISTEN = "0A"
+MAX_PORT = 65535
+
+DEFAULT_RESERVATION_TTL = 60 * 60  # seconds
+PORTS_DIR_ENV = "EDWH_PORTS_DIR"
+
+type Reservations = dict[str, dict[str, t.Any]]  # port: {"owner": ..., "expires": timestamp}
+
+
+def listening_ports(sources: t.Iterable[Path] = PROC_NET_TCP) -> bytearray:
+    """
+    Bitmap (one byte per port) of the ports something listens on, IPv4 and IPv6.
+
+    Empty where /proc isn't available (e.g. macOS); the bind check in `allocate_port` still applies there.
+    """
+    bitmap = bytearray(MAX_PORT + 1)
+    for source in sources:
+        try:
+            lines = source.read_text().splitlines()[1:]  # skip the header
+        except OSError:
+            continue
+
+        for line in lines:
+            # sl local_address rem_address st ...
+            fields = line.split()
+            if len(fields) > 3 and fields[3] == TCP_LISTEN:
+                bitmap[int(fields[1].rsplit(":", 1)[1], 16)] = 1
+    return bitmap
+
+
+def can_bind(port: int) -> bool:
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+            server.bind(("127.0.0.1", port))
+    except OSError:
+        return False
+    return True
+
+
+def shared_ports_dir() -> Path:
+    """
+    The ledger's directory: like the temp directory itself, anyone may write in it (sticky, so nobody removes it).
+    """
+    directory = Path(os.environ.get(PORTS_DIR_ENV) or Path(tempfile.gettempdir()) / "edwh-ports")
+    directory.mkdir(parents=True, exist_ok=True)
+    with contextlib.suppress(PermissionError):
+        # mkdir's mode is limited by the umask; it fails for a directory another user made, which is fine
+        directory.chmod(0o1777)
+    return directory
+
+
+class PortLedger:
+    """
+    Ports handed out by edwh, shared by every edwh run of every user on this host.
+    Only use it inside `locked()`.
+    """
+
+    def __init__(self, directory: Path | None = None) -> None:
+        self.directory = directory or shared_ports_dir()
+        self.path = self.directory / "reservations.json"
+        self.reservations: Reservations = {}
+
+    def locked(self) -> t.ContextManager[None]:
+        return directory_lock(self.directory)
+
+    def load(self, now: float) -> set[int]:
+        """
+        Read the ledger, forgetting expired reservations, and return the reserved ports.
+        """
+        try:
+            raw = json.loads(self.path.read_text())
+            self.reservations = {
+                port: entry for port, entry in raw.items() if entry["expires"] > now and 0 < int(port) <= MAX_PORT
+            }
+        except (OSError, ValueError, TypeError, KeyError):
+            # missing or corrupt ledger: only what listens or is in a .env counts then
+            self.reservations = {}
+        return {int(port) for port in self.reservations}
+
+    def reserve(self, port: int, owner: str, expires: float) -> None:
+        self.reservations[str(port)] = {"owner": owner, "expires": expires}
+        if self.path.is_symlink() or self.directory.is_symlink():
+            # in a directory everyone can write to, a link could point anywhere: don't write through it
+            return
+        # readable and writable for the other users (whose edwh updates it in place)
+        atomic_write_text(self.path, json.dumps(self.reservations, indent=1), mode=0o666)
+
+
+def first_free(bitmap: bytearray, lowest: int) -> int | None:
+    # bytearray.find does the scan in C
+    port = bitmap.find(0, max(lowest, 1))
+    return None if port < 0 else port
+
+
+def allocate_port(
+    lowest: int,
+    reserved: t.Iterable[int] = (),
+    owner: str = "",
+    ttl: float = DEFAULT_RESERVATION_TTL,
+    ledger: PortLedger | None = None,
+    reserve: bool = True,
+) -> int | None:
+    """
+    The first free port from `lowest` upward, reserved in the ledger for `owner` (e.g. the project directory).
+
+    `reserved` are ports that are taken without listening yet, such as those in neighbour .env files.
+    Without `reserve` the port is only looked up (ports reserved by others are still skipped).
+    None if every port from `lowest` on is taken.
+    """
+    ledger = ledger or PortLedger()
+    bitmap = listening_ports()
+    for port in reserved:
+        if 0 <= port <= MAX_PORT:
+            bitmap[port] = 1
+
+    with ledger.locked():
+        now = time.time()
+        for port in ledger.load(now):
+            bitmap[port] = 1
+
+        while (port := first_free(bitmap, lowest)) is not None:
+            if can_bind(port):
+                if reserve:
+                    ledger.reserve(port, owner, now + ttl)
+                return port
+            # in use without listening (yet), or not ours to bind
+            bitmap[port] = 1
+
+    return None
@@ -0,0 +1,206 @@
+"""
+Pull the images of a compose project: each image once, a few at a time, and only when the registry has a newer one.
+
+The registry is reached through a small interface (`Registry`), so the scheduler
+can be exercised against a stand-in instead of a real docker daemon.
+"""
+
+import re
+import time
+import typing as t
+from concurrent import futures
+from dataclasses import dataclass, field
+
+import tabulate
+from ewok import Context
+from termcolor import colored
+from termcolor._types import Color
+
+from .constants import AnyDict
+
+T_PullStatus = t.Literal["updated", "current", "pulled", "failed"]
+
+# how many images are pulled at the same time by default
+DEFAULT_PULL_JOBS = 4
+
+# failures that retrying won't fix
+PERMANENT_PULL_ERROR = re.compile(r"not found|manifest unknown|unauthorized|denied|invalid reference", re.IGNORECASE)
+
+
+class Registry(t.Protocol):
+    def image_id(self, image: str) -> str | None:
+        """
+        Id of the local image, None if it isn't there.
+        """
+
+    def repo_digests(self, image: str) -> set[str]:
+        """
+        Registry digests (sha256:...) the local image is known under.
+        """
+
+    def remote_digest(self, image: str) -> str | None:
+        """
+        Digest the registry currently serves for this tag, None if it can't be determined.
+        """
+
+    def pull(self, image: str) -> tuple[bool, str]:
+        """
+        Pull an image, returns (success, output).
+        """
+
+
+class DockerRegistry:
+    """
+    `Registry` backed by the docker cli.
+    """
+
+    def __init__(self, ctx: Context) -> None:
+        self.ctx = ctx
+
+    def _run(self, command: str) -> str | None:
+        ran = self.ctx.run(command, hide=True, warn=True)
+        return ran.stdout.strip() if ran and ran.ok else None
+
+    def image_id(self, image: str) -> str | None:
+        return self._run(f"docker image inspect --format '{{{{.Id}}}}' {image}") or None
+
+    def repo_digests(self, image: str) -> set[str]:
+        output = self._run(
+            f"docker image inspect --format '{{{{range .RepoDigests}}}}{{{{println .}}}}{{{{end}}}}' {image}"
+        )
+        return {line.split("@", 1)[1] for line in (output or "").splitlines() if "@" in line}
+
+    def remote_digest(self, image: str) -> str | None:
+        return self._run(f"docker buildx imagetools inspect --format '{{{{.Manifest.Digest}}}}' {image}") or None
+
+    def pull(self, image: str) -> tuple[bool, str]:
+        ran = self.ctx.run(f"docker pull --quiet {image}", hide=True, warn=True)
+        return bool(ran and ran.ok), (ran.stderr or ran.stdout).strip() if ran else ""
+
+
+def pullable_images(config: AnyDict, services: t.Collection[str] | None = None) -> dict[str, list[str]]:
+    """
+    {image: [services using it]} for services that get their image from a registry.
+
+    Like `pull --ignore-buildable`: services with a build section (or a pull_policy that forbids pulling) are skipped.
+    """
+    images: dict[str, list[str]] = {}
+    for name, service in sorted(config.get("services", {}).items()):
+        if services is not None and name not in services:
+            continue
+        if service.get("build") or service.get("pull_policy") in {"build", "never"} or not service.get("image"):
+            continue
+        images.setdefault(service["image"], []).append(name)
+    return images
+
+
+@dataclass
+class PullResult:
+    image: str
+    services: list[str]
+    status: T_PullStatus
+    before: str | None = None
+    after: str | None = None
+    attempts: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    @property
+    def updated(self) -> bool:
+        return self.status == "updated"
+
+
+def pull_image(
+    registry: Registry,
+    image: str,
+    services: list[str],
+    retries: int = 3,
+    backoff: float = 1.0,
+    sleep: t.Callable[[float], t.Any] = time.sleep,
+) -> PullResult:
+    """
+    Pull one image unless the local copy already matches the registry.
+
+    Transient failures are retried up to `retries` times, waiting `backoff`, 2 * `backoff`, 4 * `backoff`, ...
+    """
+    result = PullResult(image, services, "failed", before=registry.image_id(image))
+
+    if result.before and (remote := registry.remote_digest(image)) and remote in registry.repo_digests(image):
+        result.status = "current"
+        result.after = result.before
+        return result
+
+    for attempt in range(retries + 1):
+        if attempt:
+            sleep(backoff * 2 ** (attempt - 1))
+
+        result.attempts += 1
+        ok, output = registry.pull(image)
+        if ok:
+            result.after = registry.image_id(image)
+            result.status = "updated" if result.after != result.before else "pulled"
+            return result
+
+        result.errors.append(output)
+        if PERMANENT_PULL_ERROR.search(output):
+            break
+
+    return result
+
+
+def schedule_pulls(
+    registry: Registry,
+    images: t.Mapping[str, list[str]],
+    jobs: int = DEFAULT_PULL_JOBS,
+    retries: int = 3,
+    backoff: float = 1.0,
+) -> list[PullResult]:
+    """
+    Pull every image in `images` (see `pullable_images`) with at most `jobs` pulls running at the same time.
+    """
+    if not images:
+        return []
+
+    with futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(images)))) as executor:
+        pending = [
+            executor.submit(pull_image, registry, image, services, retries=retries, backoff=backoff)
+            for image, services in images.items()
+        ]
+        return [future.result() for future in pending]
+
+
+def updated_services(results: t.Iterable[PullResult]) -> list[str]:
+    """
+    Services that got a new image, i.e. the ones that have to be recreated.
+    """
+    return sorted({service for result in results if result.updated for service in result.services})
+
+
+def failed_pulls(results: t.Iterable[PullResult]) -> list[str]:
+    """
+    Images that could not be pulled, even after retrying.
+    """
+    return sorted(result.image for result in results if result.status == "failed")
+
+
+def _short(image_id: str | None) -> str:
+    return image_id.removeprefix("sha256:")[:12] if image_id else "-"
+
+
+def print_pull_results(results: t.Iterable[PullResult]) -> None:
+    colors: dict[T_PullStatus, Color] = {
+        "updated": "green",
+        "current": "dark_grey",
+        "pulled": "dark_grey",
+        "failed": "red",
+    }
+    rows = [
+        (
+            result.image,
+            ", ".join(result.services),
+            colored(result.status, colors[result.status]),
+            f"{_short(result.before)} -> {_short(result.after)}",
+            (result.errors[-1].splitlines() or [""])[-1] if result.errors and result.status == "failed" else "",
+        )
+        for result in results
+    ]
+    print(tabulate.tabulate(rows, headers=["Image", "Services", "Result", "Image id", "Error"]))
@@ -0,0 +1,169 @@
+"""
+Decide which requirements.in files need compiling, and compile them side by side.
+
+Staleness is based on the content of the .in file and everything it pulls in
+with -r/-c, not on timestamps (which a git checkout happily rewrites). The
+input digest is recorded per .in file after every successful compile.
+A .in file edwh has no digest for yet is only compiled when its requirements.txt
+is missing or older than one of its inputs; otherwise its digest is recorded as is.
+"""
+
+import json
+import os
+import re
+import time
+import typing as t
+from concurrent import futures
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .hashing import hash_file, merkle_digest
+from .helpers import atomic_write_text, edwh_cache_dir
+
+T_CompileStatus = t.Literal["missing", "outdated", "current"]
+
+# -r file, -c file, --requirement=file, --constraint file
+INCLUDE_RE = re.compile(r"^\s*(?:-r|-c|--requirement|--constraint)(?:\s*=\s*|\s+)(\S+)")
+
+
+def requirement_includes(path: Path, _seen: set[Path] | None = None) -> list[Path]:
+    """
+    `path` followed by every file it (recursively) includes with -r/-c, relative to the including file.
+
+    Includes that don't exist (yet) are skipped; pip-compile will complain about those itself.
+    """
+    seen = _seen if _seen is not None else set()
+    if (resolved := path.resolve()) in seen or not path.is_file():
+        return []
+    seen.add(resolved)
+
+    files = [path]
+    for line in path.read_text().splitlines():
+        if match := INCLUDE_RE.match(line):
+            files.extend(requirement_includes(path.parent / match.group(1), seen))
+    return files
+
+
+def input_digest(path: Path, files: t.Iterable[Path] | None = None) -> str:
+    """
+    Digest of a .in file together with its includes (`files`, when they are known already).
+    """
+    files = requirement_includes(path) if files is None else files
+    return merkle_digest({str(file): hash_file(file) for file in files})
+
+
+def newer_than(files: t.Iterable[Path], output: Path) -> bool:
+    """
+    Whether any of `files` was modified after `output`.
+    """
+    compiled_at = output.stat().st_mtime_ns
+    return any(file.stat().st_mtime_ns > compiled_at for file in files)
+
+
+class CompiledRequirements:
+    """
+    Input digest per .in file (by absolute path), as of the last time edwh compiled it.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path or edwh_cache_dir() / "compiled-requirements.json"
+        try:
+            self.digests: dict[str, str] = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.digests = {}
+
+    def get(self, requirement: Path) -> str | None:
+        return self.digests.get(str(requirement.resolve()))
+
+    def record(self, digests: t.Mapping[Path, str]) -> None:
+        if not digests:
+            return
+
+        self.digests |= {str(path.resolve()): digest for path, digest in digests.items()}
+        atomic_write_text(self.path, json.dumps(self.digests))
+
+
+@dataclass
+class RequirementCheck:
+    path: Path
+    status: T_CompileStatus
+    digest: str
+    reasons: list[str] = field(default_factory=list)
+
+    @property
+    def output(self) -> Path:
+        return self.path.parent / "requirements.txt"
+
+
+def check_requirements(paths: t.Iterable[Path], compiled: CompiledRequirements | None = None) -> list[RequirementCheck]:
+    compiled = compiled or CompiledRequirements()
+
+    checks = []
+    seeds: dict[Path, str] = {}
+    for path in paths:
+        files = requirement_includes(path)
+        digest = input_digest(path, files)
+        check = RequirementCheck(path, "current", digest)
+        if not check.output.exists():
+            check.status = "missing"
+            check.reasons.append("requirements.txt doesn't exist")
+        elif (previous := compiled.get(path)) is None:
+            # no history (e.g. the first run): the timestamps are all there is to go on
+            if newer_than(files, check.output):
+                check.status = "outdated"
+                check.reasons.append("never compiled by edwh and changed after requirements.txt")
+            else:
+                seeds[path] = digest
+        elif previous != digest:
+            check.status = "outdated"
+            check.reasons.append("input or one of its -r/-c includes changed")
+        checks.append(check)
+
+    compiled.record(seeds)
+    return checks
+
+
+@dataclass
+class CompileResult:
+    path: Path
+    result: str
+    seconds: float = 0.0
+
+
+def compile_requirements(
+    checks: t.Collection[RequirementCheck],
+    compile_directory: t.Callable[[Path], t.Any],
+    jobs: int = 0,
+) -> list[CompileResult]:
+    """
+    Run `compile_directory(directory)` once for every directory with checks in it,
+    on a thread pool of `jobs` workers (0 = one per cpu).
+
+    Directories are independent, so a failure only affects the .in files in that directory.
+    Successful compiles are recorded, so the next run skips them.
+    """
+    by_directory: dict[Path, list[RequirementCheck]] = {}
+    for check in checks:
+        by_directory.setdefault(check.path.parent, []).append(check)
+
+    def run(directory: Path) -> list[CompileResult]:
+        started = time.monotonic()
+        try:
+            compile_directory(directory)
+            result = "compiled"
+        except Exception as e:
+            result = f"failed: {e}"
+        seconds = time.monotonic() - started
+        return [CompileResult(check.path, result, seconds) for check in by_directory[directory]]
+
+    if not by_directory:
+        return []
+
+    workers = min(len(by_directory), jobs or os.cpu_count() or 1)
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        results = [result for group in executor.map(run, by_directory) for result in group]
+
+    compiled = {result.path for result in results if result.result == "compiled"}
+    digests = {check.path: check.digest for check in checks if check.path in compiled}
+    CompiledRequirements().record(digests)
+    return results
@@ -0,0 +1,165 @@
+"""
+Restart strategies for `edwh restart`.
+
+Containers are restarted by signalling their main process (pid 1), after which
+docker's restart policy starts them again:
+
+- parallel: signal every matching container at the same time.
+- rolling: one replica at a time, waiting until it is healthy again before touching the next,
+  so a service with replicas never goes down completely.
+"""
+
+import time
+import typing as t
+from concurrent import futures
+from dataclasses import dataclass
+
+import tabulate
+from ewok import Context
+from termcolor import colored
+
+from .constants import AnyDict
+from .health import HealthStatus, docker_inspect, health_from_inspect
+from .plan import running_containers
+
+T_RestartStrategy = t.Literal["parallel", "rolling"]
+RESTART_STRATEGIES: tuple[T_RestartStrategy, ...] = t.get_args(T_RestartStrategy)
+
+
+@dataclass
+class RestartTarget:
+    container_id: str
+    name: str
+    service: str
+    # docker's State.StartedAt before the restart, to tell the new process from the old one
+    started_at: str
+
+
+@dataclass
+class RestartResult:
+    target: RestartTarget
+    ok: bool
+    detail: str = ""
+    seconds: float = 0.0
+
+
+def kill_command(force: bool = False) -> str:
+    """
+    ctrl-c (SIGINT) for a graceful restart, or SIGTERM with SIGKILL as fallback when forced.
+    """
+    return "kill -15 1 || kill -9 1" if force else "kill -2 1"
+
+
+def restart_targets(ctx: Context, services: t.Collection[str]) -> list[RestartTarget]:
+    """
+    Running containers of `services`, ordered by service and replica number.
+    """
+    targets = []
+    for service, infos in sorted(running_containers(ctx, services).items()):
+        for info in sorted(infos, key=_container_number):
+            state = info.get("State", {})
+            if state.get("Status") != "running":
+                continue
+            targets.append(
+                RestartTarget(info["Id"], info.get("Name", "").lstrip("/"), service, state.get("StartedAt", ""))
+            )
+    return targets
+
+
+def _container_number(info: AnyDict) -> int:
+    labels = info.get("Config", {}).get("Labels") or {}
+    return int(labels.get("com.docker.compose.container-number") or 0)
+
+
+def signal_container(ctx: Context, target: RestartTarget, force: bool = False) -> RestartResult:
+    started = time.monotonic()
+    ran = ctx.run(f'docker exec {target.container_id} sh -c "{kill_command(force)}"', hide=True, warn=True)
+    ok = bool(ran and ran.ok)
+    detail = "" if ok or not ran else (ran.stderr or ran.stdout).strip()
+    return RestartResult(target, ok, detail, time.monotonic() - started)
+
+
+def restart_parallel(ctx: Context, targets: t.Collection[RestartTarget], force: bool = False) -> list[RestartResult]:
+    if not targets:
+        return []
+
+    with futures.ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        return list(executor.map(lambda target: signal_container(ctx, target, force), targets))
+
+
+def container_health(ctx: Context, target: RestartTarget) -> tuple[str, HealthStatus | None]:
+    """
+    (StartedAt, health) of a container right now; health is None when it can't be inspected (e.g. mid restart).
+    """
+    # this is polled, so always ask docker (docker_inspect isn't cached)
+    try:
+        info = docker_inspect(ctx, target.container_id)
+    except EnvironmentError:
+        return "", None
+
+    info = info[0] if isinstance(info, list) and info else info
+    if not isinstance(info, dict) or "State" not in info:
+        return "", None
+    return info["State"].get("StartedAt", ""), health_from_inspect(info, target.name)
+
+
+def wait_until_restarted(
+    ctx: Context,
+    target: RestartTarget,
+    timeout: float = 120,
+    interval: float = 1,
+    sleep: t.Callable[[float], t.Any] = time.sleep,
+    clock: t.Callable[[], float] = time.monotonic,
+) -> tuple[bool, str]:
+    """
+    Wait until the container runs a new process (StartedAt moved) that is healthy, or running without healthcheck.
+    """
+    deadline = clock() + timeout
+    last = "did not restart"
+    while True:
+        started_at, health = container_health(ctx, target)
+        if health and started_at != target.started_at:
+            if health.ok:
+                return True, health.level.name.lower()
+            last = f"{health.status} & {health.health}" if health.health else health.status
+
+        if clock() >= deadline:
+            return False, f"{last} after {timeout:g}s"
+        sleep(interval)
+
+
+def restart_rolling(
+    ctx: Context,
+    targets: t.Iterable[RestartTarget],
+    force: bool = False,
+    timeout: float = 120,
+    sleep: t.Callable[[float], t.Any] = time.sleep,
+) -> list[RestartResult]:
+    """
+    Restart the containers one by one; stops at the first one that doesn't come back healthy.
+    """
+    results = []
+    for target in targets:
+        started = time.monotonic()
+        result = signal_container(ctx, target, force)
+        if result.ok:
+            result.ok, result.detail = wait_until_restarted(ctx, target, timeout=timeout, sleep=sleep)
+        result.seconds = time.monotonic() - started
+        results.append(result)
+
+        if not result.ok:
+            break
+
+    return results
+
+
+def print_restart_results(results: t.Iterable[RestartResult], targets: t.Iterable[RestartTarget]) -> None:
+    done = {result.target.container_id: result for result in results}
+    rows = []
+    for target in targets:
+        if result := done.get(target.container_id):
+            status = colored("restarted", "green") if result.ok else colored("failed", "red")
+            rows.append((target.name, status, result.detail, f"{result.seconds:.1f}s"))
+        else:
+            rows.append((target.name, colored("skipped", "yellow"), "an earlier replica failed", ""))
+    print(tabulate.tabulate(rows, headers=["Container", "Result", "Detail", "Time"]))
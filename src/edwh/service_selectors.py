@@ -0,0 +1,131 @@
+"""
+`-s/--service` selectors: service names, globs, groups and `!negations`.
+
+    ew up -s minimal -s '!celery-*'   # minimal services, without the celeries
+    ew logs -s '!pg-*'                # the default selection without the databases
+
+A word is looked up as (in this order) a built-in group (all, minimal, logs, celeries, pgq, db)
+or a group from the .toml's [groups] table, a service, a compose profile or an `edwh.groups` label;
+anything else is a glob. All selectors are compiled into one regex for what to include
+and one for what to exclude, once per version of the config.
+"""
+
+import fnmatch
+import re
+import typing as t
+from dataclasses import dataclass
+
+from .helpers import AnyDict, flatten
+
+GROUP_LABEL = "edwh.groups"  # comma separated group names on a compose service
+GLOB_CHARS = frozenset("*?[")
+
+type Groups = t.Mapping[str, t.Sequence[str]]
+
+
+def split_selectors(service_arg: t.Collection[str] | str | None) -> list[str]:
+    """
+    -s web,db -s 'celery*' -> ["web", "db", "celery*"].
+    """
+    if service_arg is None:
+        return []
+    elif isinstance(service_arg, str):
+        selectors = service_arg.split(",")
+    else:
+        selectors = list(flatten([_.split(",") for _ in service_arg]))
+    return [_.strip().strip("/") for _ in selectors if _.strip()]
+
+
+def compose_groups(compose: AnyDict) -> dict[str, list[str]]:
+    """
+    Group name: services, from the `profiles` and `edwh.groups` labels of the services in a compose config.
+    """
+    groups: dict[str, list[str]] = {}
+    for name, service in (compose.get("services") or {}).items():
+        labels = service.get("labels") or {}
+        if isinstance(labels, list):
+            # ["key=value", ...] (each item is one label, so values may contain commas)
+            labels = {key: value for key, sep, value in (label.partition("=") for label in labels) if sep}
+
+        names = [*(service.get("profiles") or []), *str(labels.get(GROUP_LABEL, "")).split(",")]
+        for group in filter(None, (_.strip() for _ in names)):
+            groups.setdefault(group, []).append(name)
+    return groups
+
+
+NOTHING = re.compile(r"(?!)")
+
+
+def _combined(patterns: t.Iterable[str]) -> re.Pattern[str]:
+    if not (unique := list(dict.fromkeys(patterns))):
+        return NOTHING  # e.g. an empty group
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in unique))
+
+
+@dataclass(frozen=True)
+class Selection:
+    include: re.Pattern[str] | None  # None: everything (only negations were given)
+    exclude: re.Pattern[str]
+
+    def matches(self, service: str) -> bool:
+        return (self.include is None or bool(self.include.match(service))) and not self.exclude.match(service)
+
+
+class ServiceSelector:
+    """
+    Selectors for one version of the config (all services and the groups they are in).
+    """
+
+    def __init__(
+        self,
+        services: t.Sequence[str],
+        groups: Groups,
+        derived_groups: t.Callable[[], Groups] | None = None,
+    ) -> None:
+        self.services = list(services)
+        self.groups = dict(groups)
+        self._known = set(services)
+        # compose profiles/labels, only looked up (once) when a word is neither a group nor a service
+        self._derived_groups = derived_groups
+        self.derived: Groups | None = None
+        self._compiled: dict[tuple[str, ...], Selection] = {}
+
+    def group(self, name: str) -> t.Sequence[str] | None:
+        if name in self.groups:
+            return self.groups[name]
+        if name in self._known or GLOB_CHARS & set(name):
+            return None
+
+        if self.derived is None:
+            self.derived = self._derived_groups() if self._derived_groups else {}
+        return self.derived.get(name)
+
+    def expand(self, selector: str, seen: tuple[str, ...] = ()) -> t.Iterator[str]:
+        """
+        The globs/names a selector stands for; groups may contain other groups (but not themselves).
+        """
+        if selector not in seen and (members := self.group(selector)) is not None:
+            for member in members:
+                yield from self.expand(member, (*seen, selector))
+        else:
+            yield selector
+
+    def compile(self, selectors: t.Sequence[str]) -> Selection:
+        key = tuple(selectors)
+        if (selection := self._compiled.get(key)) is None:
+            include = [selector for selector in key if not selector.startswith("!")]
+            exclude = [selector[1:] for selector in key if selector.startswith("!")]
+            selection = self._compiled[key] = Selection(
+                _combined(_ for selector in include for _ in self.expand(selector)) if include else None,
+                _combined(_ for selector in exclude for _ in self.expand(selector)),
+            )
+        return selection
+
+    def select(self, selectors: t.Sequence[str]) -> list[str]:
+        """
+        The selected services, in the order of the config.
+        """
+        if not selectors:
+            return []
+        selection = self.compile(selectors)
+        return [service for service in self.services if selection.matches(service)]
@@ -0,0 +1,50 @@
+"""
+`edwh settings --find`: settings whose key or value contains the search text,
+or when there are none, the ones that resemble it most (best first).
+"""
+
+import typing as t
+
+from rapidfuzz import fuzz, process
+
+DEFAULT_FUZZ_THRESHOLD = 75
+
+
+class SettingsSearch:
+    """
+    Keys and values of a list of settings, prepared once so every search is a single batch over all of them.
+    """
+
+    def __init__(self, settings: t.Iterable[tuple[str, t.Any]]) -> None:
+        settings = list(settings)
+        self.keys = [str(key).upper() for key, _ in settings]
+        self.values = [str(value).upper() for _, value in settings]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def exact(self, find: str) -> list[int]:
+        find = find.upper()
+        return [idx for idx, (key, value) in enumerate(zip(self.keys, self.values)) if find in key or find in value]
+
+    def fuzzy(self, find: str, fuzz_threshold: int = DEFAULT_FUZZ_THRESHOLD) -> list[tuple[int, float]]:
+        """
+        (position, score) of settings with a key or value scoring above `fuzz_threshold`, best first.
+        """
+        find = find.upper()
+        scores: dict[int, float] = {}
+        for choices in (self.keys, self.values):
+            # scored in rapidfuzz' C++ loop; score_cutoff lets it skip hopeless choices early
+            for _, score, idx in process.extract(
+                find, choices, scorer=fuzz.partial_ratio, score_cutoff=fuzz_threshold, limit=None
+            ):
+                if score > fuzz_threshold:
+                    scores[idx] = max(score, scores.get(idx, 0))
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def find(self, find: str, fuzz_threshold: int = DEFAULT_FUZZ_THRESHOLD, limit: int | None = None) -> list[int]:
+        """
+        Positions of the matching settings: exact (substring) matches in order, else fuzzy ones by score.
+        """
+        matches = self.exact(find) or [idx for idx, _ in self.fuzzy(find, fuzz_threshold)]
+        return matches[:limit] if limit else matches
@@ -1,7 +1,6 @@
 import contextlib
+import contextvars
 import datetime as dt
-import fnmatch
-import hashlib
 import io
 import json
 import os
@@ -9,7 +8,6 @@ import pathlib
 import re
 import shlex
 import shutil
-import socket
 import subprocess
 import sys
 import threading
@@ -21,6 +19,7 @@ import warnings
 from collections import defaultdict
 from concurrent import futures
 from dataclasses import dataclass
+from functools import cached_property
 from getpass import getpass
 from pathlib import Path
 
@@ -31,7 +30,6 @@ import keyring.errors
 import tabulate
 import tomlkit  # has more features than tomllib
 import yaml
-from dotenv import dotenv_values
 from ewok import Context, Task, format_frame, task
 from invoke import Promise, Runner
 from packaging.version import parse as parse_version
@@ -50,13 +48,54 @@ from .constants import (
     FILE_START,
     LEGACY_TOML_NAME,
 )
-from .discover import discover, get_hosts_for_service  # noqa F401 - import for export (Remco afblijven)
-from .health import (
+from .build_context import BuildCheck, BuildDigests, check_builds
+from .config_cache import TomlConfigCache
+from .discover import DEFAULT_DISCOVER_JOBS, discover, get_hosts_for_service  # noqa F401 - import for export (Remco afblijven)
+from .discover import find_domain as find_domain_for
+from .each import DEFAULT_EACH_JOBS, find_projects, print_each_summary, run_each
+from .envstore import EnvIndex, env_store, exists_nonempty  # noqa F401 - exists_nonempty used to live here
+from .fleet import (
+    DEFAULT_FLEET_JOBS,
+    DEFAULT_FLEET_TIMEOUT,
+    FLEET_COMMANDS,
+    ConnectionPool,
+    fleet_as_json,
+    load_inventory,
+    print_fleet,
+    run_fleet,
+)
+from .hashing import FileManifest, StatKey, hash_files, merkle_digest, stat_key
+from .health import (  # noqa F401 - the public ones used to be used here, keep them importable
+    _docker_inspect,
+    _find_container_ids,
     docker_inspect,
     find_container_ids,
     find_containers_ids,
     get_healths,
 )
+from .memo import COMPOSE_CONFIG, CONTAINERS, invocation_cache, memoize
+from .plan import plan_services, print_plan, record_builds
+from .ports import allocate_port
+from .pull import (
+    DEFAULT_PULL_JOBS,
+    DockerRegistry,
+    PullResult,
+    failed_pulls,
+    print_pull_results,
+    pullable_images,
+    schedule_pulls,
+    updated_services,
+)
+from .requirements import check_requirements, compile_requirements
+from .restart import (
+    RESTART_STRATEGIES,
+    print_restart_results,
+    restart_parallel,
+    restart_rolling,
+    restart_targets,
+)
+from .service_selectors import ServiceSelector, compose_groups, split_selectors
+from .settings_search import DEFAULT_FUZZ_THRESHOLD, SettingsSearch
 
 # noinspection PyUnresolvedReferences
 # ^ keep imports for backwards compatibility (e.g. `from edwh.tasks import executes_correctly`)
@@ -65,8 +104,10 @@ from .helpers import (  # noqa F401 - import for export
     ColorFn,
     LineBufferHandler,
     NoopHandler,
+    atomic_write_text,
     confirm,
     dc_config,
+    directory_lock,
     dump_set_as_list,
     executes_correctly,
     execution_fails,
@@ -121,6 +162,8 @@ def service_names(
     Returns a list of matching servicenames based on ALL_SERVICES. filename globbing is applied.
 
     Use service_names(['*celery*','pg*']) to select all celery services, and all of pg related instances.
+    Groups (minimal, logs, [groups] from the .toml, compose profiles) and exclusions ('!celery-*') work too,
+    see service_selectors.
     :param service_arg: list of services or service selectors using wildcards
     :param default: which services to return if service_arg is empty?
     :return: list of unique services names that match the given list
@@ -130,65 +173,38 @@ def service_names(
     if not config:
         return []
 
-    selected = set()
-    if service_arg is None:
-        service_arg = []
-    elif isinstance(service_arg, str):
-        service_arg = service_arg.split(",")
-    else:
-        service_arg = list(flatten([_.split(",") for _ in service_arg]))
-
-    service_arg = [_.strip("/") for _ in service_arg] if service_arg else ([str(default)] if default else [])
-
-    # NOT elif because you can pass -s "minimal" -s "celeries" for example
-    if "all" in service_arg:
-        service_arg.remove("all")
-        service_arg.extend(config.all_services)
-    if "minimal" in service_arg:
-        service_arg.remove("minimal")
-        service_arg.extend(config.services_minimal)
-    if "logs" in service_arg:
-        service_arg.remove("logs")
-        service_arg.extend(config.services_log)
-    if "celeries" in service_arg:
-        service_arg.remove("celeries")
-        service_arg.extend(config.celeries)
-    if "pgq" in service_arg:
-        service_arg.remove("pgq")
-        service_arg.extend(config.pgq)
-    if "db" in service_arg and config.services_db:
-        service_arg.remove("db")
-        service_arg.extend(config.services_db)
-
-    # service_arg is specified, filter through all available services:
-
-    for service in service_arg:
-        selected.update(fnmatch.filter(config.all_services, service))
-
-    if service_arg and not selected:
+    selectors = split_selectors(service_arg)
+    if default and all(selector.startswith("!") for selector in selectors):
+        # nothing or only exclusions given: start from the default selection
+        selectors = [default, *selectors]
+
+    selected = config.selector.select(selectors)
+    if selectors and not selected:
         # when no service matches the name, don't return an empty list, as that would `up` all services
         # instead of the wanted list. This includes typos, where a single typo could cause all services to be started.
-        cprint(f"ERROR: No services found matching: {service_arg!r}", color="red")
+        cprint(f"ERROR: No services found matching: {selectors!r}", color="red")
         exit(1)
-    return list(selected)
+    return selected
 
 
 def calculate_schema_hash(quiet: bool = False) -> str:
     """
-    Calculates the sha1 digest of the files in the shared_code folder.
+    Calculates the sha256 digest of the files in the shared_code folder.
 
     When anything is changed, it will have a different hash, so migrate will be triggered.
+    Per-file digests are kept in a manifest (see `FileManifest`), so only changed files are read again.
     """
-    filenames = sorted(Path("./shared_code").glob("**/*"))
+    shared_code = Path("./shared_code")
     # ignore those pesky __pycache__ folders
-    filenames = [_ for _ in filenames if "__pycache__" not in str(_) and _.is_file()]
-    hasher = hashlib.sha256(b"")
-    for filename in filenames:
-        hasher.update(filename.read_bytes())
+    filenames = [_ for _ in shared_code.glob("**/*") if "__pycache__" not in str(_) and _.is_file()]
+
+    manifest = FileManifest.for_directory(shared_code, "schema")
+    schema_hash = merkle_digest(hash_files(shared_code, filenames, manifest))
+    manifest.save()
 
     if not quiet:
-        print("schema hash: ", hasher.hexdigest())
-    return hasher.hexdigest()
+        print("schema hash: ", schema_hash)
+    return schema_hash
 
 
 def task_for_namespace(ctx: Context, namespace: str, task_name: str) -> Task | None:
@@ -233,9 +249,6 @@ def get_task(ctx: Context, identifier: str = "") -> Task | None:
         return task_for_identifier(ctx, identifier)
 
 
-_dotenv_settings: dict[str, dict[str, str]] = {}
-
-
 def _apply_env_vars_to_template(source_lines: list[str], env: dict[str, str]) -> list[str]:
     needle = re.compile(r"# *template:")
 
@@ -329,6 +342,7 @@ class ConfigTomlDict(t.TypedDict, total=True):
 
     services: ServicesTomlConfig
     dotenv: AnyDict
+    groups: t.NotRequired[dict[str, list[str]]]  # name: services (names, globs or other groups)
 
 
 def boolish(value: t.Literal["y", "yes", "t", "true", "1", "n", "no", "false", "f", "0"] | str | int) -> bool:
@@ -359,8 +373,30 @@ class TomlConfig:
 
     dotenv_path: Path
 
+    # (size, mtime, inode) of the .toml this was loaded from
+    stamp: StatKey | None = None
+
     # __loaded was replaced with tomlconfig_singletons
 
+    @cached_property
+    def selector(self) -> ServiceSelector:
+        """
+        Compiled -s selectors for this version of the config.
+        """
+        groups: dict[str, t.Sequence[str]] = {
+            "all": self.all_services,
+            "minimal": self.services_minimal,
+            "logs": self.services_log,
+            "celeries": self.celeries,
+            "pgq": self.pgq,
+        }
+        if self.services_db:
+            groups["db"] = self.services_db
+        # [groups] in the .toml can't redefine the built-in ones
+        groups = t.cast(dict[str, t.Sequence[str]], self.config.get("groups", {})) | groups
+
+        return ServiceSelector(self.all_services, groups, lambda: compose_groups(load_dockercompose_with_includes()))
+
     @classmethod
     def load(
         cls,
@@ -374,13 +410,17 @@ class TomlConfig:
         Since this file should be in .git error suppression is not needed.
         Returns a dictionary with CONFIG, ALL_SERVICES, CELERIES and MINIMAL_SERVICES
         """
-        singleton_key = (str(fname), str(dotenv_path))
+        config_path = Path(fname)  # probably config.toml
+        singleton_key = (str(config_path.resolve()), str(dotenv_path))
         ctx = t.cast(Context, invoke.Context())
 
-        if cache and (instance := tomlconfig_singletons.get(singleton_key)):
+        if (
+            cache
+            and (instance := tomlconfig_singletons.get(singleton_key))
+            and instance.stamp == _toml_stamp(config_path)
+        ):
             return instance
 
-        config_path = Path(fname)  # probably config.toml
         dc_path = Path("docker-compose.yml")
 
         if not dc_path.exists():
@@ -390,21 +430,7 @@ class TomlConfig:
             )
             return None
 
-        if not config_path.exists():
-            setup(ctx)
-
-        config = read_toml_config(config_path)
-        # todo: if setup runs, reload config
-
-        if "services" not in config:
-            setup(ctx)
-            config = read_toml_config(config_path)
-
-        toml_keys = t.get_args(TomlKeys)
-        for toml_key in toml_keys:
-            if toml_key not in config["services"]:
-                setup(ctx)
-            config = read_toml_config(config_path)
+        config = _validated_toml_config(ctx, config_path, cache=cache)
 
         if config["services"].get("services", "discover") == "discover":
             compose = load_dockercompose_with_includes(dc_path=dc_path)
@@ -416,7 +442,8 @@ class TomlConfig:
         celeries = [s for s in all_services if "celery" in s.lower()]
         pgq = [s for s in all_services if "pgq" in s.lower()]
 
-        minimal_services = config["services"]["minimal"]
+        # a copy: the config itself stays as it is in the .toml
+        minimal_services = list(config["services"]["minimal"])
         if boolish(config["services"].get("include_celeries_in_minimal", "false")):
             minimal_services += celeries
         if boolish(config["services"].get("include_pgq_in_minimal", "false")):
@@ -432,32 +459,49 @@ class TomlConfig:
             services_db=config["services"]["db"],
             services_health=config["services"].get("health", []),
             dotenv_path=Path(config.get("dotenv", {}).get("path", dotenv_path or DEFAULT_DOTENV_PATH)),
+            stamp=_toml_stamp(config_path),
         )
         return instance
 
 
-def process_env_file(env_path: Path) -> dict[str, str]:
-    if not env_path.exists():
-        return {}
+def _toml_stamp(config_path: Path) -> StatKey | None:
+    try:
+        return stat_key(config_path)
+    except OSError:
+        return None
 
-    values = dotenv_values(env_path)
-    return t.cast(dict[str, str], dict(values))
 
+def _missing_toml_keys(config: ConfigTomlDict) -> list[str]:
+    if "services" not in config:
+        return ["services"]
+    return [toml_key for toml_key in t.get_args(TomlKeys) if toml_key not in config["services"]]
 
-def exists_nonempty(path: Path) -> bool:
+
+def _validated_toml_config(ctx: Context, config_path: Path, cache: bool = True) -> ConfigTomlDict:
     """
-    Checks whether a given file path exists and is non-empty.
+    The .toml with every TomlKeys entry present, running setup (once) if any are missing.
 
-    This function determines if the specified path represents an existing
-    file and whether it contains any data (i.e., its size is greater than 0).
+    What was validated is kept between runs, until the .toml changes (and unless `cache` is off).
+    """
+    disk_cache = TomlConfigCache.for_file(config_path)
+    if cache and (cached := disk_cache.lookup(config_path)) is not None:
+        return t.cast(ConfigTomlDict, cached)
 
-    Args:
-        path (Path): A Path object representing the file path to check.
+    if not config_path.exists():
+        setup(ctx)
 
-    Returns:
-        bool: True if the file exists and is non-empty, otherwise False.
-    """
-    return path.exists() and path.stat().st_size > 0
+    config = read_toml_config(config_path)
+    if _missing_toml_keys(config):
+        setup(ctx)
+        config = read_toml_config(config_path)
+
+    if not _missing_toml_keys(config):
+        disk_cache.store(config_path, config)
+    return config
+
+
+def process_env_file(env_path: Path) -> dict[str, str]:
+    return env_store.load(env_path)
 
 
 def read_dotenv(env_path: Path = DEFAULT_DOTENV_PATH) -> dict[str, str]:
@@ -474,41 +518,8 @@ def read_dotenv(env_path: Path = DEFAULT_DOTENV_PATH) -> dict[str, str]:
         # for backwards compatibility, if None is passed: still use the default.
         env_path = DEFAULT_DOTENV_PATH
 
-    cache_key = str(env_path) if env_path else "."
-    if existing := _dotenv_settings.get(cache_key):
-        # 'cache'
-        return existing
-
-    # First try the exact path provided
-    if exists_nonempty(env_path):
-        items = process_env_file(env_path)
-        _dotenv_settings[cache_key] = items
-        return items
-
-    # If not found and it's the default name, traverse up the tree
-    if env_path.name == DEFAULT_DOTENV_PATH.name:
-        current_dir = Path.cwd()
-
-        while current_dir != current_dir.parent:  # Stop at filesystem root
-            # Look for .env in current directory
-            potential_env = current_dir / DEFAULT_DOTENV_PATH.name
-            if exists_nonempty(potential_env):
-                items = process_env_file(potential_env)
-                _dotenv_settings[cache_key] = items
-                return items
-
-            # Check if we've reached a project root (docker-compose file exists)
-            if any(current_dir.glob("docker-compose.*")) and current_dir != Path.cwd():
-                # Found project root, stop searching if we're not in the original directory
-                break
-
-            # Move up one directory
-            current_dir = current_dir.parent
-
-    # If still not found, return empty dict (existing behavior)
-    items = {}
-    _dotenv_settings[cache_key] = items
-    return items
+    found = env_store.locate(Path(env_path))
+    return env_store.load(found) if found else {}
 
 
 # noinspection PyDefaultArgument
@@ -536,6 +547,20 @@ def warn_once(
 
 type DefaultFn = t.Callable[[], str | None]
 
+# set while check_env(s) computes a lazy default, whose value is about to be written to a .env
+_default_for_env: contextvars.ContextVar[bool] = contextvars.ContextVar("_default_for_env", default=False)
+
+
+def _lazy_default(default: DefaultFn) -> str | None:
+    """
+    Evaluate a lazy default for the .env, e.g. so next_available_port reserves the port it picks.
+    """
+    token = _default_for_env.set(True)
+    try:
+        return default()
+    finally:
+        _default_for_env.reset(token)
+
 
 def check_env(
     key: str,
@@ -582,10 +607,7 @@ def check_env(
     if toml_path:
         warn_once(f"Deprecated: toml_path ({toml_path} is not used by check_env anymore.)", color="yellow")
 
-    env_path = Path(env_path or DEFAULT_DOTENV_PATH)
-    if not env_path.exists():
-        env_path.parent.mkdir(parents=True, exist_ok=True)
-        env_path.touch()
+    env_path = _ensure_env_file(env_path)
 
     # config = TomlConfig.load(toml_path, env_path)
     env = read_dotenv(env_path)
@@ -608,14 +630,44 @@ def check_env(
     suffix = suffix or postfix
 
     if callable(default):
-        default = default()  # type: ignore
+        default = _lazy_default(t.cast(DefaultFn, default))
+
+    str_value = _new_env_value(key, default, comment, prefix, suffix, force_default, allowed_values)
+    set_env_values(env_path, {key.upper(): str_value})
+
+    return str_value
+
+
+def _ensure_env_file(env_path: str | Path | None) -> Path:
+    env_path = Path(env_path or DEFAULT_DOTENV_PATH)
+    if not env_path.exists():
+        env_path.parent.mkdir(parents=True, exist_ok=True)
+        env_path.touch()
+        env_store.updated(env_path)
+    return env_path
+
+
+def _from_env_mode() -> bool:
+    return os.environ.get("EDWH_FROM_ENV", "0") == "1"
 
+
+def _new_env_value(
+    key: str,
+    default: t.Any,
+    comment: str,
+    prefix: str | None = None,
+    suffix: str | None = None,
+    force_default: bool | None = False,
+    allowed_values: t.Iterable[str] = (),
+) -> str:
+    """
+    The value for a missing key: the (already evaluated) default, the environment (--from-env) or the user's answer.
+    """
     non_interactive = os.environ.get("EDWH_NON_INTERACTIVE", "0") == "1"
-    from_env = os.environ.get("EDWH_FROM_ENV", "0") == "1"
 
     if force_default:
         value = default or ""
-    elif from_env:
+    elif _from_env_mode():
         value = os.environ.get(key, default or "")
         if not value:
             raise RuntimeError(f"Environment variable {key} not found and no default provided (--from-env mode)")
@@ -635,14 +687,104 @@ def check_env(
     if suffix:
         str_value += suffix
 
-    with env_path.open(mode="a") as env_file:
-        # append mode ensures we're writing at the end
-        env_file.write(f"\n{key.upper()}={str_value}")
+    return str_value
 
-        # update in memory too:
-        env[key] = str_value
 
-    return str_value
+DEFAULT_CHECK_ENVS_JOBS = 1  # lazy defaults often depend on the .env so far (e.g. ports)
+
+
+class EnvSpec(t.TypedDict, total=False):
+    """
+    The keyword arguments of check_env that are about one key.
+    """
+
+    key: t.Required[str]
+    default: str | DefaultFn | None
+    comment: str
+    prefix: str | None
+    suffix: str | None
+    force_default: bool | None
+    allowed_values: t.Iterable[str]
+
+
+def check_envs(
+    specs: t.Iterable[EnvSpec],
+    env_path: str | Path | None = None,
+    jobs: int = DEFAULT_CHECK_ENVS_JOBS,
+) -> dict[str, str]:
+    """
+    check_env for many keys at once: one read of the .env, and as few writes as possible.
+
+    Lazy defaults of the missing keys are computed one by one, in the order of `specs`, with every value
+    before it written first, so they can depend on the .env so far (e.g. next_available_port for a group of ports).
+    Defaults that don't depend on the .env (or each other) can be computed at the same time with `jobs` > 1:
+    then everything that was missing is written at once.
+    Answers given before an error (e.g. a value that isn't allowed) are still saved.
+
+    Example:
+        > check_envs([
+        >     {"key": "HOSTINGDOMAIN", "default": "localhost", "comment": "hosting domain"},
+        >     {
+        >         "key": "WEB_PORT",
+        >         "default": lambda: str(next_available_port(c, "8000")),
+        >         "comment": "port for web",
+        >     },
+        > ])
+
+    Returns:
+        key: value for every spec, whether it was in the .env already or just added.
+    """
+    env_path = _ensure_env_file(env_path)
+    env = read_dotenv(env_path)
+    specs = list(specs)
+
+    missing = [spec for spec in specs if spec["key"] not in env]
+    lazy = [
+        spec
+        for spec in missing
+        if callable(spec.get("default"))
+        # --from-env only needs the default for keys that aren't in the environment
+        and (spec.get("force_default") or not (_from_env_mode() and spec["key"] in os.environ))
+    ]
+    sequential = jobs <= 1
+    computed: dict[str, t.Any] = {}
+    if lazy and not sequential:
+        with futures.ThreadPoolExecutor(max_workers=min(jobs, len(lazy))) as executor:
+            computed = dict(
+                zip(
+                    [spec["key"] for spec in lazy],
+                    executor.map(lambda spec: _lazy_default(t.cast(DefaultFn, spec["default"])), lazy),
+                )
+            )
+
+    values = {spec["key"]: env[spec["key"]] for spec in specs if spec["key"] in env}
+    new_values: dict[str, str] = {}
+    try:
+        for spec in missing:
+            if (key := spec["key"]) in values:
+                continue  # listed twice
+
+            if sequential and spec in lazy:
+                if new_values:
+                    # so this default sees the values before it
+                    set_env_values(env_path, new_values)
+                    new_values = {}
+                computed[key] = _lazy_default(t.cast(DefaultFn, spec["default"]))
+
+            values[key] = new_values[key.upper()] = _new_env_value(
+                key,
+                computed[key] if key in computed else spec.get("default"),
+                spec.get("comment", ""),
+                spec.get("prefix"),
+                spec.get("suffix"),
+                spec.get("force_default"),
+                spec.get("allowed_values", ()),
+            )
+    finally:
+        if new_values:
+            set_env_values(env_path, new_values)
+
+    return values
 
 
 def get_env_value(key: str, default: str | type[Exception] = KeyError) -> str:
@@ -671,46 +813,64 @@ def set_env_value(path: Path, target: str, value: str | None) -> None:
         value: string value to write (or anything that converts to a string using str()).
                If None, the key will be removed from the file (if present) and not added.
     """
-    path.touch(exist_ok=True)
+    set_env_values(path, {target: value})
 
-    with path.open(mode="r") as env_file:
-        # open the .env file and read every line in the inlines
-        inlines = env_file.read().split("\n")
 
-    outlines = []  # lines for output
-    geschreven = False
-    for line in inlines:
-        if line.strip().startswith("#"):
-            # ignore comments
-            outlines.append(line)
+def _update_env_lines(lines: list[str], values: t.Mapping[str, t.Any]) -> list[str]:
+    """
+    `lines` of a .env file with `values` applied: every line of an existing key is replaced (or removed for None),
+    new keys are added at the end, and everything else (comments, blank lines, order) stays as it was.
+    """
+    new_lines = []
+    found = set()
+    for line in lines:
+        key, is_setting, old_value = line.strip().partition("=")
+        key = key.strip()
+        if line.strip().startswith("#") or not is_setting or key not in values:
+            new_lines.append(line)
             continue
-        # remove redundant whitespace
-        line = line.strip()
-        if not line:
-            # remove empty lines
+
+        found.add(key)
+        if (value := values[key]) is None:
             continue
-        # convert to tuples
-        key, _oldvalue = line.split("=", 1)
-        # clean the key and value
-        key = key.strip()
-        if key == target:
-            if value is None:
-                # Remove this key by not adding it to outlines
-                geschreven = True
-                continue
-            # add the new tuple to the lines
-            outlines.append(f"{key}={value}")
-            geschreven = True
-        else:
-            # or leave it as it is
-            outlines.append(line)
+        # an unchanged value keeps its line as is (spacing, quotes)
+        new_lines.append(line if old_value.strip() == str(value) else f"{key}={value}")
+
+    new_lines.extend(
+        f"{key.strip().upper()}={str(value).strip()}"
+        for key, value in values.items()
+        if key not in found and value is not None
+    )
+    return new_lines
 
-    if not geschreven and value is not None:
-        outlines.append(f"{target.strip().upper()}={value.strip()}")
 
-    with path.open(mode="w") as env_file:
-        env_file.write("\n".join(outlines))
-        env_file.write("\n")
+def set_env_values(path: Path, values: t.Mapping[str, t.Any]) -> bool:
+    """
+    Set (or, with None, remove) several keys in a .env file in one go, keeping comments and layout intact.
+
+    The file is only written when something actually changes, and then atomically,
+    under a lock so concurrent edwh runs in the same project don't lose each other's changes.
+
+    Returns whether the file was changed.
+    """
+    with directory_lock(path.parent):
+        try:
+            old = path.read_text()
+        except FileNotFoundError:
+            old = ""
+
+        old_lines = old.splitlines()
+        new_lines = _update_env_lines(old_lines, values)
+        if new_lines == old_lines:
+            return False
+
+        # follows a symlinked .env and keeps the file's permissions and owner
+        atomic_write_text(path, "\n".join(new_lines) + "\n")
+
+    # the parsed .env and everything docker compose interpolated from it are outdated now
+    env_store.updated(path)
+    invocation_cache.invalidate(COMPOSE_CONFIG)
+    return True
 
 
 def write_content_to_toml_file(
@@ -724,10 +884,42 @@ def write_content_to_toml_file(
 
     filepath = Path(filename)
 
-    config_toml_file = read_toml_config(filepath)
-    config_toml_file["services"][content_key] = content  # type: ignore
+    if (document := _toml_transactions.get(filepath.resolve())) is not None:
+        # written at the end of the transaction
+        document["services"][content_key] = content
+        return
+
+    config_toml_file = tomlkit.loads(filepath.read_text())
+    config_toml_file["services"][content_key] = content
+
+    write_toml_config(filepath, t.cast(ConfigTomlDict, config_toml_file))
+
+
+# .toml files (by resolved path) that a setup run is editing, see toml_transaction
+_toml_transactions: dict[Path, tomlkit.TOMLDocument] = {}
+
+
+@contextlib.contextmanager
+def toml_transaction(filename: str | Path = DEFAULT_TOML_NAME) -> t.Generator[tomlkit.TOMLDocument, None, None]:
+    """
+    Parse the .toml once (with tomlkit, keeping comments and layout) for all writes in this block,
+    and write it once at the end - also when the block fails halfway, so answers given so far are kept.
+    """
+    filepath = Path(filename)
+    key = filepath.resolve()
+    if (document := _toml_transactions.get(key)) is not None:
+        # nested: the outer block writes
+        yield document
+        return
 
-    write_toml_config(filepath, config_toml_file)
+    original = filepath.read_text() if filepath.exists() else ""
+    _toml_transactions[key] = document = tomlkit.loads(original)
+    try:
+        yield document
+    finally:
+        del _toml_transactions[key]
+        if (contents := tomlkit.dumps(document)) != original:
+            atomic_write_text(filepath, contents)
 
 
 def get_content_from_toml_file(
@@ -787,10 +979,14 @@ def setup_config_file(filename: str | Path = DEFAULT_TOML_NAME) -> None:
 def read_toml_config(fp: Path) -> ConfigTomlDict:
     """
     Read the config at filepath, and cast to the right typeddict.
+
+    Uses tomllib (plain dicts, faster); writes go through tomlkit to keep the file's layout.
+    Inside a toml_transaction, this returns the document with the changes that are not written yet.
     """
-    config_toml_file = tomlkit.loads(fp.read_text())
+    if (document := _toml_transactions.get(fp.resolve())) is not None:
+        return t.cast(ConfigTomlDict, document)
 
-    return t.cast(ConfigTomlDict, config_toml_file)
+    return t.cast(ConfigTomlDict, tomllib.loads(fp.read_text()))
 
 
 def write_toml_config(fp: Path, config: ConfigTomlDict) -> int:
@@ -830,6 +1026,23 @@ def write_user_input_to_config_toml(
     services_celery = [service for service in all_services if "celery" in service]
     setup_config_file()
 
+    # some of the writes always go to the default .toml
+    with toml_transaction(filepath), toml_transaction():
+        _write_user_input_to_config_toml(
+            filepath, services_no_workers, services_pgq, services_celery, filename, overwrite
+        )
+
+    return TomlConfig.load(filename, cache=False)
+
+
+def _write_user_input_to_config_toml(
+    filepath: Path,
+    services_no_workers: list[str],
+    services_pgq: list[str],
+    services_celery: list[str],
+    filename: str | Path,
+    overwrite: bool,
+) -> None:
     # services
     services_list = "discover"
     write_content_to_toml_file("services", services_list)
@@ -880,8 +1093,6 @@ def write_user_input_to_config_toml(
     )
     write_content_to_toml_file("db", content or [], filename, allow_empty=content is None)
 
-    return TomlConfig.load(filename, cache=False)
-
 
 def load_dockercompose_with_includes(
     c: invoke.Context | None = None,
@@ -901,6 +1112,11 @@ def load_dockercompose_with_includes(
     if not dc_path.exists():
         raise FileNotFoundError(dc_path)
 
+    return _compose_config_with_includes(c, dc_path)
+
+
+@memoize(COMPOSE_CONFIG, skip_args=1)
+def _compose_config_with_includes(c: invoke.Context, dc_path: Path) -> AnyDict:
     if ran := c.run(f"{DOCKER_COMPOSE} -f {dc_path} config", hide=True):
         processed_config = ran.stdout.strip()
         # mimic a file to load the yaml from
@@ -1121,22 +1337,28 @@ def setup(
     return {}
 
 
+def adjacent_env_index(c: Context) -> EnvIndex:
+    """
+    The settings of all ../*/.env files (this project included), by key and project.
+    """
+    return env_store.index(pathlib.Path(c.cwd) / "..")
+
+
 @task()
 def search_adjacent_setting(c: Context, key: str, silent: bool = False) -> AnyDict:
     """
     Search for key in all ../*/.env files.
     """
+    return _adjacent_setting(adjacent_env_index(c), key, silent)
+
+
+def _adjacent_setting(index: EnvIndex, key: str, silent: bool) -> AnyDict:
     key = key.upper()
+    adjacent_settings = index.lookup(key)
     if not silent:
         print("search for ", key)
-    envs = (pathlib.Path(c.cwd) / "..").glob("*/.env")
-    adjacent_settings = {}
-    for env_path in envs:
-        value = read_dotenv(env_path).get(key)
-        project = env_path.parent.name
-        if not silent:
+        for project, value in adjacent_settings.items():
             print(f"{project:>20} : {value}")
-        adjacent_settings[project] = value
     return adjacent_settings
 
 
@@ -1147,9 +1369,10 @@ def next_value(c: Context, key: list[str] | str, lowest: int, silent: bool = Tru
     next_value(c, ['PGPOOL_PORT','POSTGRES_PORT','PGBOUNCER_PORT'], 5432) -> finds the next port searching for all keys.
     """
     keys = [key] if isinstance(key, str) else key
+    index = adjacent_env_index(c)
     all_settings: AnyDict = {}
     for key in keys:
-        settings = search_adjacent_setting(c, key, silent)
+        settings = _adjacent_setting(index, key, silent)
         all_settings |= {f"{k}/{key}": v for k, v in settings.items() if v}
         if not silent:
             print()
@@ -1157,40 +1380,40 @@ def next_value(c: Context, key: list[str] | str, lowest: int, silent: bool = Tru
     return max(values) + 1 if any(values) else lowest
 
 
-@task()
-def next_available_port(c: Context, port_or_key: str, silent: bool = True) -> int:
+@task(
+    help=dict(
+        reserve="Reserve the port for this project for a while, so setups running at the same time skip it.",
+    ),
+)
+def next_available_port(c: Context, port_or_key: str, silent: bool = True, reserve: bool = False) -> int:
     """Print the next available port from a starting port or environment key.
 
     ``next-available-port 5432`` uses 5432 as the lower bound.
     ``next-available-port PGPOOL_PORT`` uses the local value for that key.
+    The port is reserved (for every user on this host) with `reserve`, and always when it is the lazy default
+    of check_env(s), i.e. when it is written to a .env; otherwise it is only looked up.
     """
     reserved = set()
     if port_or_key.isdecimal():
         lowest = int(port_or_key)
-        env_paths = list((pathlib.Path(c.cwd) / "..").glob("*/.env"))
-        env_paths += list(pathlib.Path(c.cwd).glob("*/.env"))
-        keys = {key for env_path in env_paths for key in read_dotenv(env_path) if key.endswith("_PORT")}
-        for key in keys:
-            reserved.update(int(value) for value in search_adjacent_setting(c, key, silent).values() if value)
+        adjacent = adjacent_env_index(c)
+        nested = env_store.index(pathlib.Path(c.cwd))
+        keys = {key for key in [*adjacent.keys, *nested.keys] if key.endswith("_PORT")}
+        for key in sorted(keys):
+            reserved.update(int(value) for value in _adjacent_setting(adjacent, key, silent).values() if value)
         port = lowest
     else:
         key = port_or_key.upper()
         lowest = int(read_dotenv().get(key) or 1024)
         port = next_value(c, key, lowest, silent)
 
-    while port <= 65535:
-        if port not in reserved:
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
-                    server.bind(("127.0.0.1", port))
-            except OSError:
-                pass
-            else:
-                print(port)
-                return port
-        port += 1
+    owner = str(pathlib.Path(c.cwd).resolve())
+    reserve = reserve or _default_for_env.get()
+    if (free_port := allocate_port(port, reserved, owner=owner, reserve=reserve)) is None:
+        raise RuntimeError(f"No available TCP port found from {lowest} onward")
 
-    raise RuntimeError(f"No available TCP port found from {lowest} onward")
+    print(free_port)
+    return free_port
 
 
 THREE_WEEKS = 60 * 24 * 7 * 3
@@ -1247,8 +1470,6 @@ def generate_password(_: Context, silent: bool = False, dice: int = 6) -> str:
 def fuzzy_match(val1: str, val2: str, verbose: bool = False) -> float:
     """
     Get the similarity score between two values.
-
-    Used by `edwh settings -f ...` when no exact match was found.
     """
     similarity = fuzz.partial_ratio(val1, val2)
     if verbose:
@@ -1256,31 +1477,84 @@ def fuzzy_match(val1: str, val2: str, verbose: bool = False) -> float:
     return similarity
 
 
-def _settings(find: str | None, fuzz_threshold: int = 75) -> t.Iterable[tuple[str, t.Any]]:
-    all_settings = read_dotenv().items()
+def _settings(
+    find: str | None,
+    fuzz_threshold: int = DEFAULT_FUZZ_THRESHOLD,
+    limit: int | None = None,
+    search: tuple[list[tuple[str, t.Any]], SettingsSearch] | None = None,
+) -> list[tuple[str, t.Any]]:
+    """
+    Settings in the .env (or the prepared `search`) containing `find`, else the most similar ones.
+    """
+    all_settings, settings_search = search or _settings_search()
     if find is None:
         # don't loop
-        return all_settings
-    else:
-        find = find.upper()
-        # if nothing found exactly, try again but fuzzy (could be slower)
-        exact_match = [(k, v) for k, v in all_settings if find in k.upper() or find in v.upper()]
-        return exact_match or [(k, v) for k, v in all_settings if fuzzy_match(k.upper(), find) > fuzz_threshold]
+        return all_settings[:limit] if limit else all_settings
+
+    return [all_settings[idx] for idx in settings_search.find(find, fuzz_threshold, limit)]
+
+
+def _settings_search() -> tuple[list[tuple[str, t.Any]], SettingsSearch]:
+    all_settings = list(read_dotenv().items())
+    return all_settings, SettingsSearch(all_settings)
+
+
+def _all_project_settings(
+    c: Context,
+    find: str | None,
+    fuzz_threshold: int = DEFAULT_FUZZ_THRESHOLD,
+    limit: int | None = None,
+) -> list[tuple[str, str, str]]:
+    """
+    (project, setting, value) from every ../*/.env, like _settings.
+    """
+    index = adjacent_env_index(c)
+    if find is None:
+        return index.rows[:limit] if limit else index.rows
+
+    return [index.rows[idx] for idx in index.search.find(find, fuzz_threshold, limit)]
 
 
-# noinspection PyUnusedLocal
 @task(
-    help=dict(find="search for this specific setting", as_json="output as json dictionary"),
+    help=dict(
+        find="search for this specific setting",
+        as_json="output as json dictionary",
+        all_projects="search the .env files of all projects next to this one (../*/.env)",
+        limit="show at most this many settings (the best matches)",
+    ),
     flags={
         "as_json": ("j", "json", "as-json"),
         "fuzz_threshold": ("t", "fuzz-threshold"),
+        "all_projects": ("a", "all-projects"),
+        "limit": ("limit", "n"),
     },
 )
-def settings(_: Context, find: str | None = None, fuzz_threshold: int = 75, as_json: bool = False) -> None:
+def settings(
+    c: Context,
+    find: str | None = None,
+    fuzz_threshold: int = DEFAULT_FUZZ_THRESHOLD,
+    as_json: bool = False,
+    all_projects: bool = False,
+    limit: int = 0,
+) -> None:
     """
     Show all settings in .env file or search for a specific setting using -f/--find.
+
+    Without settings that contain the search text, the ones whose key or value resemble it most are shown, best first.
+    With --all-projects, the (matching) settings of every project in the parent directory are shown.
     """
-    rows = _settings(find, fuzz_threshold)
+    if all_projects:
+        project_rows = _all_project_settings(c, find, fuzz_threshold, limit)
+        if as_json:
+            by_project: dict[str, dict[str, str]] = defaultdict(dict)
+            for project, key, value in project_rows:
+                by_project[project][key] = value
+            print(json.dumps(by_project, indent=3))
+        else:
+            print(tabulate.tabulate(project_rows, headers=["Project", "Setting", "Value"]))
+        return
+
+    rows = _settings(find, fuzz_threshold, limit)
     if as_json:
         print(json.dumps(dict(rows), indent=3))
     else:
@@ -1291,8 +1565,9 @@ def show_related_settings(ctx: Context, services: list[str]) -> None:
     config = dc_config(ctx)
 
     rows: AnyDict = {}
+    search = _settings_search()
     for service in services:
-        if service_settings := _settings(service):
+        if service_settings := _settings(service, search=search):
             rows |= service_settings
         else:
             with contextlib.suppress(TypeError, KeyError):
@@ -1313,7 +1588,7 @@ def volumes(ctx: Context) -> None:
     stdout = ran.stdout if ran else ""
     for container_id in stdout.strip().split("\n"):
         with contextlib.suppress(EnvironmentError):
-            docker_info = docker_inspect(ctx, container_id)
+            docker_info = _docker_inspect(ctx, container_id)
             if not isinstance(docker_info, list):
                 continue
 
@@ -1381,6 +1656,56 @@ def get_paused_services_with_deps(ctx: Context, services: list[str]) -> list[str
     return [svc for svc in all_services if check_paused(ctx, svc)]
 
 
+def _smart_up(ctx: Context, services: list[str], stop_timeout: int, clean: bool, no_build: bool) -> list[str]:
+    """
+    Stop and recreate only the services `plan_services` reports as changed; returns those services.
+    """
+    changed = [_ for _ in plan_services(ctx, services, dc_config(ctx)) if _.changed]
+    if not changed:
+        cprint(f"All {len(services)} services are up to date.", "green")
+        return []
+
+    print_plan(changed)
+    if recreate_ls := " ".join(_.service for _ in changed if _.action == "recreate"):
+        ctx.run(f"{DOCKER_COMPOSE} stop -t {stop_timeout} {recreate_ls}")
+
+    # only ask for a build when a build context changed; missing images are still built by compose itself
+    build = not no_build and any(_.needs_build for _ in changed)
+    ctx.run(
+        f"{DOCKER_COMPOSE} up "
+        f"{'--renew-anon-volumes' if clean else ''} "
+        f"{'--build' if build else ''} "
+        f"-d {' '.join(_.service for _ in changed)}",
+        pty=True,
+    )
+
+    if build:
+        record_builds(_ for _ in changed if _.needs_build)
+
+    return [_.service for _ in changed]
+
+
+@contextlib.contextmanager
+def _compose_env(**values: str) -> t.Generator[None, None, None]:
+    """
+    Let docker compose interpolate `values` instead of what the .env says, without writing the .env.
+
+    Compose prefers the shell environment over the .env file.
+    """
+    previous = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    invocation_cache.invalidate(COMPOSE_CONFIG)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        invocation_cache.invalidate(COMPOSE_CONFIG)
+
+
 # noinspection PyShadowingNames
 
 
@@ -1392,10 +1717,14 @@ def get_paused_services_with_deps(ctx: Context, services: list[str]) -> list[str
         stop_timeout="timeout for stopping services, defaults to 2 seconds",
         tail="tails the log of restart services, defaults to False",
         clean="adds `--renew-anon-volumes --build` to `docker-compose up` command ",
+        smart="only stop and recreate services whose config, image or build context changed",
+        plan="show what --smart would recreate and why, without changing anything",
+        as_json="with --plan: output the plan as json",
     ),
     iterable=["service"],
     flags={
         "tail": ("tail", "logs", "l"),  # instead of -a; NOTE: 'tail' must be first (matches parameter name)
+        "as_json": ("j", "json", "as-json"),
     },
     hookable=True,
 )
@@ -1409,15 +1738,34 @@ def up(
     clean: bool = False,
     show_settings: bool = True,
     wait: bool = False,
+    smart: bool = False,
+    plan: bool = False,
+    as_json: bool = False,
 ) -> dict:
-    """Restart (or down;up) some or all services, after an optional rebuild."""
+    """
+    Restart (or down;up) some or all services, after an optional rebuild.
+
+    Plugins hooking into `up` get the services that were (re)started: with --smart only the recreated ones.
+    """
     config = TomlConfig.load()
-    # recalculate the hash and save it, so with the next up, migrate will see differences and start migration
-    set_env_value(DEFAULT_DOTENV_PATH, "SCHEMA_VERSION", calculate_schema_hash())
     # test for --service arguments, if none given: use defaults
     services = service_names(service or (config.services_minimal if config else []))
     services_ls = " ".join(services)
 
+    if plan:
+        # plan with the SCHEMA_VERSION a real up would write, so the config hashes match what --smart compares
+        with _compose_env(SCHEMA_VERSION=calculate_schema_hash(quiet=True)):
+            print_plan(plan_services(ctx, services, dc_config(ctx)), as_json=as_json)
+        # nothing was started (or written), so there is nothing for plugins to act on either
+        return {
+            "services": [],
+        }
+
+    # recalculate the hash and save it, so with the next up, migrate will see differences and start migration
+    schema_hash = calculate_schema_hash()
+    # .env (and its mtime) is left alone when the hash didn't change
+    set_env_value(DEFAULT_DOTENV_PATH, "SCHEMA_VERSION", schema_hash)
+
     # Check for paused containers and unpause them
     if paused_services := get_paused_services_with_deps(ctx, services):
         paused_ls = " ".join(paused_services)
@@ -1426,8 +1774,11 @@ def up(
         # unpaused containers often get unhealthy so also stop them:
         ctx.run(f"{DOCKER_COMPOSE} stop {paused_ls}", pty=True)
 
+    started = services
     if quickest:
         ctx.run(f"{DOCKER_COMPOSE} restart {services_ls}")
+    elif smart:
+        started = _smart_up(ctx, services, stop_timeout=stop_timeout, clean=clean, no_build=no_build)
     else:
         ctx.run(f"{DOCKER_COMPOSE} stop -t {stop_timeout}  {services_ls}")
         # note: checking if build is required due to outdated versions seems undoable, docker has no api for it
@@ -1441,6 +1792,8 @@ def up(
             pty=True,
         )
 
+    invocation_cache.invalidate(CONTAINERS)
+
     if show_settings:
         show_related_settings(ctx, services)
     if tail:
@@ -1450,7 +1803,7 @@ def up(
 
     # local/plugin up happens here because of `hookable`
     return {
-        "services": services,
+        "services": started,
     }
 
 
@@ -1460,10 +1813,10 @@ def inspect_health(ctx, container: str, quiet: bool = False) -> dict:
     result = {}
 
     with contextlib.suppress(OSError):
-        container_ids = find_container_ids(ctx, container) or [container]
+        container_ids = _find_container_ids(ctx, container) or [container]
 
         for container_id in container_ids:
-            result[container_id] = docker_inspect(ctx, container_id, '--format "{{json .State.Health }}"')
+            result[container_id] = _docker_inspect(ctx, container_id, '--format "{{json .State.Health }}"')
 
     if result and not quiet:
         print(tab + yaml.dump(result, allow_unicode=True).replace("\n", f"\n{tab}"))
@@ -1477,6 +1830,7 @@ def inspect_health(ctx, container: str, quiet: bool = False) -> dict:
 def wait_until_healthy(ctx: Context, services: t.Iterable[str] = (), quiet: bool = False):
     initial_length = 0
     # for every container with a health check, wait for it to be either healthy or dead (not starting)
+    # get_healths always asks docker, so every round sees the latest state
     while missing := [_.container for _ in get_healths(ctx, *services) if _ and _.health == "starting"]:
         if not quiet:
             msg = f" Waiting for {missing}" + " " * 25
@@ -1996,6 +2350,7 @@ def stop(ctx: Context, service: t.Collection[str] | None = None) -> None:
     """
     service = service_names(service or [])
     ctx.run(f"{DOCKER_COMPOSE} stop {' '.join(service)}")
+    invocation_cache.invalidate(CONTAINERS)
 
 
 @task(
@@ -2010,12 +2365,28 @@ def down(ctx: Context, service: t.Collection[str] | None = None) -> None:
     service = service_names(service or []) if service else []
 
     ctx.run(f"{DOCKER_COMPOSE} down {' '.join(service)}", pty=True)
+    invocation_cache.invalidate(CONTAINERS)
 
 
 @task(
     iterable=["service"],
+    help=dict(
+        service="Service to restart, can be used multiple times, handles wildcards.",
+        quiet="Don't show the logs afterwards.",
+        force="Send SIGTERM (and SIGKILL if that fails) instead of SIGINT.",
+        strategy="parallel (default): signal all containers at once; "
+        "rolling: one replica at a time, waiting until it is healthy again.",
+        timeout="Rolling only: how many seconds to wait for a replica to become healthy.",
+    ),
 )
-def restart(c: Context, service: t.Collection[str] | None = None, quiet: bool = False, force: bool = False):
+def restart(
+    c: Context,
+    service: t.Collection[str] | None = None,
+    quiet: bool = False,
+    force: bool = False,
+    strategy: str = "parallel",
+    timeout: int = 120,
+):
     """
     Restart Docker services by sending termination signals (ctrl-c/SIGINT; if force: SIGKILL, SIGTERM).
 
@@ -2028,6 +2399,9 @@ def restart(c: Context, service: t.Collection[str] | None = None, quiet: bool =
             the 'py4web' service.
         quiet (bool): A flag indicating whether to suppress logs display after restarting services.
         force: send SIGKILL + SIGTERM instead of SIGINT
+        strategy: 'parallel' signals every container at once,
+            'rolling' restarts replicas one by one and waits for each to be healthy before the next.
+        timeout: seconds to wait per replica with the rolling strategy
 
     Raises:
         Executes a system command to restart the desired services.
@@ -2036,31 +2410,165 @@ def restart(c: Context, service: t.Collection[str] | None = None, quiet: bool =
     Returns:
         None
     """
+    if strategy not in RESTART_STRATEGIES:
+        cprint(f"Unknown strategy {strategy!r}, choose from {', '.join(RESTART_STRATEGIES)}.", "red")
+        exit(1)
+
     service = service_names(service or ["py4web"])
 
-    service_filter = "|".join(service)
-    kill = "kill -15 1 || kill -9 1" if force else "kill -2 1"
-    command = (
-        'docker ps --filter "name=%(name)s" --format "{{.Names}}" | '
-        'xargs -I {} docker exec {} sh -c "%(kill)s"' % dict(name=service_filter, kill=kill)
-    )
+    if not (targets := restart_targets(c, service)):
+        cprint(f"No running containers found for {', '.join(service)}.", "yellow")
+        return
 
-    c.run(command)
+    if strategy == "rolling":
+        results = restart_rolling(c, targets, force=force, timeout=timeout)
+    else:
+        results = restart_parallel(c, targets, force=force)
+
+    invocation_cache.invalidate(CONTAINERS)
+    print_restart_results(results, targets)
+
+    if not all(result.ok for result in results) or len(results) < len(targets):
+        exit(1)
 
     if not quiet:
         start_logs(c, service)
 
 
+def pull_images(
+    ctx: Context,
+    services: t.Collection[str] | None = None,
+    jobs: int = DEFAULT_PULL_JOBS,
+    retries: int = 3,
+) -> list[PullResult]:
+    """
+    Pull the registry images of (selected) services that changed upstream, and show what happened.
+    """
+    images = pullable_images(dc_config(ctx), services or None)
+    if not images:
+        return []
+
+    cprint(f"Checking {len(images)} image(s) for updates...", "blue")
+    results = schedule_pulls(DockerRegistry(ctx), images, jobs=jobs, retries=retries)
+    print_pull_results(results)
+    return results
+
+
 @task(
+    help=dict(
+        build="Build images (whose build context changed) instead of pulling them.",
+        jobs="How many images to pull at the same time.",
+        retries="How often to retry a failing pull (with exponential backoff).",
+    ),
     hookable=True,
 )
-def upgrade(ctx: Context, build: bool = False) -> None:
+def upgrade(ctx: Context, build: bool = False, jobs: int = DEFAULT_PULL_JOBS, retries: int = 3) -> None:
+    """
+    Get new images and recreate only the services whose image actually changed.
+
+    The stack is always brought up at the end, also when nothing changed.
+    Exits with an error when an image could not be pulled (after `retries`),
+    after recreating the services that did get a new image.
+    """
+    failed: list[str] = []
     if build:
-        ctx.run(f"{DOCKER_COMPOSE} build")
+        changed = run_builds(ctx, select_builds(ctx))
     else:
-        ctx.run(f"{DOCKER_COMPOSE} pull")
-    stop(ctx)
+        results = pull_images(ctx, jobs=jobs, retries=retries)
+        changed = updated_services(results)
+        failed = failed_pulls(results)
+
+    if changed:
+        cprint(f"Recreating {', '.join(changed)}", "blue")
+        stop(ctx, service=changed)
+    elif not failed:
+        cprint("No new images, nothing to recreate.", "green")
+
     ctx.run(f"{DOCKER_COMPOSE} up -d")
+    invocation_cache.invalidate(CONTAINERS)
+
+    if failed:
+        cprint(f"Could not pull {', '.join(failed)}.", "red")
+        exit(1)
+
+
+def select_builds(
+    ctx: Context,
+    services: t.Collection[str] | None = None,
+    force: bool = False,
+    why: bool = False,
+) -> list[BuildCheck]:
+    """
+    Which (selected) services need an image build: those whose build context changed, or all of them with `force`.
+    """
+    registry = DockerRegistry(ctx)
+    checks = check_builds(dc_config(ctx), services or None, lambda tag: registry.image_id(tag) is not None)
+
+    if why:
+        for check in checks:
+            cprint(check.service, "yellow" if check.changed else "green")
+            for reason in check.reasons or ["up to date"]:
+                print(f"  {reason}")
+
+    return checks if force else [_ for _ in checks if _.changed]
+
+
+def run_builds(ctx: Context, checks: list[BuildCheck], jobs: int = 0, no_cache: bool = False) -> list[str]:
+    """
+    Build the images for `checks` in one `docker compose build` and record their context digests.
+
+    `jobs` limits how many images compose builds at the same time (0 = compose's default).
+    Bake ignores that limit, so compose only builds with bake when no `jobs` are given.
+    """
+    if not checks:
+        cprint("All images are up to date, nothing to build (use --force to build anyway).", "green")
+        return []
+
+    env = dict(COMPOSE_PARALLEL_LIMIT=str(jobs)) if jobs else dict(COMPOSE_BAKE="true")
+
+    services = [_.service for _ in checks]
+    ctx.run(
+        f"{DOCKER_COMPOSE} build {'--no-cache' if no_cache else ''} {' '.join(services)}",
+        pty=True,
+        env=env,
+    )
+
+    BuildDigests().record({_.image_tag: _.current for _ in checks})
+    return services
+
+
+def compile_changed_requirements(
+    ctx: Context,
+    pip_compile: Task,
+    reqs: list[Path],
+    yes: bool = False,
+    jobs: int = 0,
+) -> None:
+    """
+    Ask (unless `yes`) which missing/outdated requirements.in files to compile, then compile those in parallel.
+    """
+    todo = []
+    rows: list[tuple[str, str, str]] = []
+    for check in check_requirements(reqs):
+        if check.status == "current":
+            rows.append((str(check.path), "still current", ""))
+            continue
+
+        cprint(f"{check.path}: {', '.join(check.reasons)}", "blue")
+        question = f"compile {check.path}? [Yn]" if check.status == "missing" else f"recompile {check.path}? [Yn]"
+        if yes or confirm(question, default=True):
+            todo.append(check)
+        else:
+            rows.append((str(check.path), "skipped", ""))
+
+    if todo:
+        cprint(f"Compiling {len(todo)} requirements file(s)...", "blue")
+
+    for result in compile_requirements(todo, lambda directory: pip_compile(ctx, str(directory)), jobs=jobs):
+        color: Color = "green" if result.result == "compiled" else "red"
+        rows.append((str(result.path), colored(result.result, color), f"{result.seconds:.1f}s"))
+
+    print(tabulate.tabulate(sorted(rows), headers=["Requirements", "Result", "Time"]))
 
 
 @task(
@@ -2068,15 +2576,35 @@ def upgrade(ctx: Context, build: bool = False) -> None:
         yes="Don't ask for confirmation, just do it. "
         "(unless requirements.in files are found and the `edwh-pipcompile-plugin` is not installed)",
         skip_compile="Skip the compilation of requirements.in files to requirements.txt files (e.g. for PRD).",
+        force="Build every image, not only the ones whose build context changed.",
+        why="Show per service what changed in its build context since the last build.",
+        jobs="How many images to build at the same time (default: all at once, with bake).",
+        compile_jobs="How many directories with requirements.in files to compile at once (defaults to one per cpu).",
+        pull_jobs="How many images to pull at the same time.",
+        ignore_pull_failures="Build anyway when an image could not be pulled (with the local, maybe outdated, one).",
     ),
     hookable=True,
 )
-def build(ctx: Context, yes: bool = False, skip_compile: bool = False, pull: bool = True) -> None:
+def build(
+    ctx: Context,
+    yes: bool = False,
+    skip_compile: bool = False,
+    pull: bool = True,
+    force: bool = False,
+    why: bool = False,
+    jobs: int = 0,
+    compile_jobs: int = 0,
+    pull_jobs: int = DEFAULT_PULL_JOBS,
+    ignore_pull_failures: bool = False,
+) -> None:
     """
-    Build all services.
+    Build all services whose build context changed.
+
+    Stops with an error before building when an image could not be pulled, unless `ignore_pull_failures`.
 
     Will test for the presence of `edwh-pipcompile-plugin` and use it to compile
-    requirements.in files to requirements.txt files in child directories.
+    requirements.in files to requirements.txt files in child directories,
+    but only those whose content (or -r/-c includes) changed since the last compile.
     """
     # Path.cwd() uses absolute paths, Path() is the same but relative
     reqs = list(Path().rglob("*/*.in"))
@@ -2101,26 +2629,7 @@ def build(ctx: Context, yes: bool = False, skip_compile: bool = False, pull: boo
     if not reqs:
         cprint("No .in files found to compile!", "yellow")
     elif with_compile and pip_compile is not None and is_dev:
-        for idx, req in enumerate(reqs, 1):
-            reqtxt = req.parent / "requirements.txt"
-            cprint(
-                f"{idx}/{len(reqs)}: working on {req}",
-                "blue",
-            )
-            missing = not reqtxt.exists()
-            outdated = not missing and reqtxt.stat().st_ctime < req.stat().st_ctime
-
-            if missing or outdated:
-                print("The .txt file is outdated." if outdated else "requirements.txt doesn't exist.")
-
-                question = f"compile {req}? [Yn]"
-                if outdated:
-                    question = f"re{question}"  # recompile
-
-                if yes or confirm(question, default=True):
-                    pip_compile(ctx, str(req.parent))
-            else:
-                print("still current")
+        compile_changed_requirements(ctx, pip_compile, reqs, yes=yes, jobs=compile_jobs)
     else:
         print("Compilation of requirements.in files skipped.")
 
@@ -2128,16 +2637,20 @@ def build(ctx: Context, yes: bool = False, skip_compile: bool = False, pull: boo
     prompt = "Pull and build docker images? [yN]" if pull else "Build docker images? [yN]"
 
     if yes or is_dev or confirm(prompt, default=False):
-        if pull:
-            ctx.run(f"{DOCKER_COMPOSE} pull --ignore-buildable", pty=True)
+        if pull and (failed := failed_pulls(pull_images(ctx, jobs=pull_jobs))):
+            cprint(f"Could not pull {', '.join(failed)}.", "red")
+            if not ignore_pull_failures:
+                exit(1)
 
-        ctx.run(f"{DOCKER_COMPOSE} build", pty=True, env=dict(COMPOSE_BAKE="true"))
+        run_builds(ctx, select_builds(ctx, force=force, why=why), jobs=jobs)
 
 
 @task(
     help=dict(
         service="Service to rebuild, can be used multiple times, handles wildcards.",
-        force_rebuild="uses --no-cache option for docker-compose build",
+        force_rebuild="uses --no-cache option for docker-compose build, and rebuilds even unchanged services",
+        why="Show per service what changed in its build context since the last build.",
+        jobs="How many images to build at the same time (default: all at once, with bake).",
     ),
     iterable=["service"],
 )
@@ -2145,16 +2658,19 @@ def rebuild(
     ctx: Context,
     service: t.Collection[str] | None = None,
     force_rebuild: bool = False,
+    why: bool = False,
+    jobs: int = 0,
 ) -> None:
     """
-    Downs ALL services, then rebuilds services using docker-compose build.
+    Removes the containers of services whose build context changed, then rebuilds them using docker-compose build.
     """
-    ctx.run(f"{DOCKER_COMPOSE} down")
-    services = service_names(service)
+    checks = select_builds(ctx, service_names(service), force=force_rebuild, why=why)
 
-    cache_flag = "--no-cache" if force_rebuild else ""
-    services_str = " ".join(services)
-    ctx.run(f"{DOCKER_COMPOSE} build {cache_flag} {services_str}")
+    if checks:
+        ctx.run(f"{DOCKER_COMPOSE} rm --stop --force {' '.join(_.service for _ in checks)}")
+        invocation_cache.invalidate(CONTAINERS)
+
+    run_builds(ctx, checks, jobs=jobs, no_cache=force_rebuild)
 
 
 @task()
@@ -2302,8 +2818,25 @@ def show_help(ctx: Context, about: str) -> None:
         "short": "Oneline summary",
         "show_settings": "show settings per folder",
         "as_json": "output json",
+        "jobs": "How many projects to discover at the same time",
+        "du_top": "With --du: also show the N largest subdirectories per folder",
+        "du_cache": "With --du: reuse totals of folders that didn't change since the previous --du-cache run",
+        "cached": "Answer from the inventory of the previous run, without scanning anything",
+        "refresh": "Only rescan projects whose compose files, .env or .toml files changed since the previous run",
+        "find_domain": "Only show which project, service and traefik router serve this domain",
+        "ndjson": "Output one json line per project, as soon as it's done (in any order)",
     },
-    flags={"show_settings": ("settings", "show-settings"), "as_json": ("j", "json", "as-json")},  # -s is for short
+    flags={
+        "show_settings": ("settings", "show-settings"),
+        "as_json": ("j", "json", "as-json"),
+        "jobs": ("jobs",),
+        "du_top": ("du-top",),
+        "du_cache": ("du-cache",),
+        "cached": ("cached",),
+        "refresh": ("refresh",),
+        "find_domain": ("find-domain",),
+        "ndjson": ("ndjson",),
+    },  # -s is for short, -j for json
 )
 def task_discover(
     ctx: Context,
@@ -2314,11 +2847,23 @@ def task_discover(
     short: bool = False,
     show_settings: bool = False,
     as_json: bool = False,
+    jobs: int = DEFAULT_DISCOVER_JOBS,
+    du_top: int = 0,
+    du_cache: bool = False,
+    cached: bool = False,
+    refresh: bool = False,
+    find_domain: str = "",
+    ndjson: bool = False,
 ) -> None:
     """Discover docker environments per host.
 
     Use ansi2txt to save readable output to a file.
     """
+    if find_domain:
+        if not find_domain_for(ctx, find_domain, jobs=jobs, as_json=as_json):
+            exit(1)
+        return None
+
     return discover(
         ctx,
         du=du,
@@ -2328,6 +2873,12 @@ def task_discover(
         short=short,
         as_json=as_json,
         settings=show_settings,
+        jobs=jobs,
+        du_top=du_top,
+        du_cache=du_cache,
+        cached=cached,
+        refresh=refresh,
+        ndjson=ndjson,
     )
 
 
@@ -2353,6 +2904,7 @@ def migrations(ctx: Context) -> None:
 
 def stop_remove_container(ctx: Context, container_name: str) -> bool:
     ran = ctx.run(f"{DOCKER_COMPOSE} rm -vf --stop {container_name}", warn=True)
+    invocation_cache.invalidate(CONTAINERS)
     return bool(ran and ran.ok)
 
 
@@ -2398,7 +2950,7 @@ def clean_postgres(ctx: Context, yes: bool = False) -> None:
     assert config, "Couldn't set up toml config -> can't continue clean!"
 
     # find the images based on the instances
-    containers = find_containers_ids(ctx, *config.services_db)
+    containers = {name: _find_container_ids(ctx, name) for name in config.services_db}
     pg_data_volumes = []
     for container_name, container_ids in containers.items():
         if not container_ids:
@@ -2406,7 +2958,7 @@ def clean_postgres(ctx: Context, yes: bool = False) -> None:
             continue
 
         for container_id in container_ids:
-            docker_info = docker_inspect(ctx, container_id)
+            docker_info = _docker_inspect(ctx, container_id)
             if not isinstance(docker_info, list):
                 continue
 
@@ -2469,6 +3021,7 @@ def wipe_db(ctx: Context, clean_all: bool = False, flag_path: str = "migrate/fla
     """
     # 1 + 2. just 'create' without starting anything:
     ctx.run(f"{DOCKER_COMPOSE} create")
+    invocation_cache.invalidate(CONTAINERS)
 
     # 3. start cleaning up
     for p in Path(flag_path).glob("migrate-*.complete"):
@@ -2524,6 +3077,175 @@ def sleep(_: Context, n: str) -> None:
     print("\r", "Sleeping for: 0 seconds", end="\n")
 
 
+def parse_batch_lines(text: str) -> list[list[str]]:
+    """
+    One edwh command line per line: `wipe-db migrate up`, optionally prefixed with `edwh`/`ew`.
+
+    Empty lines and # comments are skipped.
+    """
+    commands = []
+    for line in text.splitlines():
+        argv = shlex.split(line, comments=True)
+        if argv and argv[0] in {"edwh", "ew"}:
+            argv = argv[1:]
+        if argv:
+            commands.append(argv)
+    return commands
+
+
+def run_in_process(argv: list[str]) -> int:
+    """
+    Run an edwh command line in this interpreter and return its exit code.
+    """
+    from .cli import program  # cli imports this module
+
+    try:
+        program.run(["edwh", *argv])
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        # one broken command shouldn't take the rest of the batch (and its summary) down
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+@task(
+    help=dict(
+        file="File with one edwh command per line (- for stdin).",
+        keep_going="Continue with the next line after a failure.",
+    ),
+)
+def batch(_: Context, file: str, keep_going: bool = False) -> None:
+    """
+    Run many edwh commands in one process, so docker queries and parsed files are shared between them.
+
+    Example file:
+        # recover the dev database
+        wipe-db --yes
+        migrate
+        up -s py4web
+    """
+    text = sys.stdin.read() if file == "-" else Path(file).read_text()
+    commands = parse_batch_lines(text)
+
+    rows = []
+    failed = False
+    for idx, argv in enumerate(commands, 1):
+        cprint(f"[{idx}/{len(commands)}] edwh {shlex.join(argv)}", "blue")
+        started = time.monotonic()
+        code = run_in_process(argv)
+        rows.append(
+            (
+                shlex.join(argv),
+                colored(str(code), "green" if code == 0 else "red"),
+                f"{time.monotonic() - started:.1f}s",
+            )
+        )
+
+        if code:
+            failed = True
+            if not keep_going:
+                break
+
+    print()
+    print(tabulate.tabulate(rows, headers=["Command", "Exit", "Time"]))
+    cprint(f"cache: {invocation_cache.hits} hits, {invocation_cache.misses} misses", "dark_grey")
+
+    if failed:
+        exit(1)
+
+
+def command_remainder() -> str:
+    """
+    Everything after ` -- ` on the command line (invoke parses it, but doesn't hand it to tasks).
+    """
+    from .cli import program  # cli imports this module
+
+    return program.remainder
+
+
+@task(
+    help=dict(
+        glob="Which directories to run in (only those with a docker-compose file are used), e.g. '../*'.",
+        jobs="How many projects to run at the same time.",
+        command="The edwh command to run, instead of passing it after ` -- `.",
+    ),
+)
+def each(_: Context, glob: str = "*", jobs: int = DEFAULT_EACH_JOBS, command: str = "") -> None:
+    """
+    Run an edwh command in every matching compose project, a few projects at a time.
+
+    Usage:
+        edwh each --glob '../*' --jobs 8 -- upgrade
+    """
+    if not (argv := shlex.split(command or command_remainder())):
+        cprint("Nothing to run, usage: edwh each --glob '../*' -- <command>", "red")
+        exit(1)
+
+    if not (projects := find_projects(glob)):
+        cprint(f"No compose projects found matching {glob!r}.", "yellow")
+        return
+
+    cprint(f"Running `edwh {shlex.join(argv)}` in {len(projects)} projects, {jobs} at a time", "blue")
+    runs = run_each(projects, argv, jobs=jobs)
+
+    print()
+    print_each_summary(runs)
+
+    if failed := [run for run in runs if not run.ok]:
+        cprint(f"{len(failed)}/{len(runs)} projects failed.", "red")
+        exit(1)
+
+
+@task(
+    help=dict(
+        what=f"What to ask every host, comma separated: {', '.join(FLEET_COMMANDS)}.",
+        hosts="Inventory toml file (see `edwh.fleet`) or a comma separated list of hosts.",
+        jobs="How many hosts to query at the same time.",
+        timeout="Seconds before a host counts as failed (connecting and per command).",
+        show_all="health: also show healthy containers.",
+        as_json="Output json instead of tables.",
+    ),
+    flags={"as_json": ("json", "as-json")},  # -j is --jobs
+)
+def fleet(
+    _: Context,
+    what: str,
+    hosts: str = "inventory.toml",
+    jobs: int = DEFAULT_FLEET_JOBS,
+    timeout: int = DEFAULT_FLEET_TIMEOUT,
+    show_all: bool = False,
+    as_json: bool = False,
+) -> None:
+    """
+    Run discover, health or ps on many hosts at once and merge the results.
+
+    Usage:
+        edwh fleet health --hosts inventory.toml
+        edwh fleet discover,ps --hosts web1,web2 --json
+    """
+    names = [name.strip() for name in what.split(",") if name.strip()]
+    if not names or any(name not in FLEET_COMMANDS for name in names):
+        cprint(f"Unknown fleet command in {what!r}, choose from {', '.join(FLEET_COMMANDS)}.", "red")
+        exit(1)
+
+    if not (specs := load_inventory(hosts)):
+        cprint(f"No hosts found in {hosts!r}.", "yellow")
+        return
+
+    with ConnectionPool(connect_timeout=timeout) as pool:
+        results = run_fleet(pool, specs, names, jobs=jobs, timeout=timeout)
+
+    if as_json:
+        print(json.dumps(fleet_as_json(results), indent=2, default=dump_set_as_list))
+    else:
+        print_fleet(results, names, show_all=show_all)
+
+    if not all(result.ok for result in results):
+        exit(1)
+
+
 def find_ruff() -> str:
     """
     Use ruff's own logic to find the required binary.
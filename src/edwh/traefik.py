@@ -0,0 +1,223 @@
+"""
+Hosts from traefik router rules, and an index from domain to the project/service/router that serves it.
+
+Rules are parsed properly instead of grabbing everything between backticks, so
+Host(`a`, `b`), HostRegexp and HostSNI work, and hosts in a negated matcher (!Host(`x`)) are left out:
+
+    Host(`a.example.com`) || (Host(`b.example.com`, `c.example.com`) && PathPrefix(`/api`))
+"""
+
+import re
+import typing as t
+from collections import defaultdict
+from dataclasses import dataclass
+
+from .helpers import AnyDict
+
+HOST_MATCHERS = {"Host", "HostHeader", "HostSNI"}
+REGEXP_MATCHERS = {"HostRegexp", "HostSNIRegexp"}
+
+TOKEN_RE = re.compile(r"""\s*(?:(?P<op>&&|\|\||!|\(|\)|,)|(?P<string>`[^`]*`|"[^"]*"|'[^']*')|(?P<name>[A-Za-z]+))""")
+ROUTER_LABEL_RE = re.compile(r"^traefik\.(?:http|tcp|udp)\.routers\.(?P<router>[^.]+)\.rule$")
+# traefik v2 HostRegexp placeholders: {subdomain:[a-z]+} or just {subdomain}; not quantifiers like {2,3}
+PLACEHOLDER_RE = re.compile(r"\{(?P<name>[A-Za-z_]\w*)(?::(?P<pattern>(?:[^{}]|\{[^{}]*\})+))?\}")
+
+
+class RuleSyntaxError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class HostMatch:
+    host: str  # a domain, or a HostRegexp pattern
+    regexp: bool = False
+
+
+class RouterDict(t.TypedDict):
+    hosts: list[str]
+    regexps: list[str]
+
+
+def tokenize(rule: str) -> list[tuple[str, str]]:
+    tokens = []
+    position = 0
+    rule = rule.strip()
+    while position < len(rule):
+        if not (match := TOKEN_RE.match(rule, position)):
+            raise RuleSyntaxError(f"unexpected {rule[position:]!r}")
+        kind = t.cast(str, match.lastgroup)
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+class RuleParser:
+    """
+    Recursive descent over `expr := term ('||' term)*`, `term := factor ('&&' factor)*`,
+    `factor := '!' factor | '(' expr ')' | Matcher(args)`, collecting the hosts of matchers that aren't negated.
+    """
+
+    def __init__(self, rule: str) -> None:
+        self.tokens = tokenize(rule)
+        self.position = 0
+        self.hosts: list[HostMatch] = []
+
+    def peek(self) -> str | None:
+        return self.tokens[self.position][1] if self.position < len(self.tokens) else None
+
+    def next(self, what: str) -> tuple[str, str]:
+        if self.position >= len(self.tokens):
+            raise RuleSyntaxError(f"expected {what} at the end of the rule")
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def take(self, expected: str) -> None:
+        if (token := self.next(repr(expected))[1]) != expected:
+            raise RuleSyntaxError(f"expected {expected!r}, got {token!r}")
+
+    def parse(self) -> list[HostMatch]:
+        self.expr(negated=False)
+        if self.position != len(self.tokens):
+            raise RuleSyntaxError(f"unexpected {self.peek()!r}")
+        return self.hosts
+
+    def expr(self, negated: bool) -> None:
+        self.term(negated)
+        while self.peek() == "||":
+            self.take("||")
+            self.term(negated)
+
+    def term(self, negated: bool) -> None:
+        self.factor(negated)
+        while self.peek() == "&&":
+            self.take("&&")
+            self.factor(negated)
+
+    def factor(self, negated: bool) -> None:
+        if self.peek() == "!":
+            self.take("!")
+            return self.factor(not negated)
+        elif self.peek() == "(":
+            self.take("(")
+            self.expr(negated)
+            self.take(")")
+            return None
+
+        kind, matcher = self.next("a matcher")
+        if kind != "name":
+            raise RuleSyntaxError(f"expected a matcher, got {matcher!r}")
+        arguments = self.arguments()
+        if not negated and (matcher in HOST_MATCHERS or matcher in REGEXP_MATCHERS):
+            self.hosts.extend(HostMatch(argument, matcher in REGEXP_MATCHERS) for argument in arguments)
+        return None
+
+    def arguments(self) -> list[str]:
+        self.take("(")
+        arguments = []
+        while self.peek() != ")":
+            kind, value = self.next("an argument")
+            if kind != "string":
+                raise RuleSyntaxError(f"expected a quoted argument, got {value!r}")
+            arguments.append(value[1:-1])
+            if self.peek() == ",":
+                self.take(",")
+        self.take(")")
+        return arguments
+
+
+def rule_hosts(rule: str) -> list[HostMatch]:
+    return RuleParser(rule).parse()
+
+
+def service_routers(docker_service: AnyDict) -> dict[str, RouterDict]:
+    """
+    Router name: the hosts (and HostRegexp patterns) it matches, for every traefik rule label of a compose service.
+
+    Labels that aren't valid rules are skipped (traefik would refuse them too).
+    """
+    routers: dict[str, RouterDict] = {}
+    for label, value in (docker_service.get("labels") or {}).items():
+        if "Host" not in str(value):
+            continue
+        router = match.group("router") if (match := ROUTER_LABEL_RE.match(label)) else label
+        try:
+            matches = rule_hosts(str(value))
+        except RuleSyntaxError:
+            continue
+        if matches:
+            routers[router] = {
+                "hosts": [_.host for _ in matches if not _.regexp],
+                "regexps": [_.host for _ in matches if _.regexp],
+            }
+    return routers
+
+
+def host_regexp(pattern: str) -> re.Pattern[str]:
+    """
+    A HostRegexp argument as a Python regex: traefik v2 style (`{sub:[a-z]+}.example.com`) or v3 (a plain regex).
+    """
+    if not PLACEHOLDER_RE.search(pattern):
+        return re.compile(pattern, re.IGNORECASE)
+
+    parts = []
+    position = 0
+    for match in PLACEHOLDER_RE.finditer(pattern):
+        parts.append(re.escape(pattern[position : match.start()]))
+        parts.append(f"(?:{match.group('pattern') or '[^.]+'})")
+        position = match.end()
+    parts.append(re.escape(pattern[position:]))
+    return re.compile("".join(parts), re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Route:
+    domain: str
+    project: str
+    service: str
+    router: str
+    regexp: bool = False
+
+
+class DomainIndex:
+    """
+    Domain -> routes, built from discover data (projects with services with `routers`).
+    """
+
+    def __init__(self) -> None:
+        self.exact: dict[str, list[Route]] = defaultdict(list)
+        self.patterns: list[tuple[re.Pattern[str], Route]] = []
+
+    @classmethod
+    def from_projects(cls, projects: t.Iterable[AnyDict]) -> "DomainIndex":
+        index = cls()
+        for project in projects:
+            for service in project.get("services", []):
+                for router, matches in (service.get("routers") or {}).items():
+                    for host in matches["hosts"]:
+                        index.add(Route(host, project["name"], service["name"], router))
+                    for pattern in matches["regexps"]:
+                        index.add(Route(pattern, project["name"], service["name"], router, regexp=True))
+        return index
+
+    def add(self, route: Route) -> None:
+        if not route.regexp:
+            self.exact[route.domain.lower()].append(route)
+            return
+
+        try:
+            self.patterns.append((host_regexp(route.domain), route))
+        except re.error:
+            # traefik would refuse this router as well
+            return
+
+    def find(self, domain: str) -> list[Route]:
+        domain = domain.lower().removeprefix("https://").removeprefix("http://").split("/")[0]
+        if routes := self.exact.get(domain):
+            return routes
+        return [route for pattern, route in self.patterns if pattern.fullmatch(domain)]
+
+    def duplicates(self) -> dict[str, list[Route]]:
+        """
+        Domains that more than one project claims (traefik picks one of them, by rule length).
+        """
+        return {domain: routes for domain, routes in self.exact.items() if len({route.project for route in routes}) > 1}
@@ -0,0 +1,11 @@
+import pytest
+
+from src.edwh.memo import invocation_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_invocation_cache():
+    # every test is its own `edwh` invocation
+    invocation_cache.invalidate()
+    yield
+    invocation_cache.invalidate()
@@ -0,0 +1,105 @@
+"""
+What counts as a change to a build context, and what `build --why` says about it.
+"""
+
+import hashlib
+
+import pytest
+
+from src.edwh.build_context import (
+    BuildDigests,
+    check_builds,
+    context_digest,
+    context_files,
+    is_ignored,
+    parse_dockerignore,
+)
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def context(tmp_path):
+    context = tmp_path / "web"
+    (context / "app").mkdir(parents=True)
+    (context / "node_modules" / "left-pad").mkdir(parents=True)
+    (context / "Dockerfile").write_text("FROM python\n")
+    (context / "app" / "main.py").write_text("print('hi')\n")
+    (context / "README.md").write_text("# web\n")
+    (context / "node_modules" / "left-pad" / "index.js").write_text("//\n")
+    (context / ".dockerignore").write_text("node_modules\n*.md\n!README.md\n**/*.pyc\n")
+    return context
+
+
+def config(context, **build):
+    return {"name": "demo", "services": {"web": {"build": {"context": str(context), **build}}, "db": {"image": "pg"}}}
+
+
+@pytest.mark.parametrize(
+    ("path", "ignored"),
+    [
+        ("node_modules", True),
+        ("node_modules/left-pad/index.js", True),
+        ("CHANGELOG.md", True),
+        ("README.md", False),
+        ("docs/guide.md", False),
+        ("app/__pycache__/main.pyc", True),
+        ("main.pyc", True),
+        ("app/main.py", False),
+    ],
+)
+def test_dockerignore_semantics(path, ignored):
+    patterns = parse_dockerignore("# comment\nnode_modules\n*.md\n!README.md\n**/*.pyc\n")
+    assert is_ignored(path, patterns) is ignored
+
+
+def test_ignored_files_are_not_part_of_the_context(context):
+    names = {
+        path.relative_to(context).as_posix() for path in context_files(context, parse_dockerignore("node_modules"))
+    }
+    assert names == {"Dockerfile", "app/main.py", "README.md", ".dockerignore"}
+
+
+def test_ignored_changes_do_not_trigger_a_build(context):
+    BuildDigests().record({"demo-web": context_digest(config(context)["services"]["web"])})
+
+    (context / "node_modules" / "left-pad" / "index.js").write_text("// changed\n")
+    assert [check.changed for check in check_builds(config(context))] == [False]
+
+    (context / "app" / "main.py").write_text("print('bye')\n")
+    assert [check.reasons for check in check_builds(config(context))] == [["modified app/main.py"]]
+
+
+def test_build_args_are_part_of_the_digest(context):
+    BuildDigests().record({"demo-web": context_digest(config(context, args={"VERSION": "1"})["services"]["web"])})
+
+    (check,) = check_builds(config(context, args={"VERSION": "2"}))
+    assert check.reasons == ["modified <build-arg VERSION>"]
+
+
+def test_never_built_images_are_built(context):
+    (check,) = check_builds(config(context))
+    assert check.reasons == ["never built by edwh"]
+    assert check.image_tag == "demo-web"
+
+
+def test_build_arg_values_are_not_stored(context):
+    BuildDigests().record({"demo-web": context_digest(config(context, args={"TOKEN": "hunter2"})["services"]["web"])})
+    stored = BuildDigests().path.read_text()
+    assert "hunter2" not in stored
+    # not even as a plain hash, which is easy to guess for short values
+    assert hashlib.sha256(b"hunter2").hexdigest() not in stored
+
+    (key,) = BuildDigests().path.parent.glob("*.key")
+    assert key.stat().st_mode & 0o777 == 0o600
+
+
+def test_removed_images_are_rebuilt(context):
+    BuildDigests().record({"demo-web": context_digest(config(context)["services"]["web"])})
+
+    (check,) = check_builds(config(context), image_exists=lambda tag: tag != "demo-web")
+    assert check.reasons == ["image demo-web doesn't exist (anymore)"]
+    assert [check.changed for check in check_builds(config(context), image_exists=lambda _tag: True)] == [False]
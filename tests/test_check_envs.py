@@ -0,0 +1,116 @@
+"""
+check_envs: many .env keys checked with one read and as few writes as possible.
+"""
+
+import threading
+import time
+
+import invoke
+import pytest
+
+from src.edwh import tasks
+from src.edwh.tasks import check_envs, read_dotenv
+
+
+@pytest.fixture
+def env_file(tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text("EXISTING=yes\n")
+    return env_file
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    calls = []
+    real_set_env_values = tasks.set_env_values
+    monkeypatch.setattr(
+        tasks, "set_env_values", lambda path, values: calls.append(values) or real_set_env_values(path, values)
+    )
+    return calls
+
+
+def test_missing_keys_are_written_at_once(env_file, writes):
+    values = check_envs(
+        [
+            {"key": "EXISTING", "default": lambda: pytest.fail("not missing")},
+            {"key": "domain", "default": "example.com", "force_default": True},
+            {"key": "PORT", "default": lambda: 8000, "force_default": True, "prefix": "0.0.0.0:"},
+        ],
+        env_path=env_file,
+        jobs=2,
+    )
+
+    assert values == {"EXISTING": "yes", "domain": "example.com", "PORT": "0.0.0.0:8000"}
+    assert writes == [{"DOMAIN": "example.com", "PORT": "0.0.0.0:8000"}]
+    assert read_dotenv(env_file) == {"EXISTING": "yes", "DOMAIN": "example.com", "PORT": "0.0.0.0:8000"}
+
+    assert check_envs([{"key": "PORT", "default": "1"}], env_path=env_file) == {"PORT": "0.0.0.0:8000"}
+    assert len(writes) == 1
+
+
+def test_lazy_defaults_are_computed_concurrently(env_file):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def slow_default():
+        barrier.wait()  # only passes when all three run at the same time
+        time.sleep(0.01)
+        return "computed"
+
+    specs = [{"key": f"KEY_{n}", "default": slow_default, "force_default": True} for n in range(3)]
+    assert set(check_envs(specs, env_path=env_file, jobs=3).values()) == {"computed"}
+
+
+def test_from_env_skips_defaults_that_are_not_needed(env_file, monkeypatch):
+    monkeypatch.setenv("EDWH_FROM_ENV", "1")
+    monkeypatch.setenv("FROM_SHELL", "shell")
+
+    values = check_envs(
+        [
+            {"key": "FROM_SHELL", "default": lambda: pytest.fail("in the environment")},
+            {"key": "FROM_DEFAULT", "default": lambda: "default"},
+        ],
+        env_path=env_file,
+    )
+    assert values == {"FROM_SHELL": "shell", "FROM_DEFAULT": "default"}
+
+
+def test_answers_before_an_error_are_kept(env_file, monkeypatch):
+    answers = iter(["first", "not-allowed"])
+    monkeypatch.setattr("builtins.input", lambda _prompt: next(answers))
+
+    with pytest.raises(ValueError):
+        check_envs(
+            [{"key": "FIRST"}, {"key": "SECOND", "allowed_values": ("a", "b")}],
+            env_path=env_file,
+        )
+
+    assert read_dotenv(env_file) == {"EXISTING": "yes", "FIRST": "first"}
+
+
+def test_defaults_see_earlier_values_by_default(tmp_path, monkeypatch):
+    project = tmp_path / "project"
+    project.mkdir()
+    env_file = project / ".env"
+    env_file.touch()
+    monkeypatch.chdir(project)
+    c = invoke.Context()
+    keys = ["A_PORT", "B_PORT"]
+
+    values = check_envs(
+        [{"key": key, "default": lambda: str(tasks.next_value(c, keys, 8000)), "force_default": True} for key in keys],
+        env_path=env_file,
+    )
+    assert values == {"A_PORT": "8000", "B_PORT": "8001"}
+
+
+def test_values_are_only_written_before_a_lazy_default(env_file, writes):
+    check_envs(
+        [
+            {"key": "A", "default": "a", "force_default": True},
+            {"key": "B", "default": "b", "force_default": True},
+            {"key": "C", "default": lambda: read_dotenv(env_file)["B"] * 2, "force_default": True},
+            {"key": "D", "default": "d", "force_default": True},
+        ],
+        env_path=env_file,
+    )
+    assert writes == [{"A": "a", "B": "b"}, {"C": "bb", "D": "d"}]
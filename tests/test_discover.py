@@ -0,0 +1,176 @@
+"""
+Discovering many compose projects at once, against a fake host.
+"""
+
+import json
+import threading
+import time
+import typing as t
+
+import ewok
+import invoke
+import pytest
+from invoke.runners import Result
+
+from src.edwh.discover import Discover
+from src.edwh.memo import invocation_cache
+
+
+class FakeHost(ewok.Context):
+    """
+    Projects 'a' to 'e' (every `docker compose config` takes a while), of which 'c' can't be read.
+    """
+
+    # class level: Context deep-copies its instance attributes, and locks can't be copied
+    lock = threading.Lock()
+    concurrent: t.ClassVar[list[int]] = [0, 0]  # now, max
+
+    def __init__(self) -> None:
+        super().__init__(host="localhost")
+
+    def run(self, command: str, **_: t.Any) -> Result:  # type: ignore[override]
+        project = self.cwd
+        if command == "hostname":
+            stdout = "server"
+        elif command.startswith("find "):
+            stdout = "\n".join(f"{name}/docker-compose.yml" for name in "abcde")
+        elif "HOSTINGDOMAIN" in command:
+            stdout = f"HOSTINGDOMAIN={project}.example.com"
+        elif command.endswith("compose config"):
+            with self.lock:
+                self.concurrent[0] += 1
+                self.concurrent[1] = max(self.concurrent)
+            time.sleep(0.05 if project == "a" else 0.01)  # the first project finishes last
+            with self.lock:
+                self.concurrent[0] -= 1
+            if project == "c":
+                raise OSError("permission denied")
+            stdout = (
+                f"services:\n  {project}-web:\n    labels:\n"
+                f"      traefik.http.routers.{project}.rule: Host(`{project}.example.com`)\n"
+            )
+        else:
+            return Result(stdout="", command=command, exited=1)
+        return Result(stdout=stdout, command=command, exited=0)
+
+
+def test_projects_are_discovered_in_parallel_and_kept_in_order(capsys):
+    FakeHost.concurrent[:] = [0, 0]
+
+    Discover(FakeHost(), as_json=True, jobs=4).discover()
+
+    captured = capsys.readouterr()
+    data = json.loads(captured.out)["data"]
+    assert [project["name"] for project in data["projects"]] == ["a", "b", "d", "e"]
+    assert data["projects"][0]["hostingdomain"] == "a.example.com"
+    assert data["projects"][3]["services"] == [
+        {"name": "e-web", "domains": ["e.example.com"], "routers": {"e": {"hosts": ["e.example.com"], "regexps": []}}}
+    ]
+    assert "Error discovering server/c: permission denied" in captured.err
+    assert FakeHost.concurrent[1] > 1
+
+
+def test_text_output_is_grouped_per_project(capsys):
+    Discover(FakeHost(), jobs=5).discover()
+
+    lines = capsys.readouterr().out.splitlines()
+    first_line = {
+        name: next(idx for idx, line in enumerate(lines) if f"{name}.example.com" in line) for name in "abcde"
+    }
+    # 'a' took longest, but everything is still printed in order and a project's lines stay together
+    assert list(first_line.values()) == sorted(first_line.values())
+    assert "Error discovering c: permission denied" in lines[first_line["c"] + 1]
+
+
+def test_ndjson_streams_a_record_per_project_as_it_is_done(capsys):
+    Discover(FakeHost(), ndjson=True, jobs=5).discover()
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert {record["name"] for record in records} == {"a", "b", "d", "e"}
+    assert records[-1]["name"] == "a"  # the slowest project doesn't hold the others back
+    assert all(record["server"] == "server" for record in records)
+    assert records[0]["services"][0]["domains"] == [f"{records[0]['name']}.example.com"]
+
+
+class LocalMachine(invoke.Context):
+    """
+    Discovering this machine: only `hostname`, `find` and `docker compose config` may run, .env files are read directly.
+    """
+
+    commands: t.ClassVar[list[str]] = []
+
+    def run(self, command: str, **_: t.Any) -> Result:  # type: ignore[override]
+        self.commands.append(f"{self.cwd}: {command}")
+        if command == "hostname":
+            return Result(stdout="laptop", command=command, exited=0)
+        elif command.startswith("find "):
+            return Result(stdout="shop/docker-compose.yml\nweb/docker-compose.yml", command=command, exited=0)
+        elif command.endswith("compose config"):
+            return Result(stdout="services: {}", command=command, exited=0)
+        raise AssertionError(f"unexpected command: {command}")
+
+
+@pytest.fixture
+def machine(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    for name in ("shop", "web"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "docker-compose.yml").write_text("services: {}\n")
+    (tmp_path / "web" / ".env").write_text("HOSTINGDOMAIN='web.localhost'\nPGPORT=5432\n")
+    (tmp_path / ".env").write_text("HOSTINGDOMAIN=parent.localhost\n")  # not shop's own .env, but its settings
+    monkeypatch.chdir(tmp_path)
+    LocalMachine.commands.clear()
+    return tmp_path
+
+
+@pytest.mark.usefixtures("machine")
+def test_local_settings_are_read_without_subprocesses(capsys):
+    Discover(LocalMachine(), settings=True, as_json=True).discover()
+
+    shop, web = json.loads(capsys.readouterr().out)["data"]["projects"]
+    assert shop["hostingdomain"] == ""
+    # like `edwh settings` in shop/, which finds the .env in the parent folder
+    assert shop["settings"] == {"HOSTINGDOMAIN": "parent.localhost"}
+    assert web["hostingdomain"] == "web.localhost"
+    assert web["settings"] == {"HOSTINGDOMAIN": "web.localhost", "PGPORT": "5432"}
+
+    Discover(LocalMachine(), settings=True).discover()
+    assert "PGPORT         5432" in capsys.readouterr().out
+
+
+def test_refresh_only_rescans_changed_projects(machine, capsys):
+    Discover(LocalMachine(), settings=True, as_json=True).discover()
+    first = json.loads(capsys.readouterr().out)
+    assert sum("compose config" in command for command in LocalMachine.commands) == 2
+
+    invocation_cache.invalidate()  # a new `edwh discover`
+    LocalMachine.commands.clear()
+    (machine / "shop" / ".env").write_text("HOSTINGDOMAIN=shop.localhost\n")
+    Discover(LocalMachine(), settings=True, as_json=True, refresh=True).discover()
+    refreshed = json.loads(capsys.readouterr().out)
+    assert [command for command in LocalMachine.commands if "compose config" in command] == [
+        "shop: docker --log-level error compose config"
+    ]
+    assert refreshed["data"]["projects"][0]["hostingdomain"] == "shop.localhost"
+    assert refreshed["data"]["projects"][1] == first["data"]["projects"][1]
+
+    # --cached doesn't even look for projects, other options mean a new scan
+    LocalMachine.commands.clear()
+    Discover(LocalMachine(), settings=True, as_json=True, cached=True).discover()
+    assert json.loads(capsys.readouterr().out) == refreshed
+    assert set(LocalMachine.commands) == {": hostname"}
+
+    Discover(LocalMachine(), as_json=True, cached=True).discover()
+    assert "settings" not in json.loads(capsys.readouterr().out)["data"]["projects"][1]
+
+
+@pytest.mark.usefixtures("machine")
+def test_output_options_share_the_inventory(capsys):
+    Discover(LocalMachine(), as_json=True).discover()
+    capsys.readouterr()
+
+    invocation_cache.invalidate()
+    LocalMachine.commands.clear()
+    Discover(LocalMachine(), refresh=True).discover()
+    assert not any("compose config" in command for command in LocalMachine.commands)
+    assert "web" in capsys.readouterr().out
@@ -0,0 +1,60 @@
+"""
+In-process disk usage for `discover --du`.
+"""
+
+import os
+
+import pytest
+
+from src.edwh import disk_usage as du
+
+
+def blocks(*paths) -> int:
+    return sum(path.lstat().st_blocks * du.BLOCK_SIZE for path in paths)
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    root = tmp_path / "project"
+    (root / "web2py" / "uploads").mkdir(parents=True)
+    (root / "sessions").mkdir()
+    (root / "web2py" / "uploads" / "photo.jpg").write_bytes(os.urandom(200_000))
+    (root / "sessions" / "abc").write_bytes(os.urandom(10_000))
+    os.link(root / "web2py" / "uploads" / "photo.jpg", root / "web2py" / "photo-again.jpg")
+    (root / "outside").symlink_to(tmp_path)
+    return root
+
+
+def test_hardlinks_count_once_and_symlinks_are_not_followed(project):
+    usage = du.disk_usage(project, top=2)
+
+    directories = [project, project / "web2py", project / "web2py" / "uploads", project / "sessions"]
+    files = [project / "web2py" / "uploads" / "photo.jpg", project / "sessions" / "abc", project / "outside"]
+    assert usage.total == blocks(*directories, *files)
+    assert usage.largest[0] == ("web2py", blocks(*directories[1:3], files[0]))
+    assert len(usage.largest) == 2
+
+
+def test_unchanged_directories_come_from_the_cache(project, monkeypatch):
+    first = du.disk_usage(project, cached=True)
+
+    listed = []
+    real_list_directory = du.list_directory
+    monkeypatch.setattr(
+        du, "list_directory", lambda path, *args: listed.append(path.name) or real_list_directory(path, *args)
+    )
+
+    assert du.disk_usage(project, cached=True).total == first.total
+    assert listed == []
+
+    (project / "sessions" / "def").write_bytes(os.urandom(10_000))
+    assert du.disk_usage(project, cached=True).total == first.total + blocks(project / "sessions" / "def")
+    assert listed == ["sessions"]
+
+
+def test_hidden_directories_keep_their_name(project):
+    (project / ".git" / "objects").mkdir(parents=True)
+
+    names = {name for name, _ in du.disk_usage(project, top=10, depth=2).largest}
+    assert {".git", ".git/objects", "web2py/uploads"} <= names
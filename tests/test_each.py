@@ -0,0 +1,53 @@
+"""
+Finding compose projects for `edwh each` and running a command in all of them.
+"""
+
+import sys
+
+import pytest
+
+from src.edwh.each import find_projects, run_each
+
+# stands in for `python -m edwh`: prints where it runs, fails in projects called 'broken'
+FAKE_EDWH = (
+    sys.executable,
+    "-c",
+    "import os, pathlib, sys; "
+    "print(pathlib.Path.cwd().name, *sys.argv[1:], os.environ['EDWH_NON_INTERACTIVE']); "
+    "sys.exit(3 if pathlib.Path.cwd().name == 'broken' else 0)",
+)
+
+
+@pytest.fixture
+def projects(tmp_path, monkeypatch):
+    for name in ("web", "shop", "broken"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "docker-compose.yml").write_text("services: {}\n")
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "tasks.py").write_text("")
+
+    monkeypatch.chdir(tmp_path / "web")
+    return tmp_path
+
+
+def test_only_compose_projects_are_found(projects):
+    assert [path.name for path in find_projects("../*")] == ["broken", "shop", "web"]
+    assert [path.name for path in find_projects(f"{projects}/s*")] == ["shop"]
+
+
+@pytest.mark.usefixtures("projects")
+def test_run_each_collects_exit_codes_and_prefixes_output(capsys):
+    runs = run_each(find_projects("../*"), ["upgrade", "--jobs", "2"], jobs=2, executable=FAKE_EDWH)
+
+    assert {run.project.name: run.exit_code for run in runs} == {"broken": 3, "shop": 0, "web": 0}
+    assert next(run for run in runs if not run.ok).last_line == "broken upgrade --jobs 2 1"
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3
+    assert any("shop   |" in line and line.endswith("shop upgrade --jobs 2 1") for line in lines)
+
+
+def test_missing_executable_is_a_failed_run(projects):
+    (run,) = run_each([projects / "shop"], ["up"], executable=("/nonexistent/edwh",))
+    assert run.exit_code == 127
+    assert not run.ok
@@ -0,0 +1,114 @@
+"""
+The process-wide .env store: parsed once, reparsed when the file changes, updated by edwh's own writes.
+"""
+
+import json
+import os
+
+import pytest
+from invoke import Context
+
+from src.edwh import envstore
+from src.edwh.tasks import (
+    check_env,
+    get_env_value,
+    next_value,
+    read_dotenv,
+    search_adjacent_setting,
+    set_env_value,
+    settings,
+)
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    parsed = []
+    real_dotenv_values = envstore.dotenv_values
+    monkeypatch.setattr(envstore, "dotenv_values", lambda path: parsed.append(path.name) or real_dotenv_values(path))
+    return parsed
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / "docker-compose.yml").write_text("services: {}\n")
+    (tmp_path / ".env").write_text("# comment\nHOSTINGDOMAIN=example.com\n\nPGPORT=5432\n")
+    (tmp_path / "sub").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_reads_are_cached_until_the_file_changes(project, parses):
+    assert read_dotenv()["PGPORT"] == "5432"
+    assert read_dotenv()["PGPORT"] == "5432"
+    assert len(parses) == 1
+
+    # changed behind edwh's back, to the same size: only the mtime tells
+    env_file = project / ".env"
+    before = env_file.stat()
+    env_file.write_text("# comment\nHOSTINGDOMAIN=example.org\n\nPGPORT=5432\n")
+    os.utime(env_file, ns=(before.st_atime_ns, before.st_mtime_ns + 1_000_000))
+
+    assert read_dotenv()["HOSTINGDOMAIN"] == "example.org"
+    assert len(parses) == 2
+
+
+def test_callers_can_not_change_the_store(project):
+    read_dotenv()["PGPORT"] = "1"
+    assert read_dotenv(project / ".env")["PGPORT"] == "5432"
+
+
+def test_own_writes_are_seen_right_away(project, monkeypatch):
+    assert get_env_value("PGPORT") == "5432"
+
+    set_env_value(project / ".env", "PGPORT", "5433")
+    assert get_env_value("PGPORT") == "5433"
+
+    monkeypatch.setenv("EDWH_NON_INTERACTIVE", "1")
+    assert check_env("NEW_KEY", "value", "a new key", force_default=True) == "value"
+    assert read_dotenv()["NEW_KEY"] == "value"
+
+
+def test_upward_search_from_a_subdirectory(project, monkeypatch, parses):
+    monkeypatch.chdir(project / "sub")
+    assert read_dotenv()["HOSTINGDOMAIN"] == "example.com"
+
+    # a .env closer by takes over, once edwh writes it
+    set_env_value(project / "sub" / ".env", "HOSTINGDOMAIN", "sub.example.com")
+    assert read_dotenv()["HOSTINGDOMAIN"] == "sub.example.com"
+    assert parses.count(".env") == 2
+
+
+@pytest.fixture
+def neighbours(tmp_path, monkeypatch):
+    for project, env in {
+        "alpha": "PGPORT=5432\nREDIS_PORT=6379\n",
+        "beta": "PGPORT=5433\n",
+        "gamma": "HOSTINGDOMAIN=gamma.example.com\n",
+    }.items():
+        (tmp_path / project).mkdir()
+        (tmp_path / project / ".env").write_text(env)
+    (tmp_path / "delta").mkdir()
+    monkeypatch.chdir(tmp_path / "delta")
+    return tmp_path
+
+
+def test_neighbour_index_is_built_once(neighbours, parses):
+    ctx = Context()
+    assert search_adjacent_setting(ctx, "pgport", silent=True) == {"alpha": "5432", "beta": "5433", "gamma": None}
+    assert next_value(ctx, ["PGPORT", "REDIS_PORT"], 1000) == 6380
+    assert envstore.env_store.index(neighbours) is envstore.env_store.index(neighbours)
+    assert len(parses) == 3
+
+    # a new project shows up without anything else being parsed again
+    (neighbours / "delta" / ".env").write_text("PGPORT=5440\n")
+    assert next_value(ctx, "PGPORT", 1000) == 5441
+    assert len(parses) == 4
+
+
+@pytest.mark.usefixtures("neighbours")
+def test_settings_of_all_projects(capsys):
+    settings(Context(), find="port", all_projects=True, as_json=True)
+    assert json.loads(capsys.readouterr().out) == {
+        "alpha": {"PGPORT": "5432", "REDIS_PORT": "6379"},
+        "beta": {"PGPORT": "5433"},
+    }
@@ -0,0 +1,116 @@
+"""
+`edwh fleet` against stand-in hosts: fake connections that answer like sshd + docker would.
+"""
+
+import json
+import socket
+import threading
+import time
+import typing as t
+
+import ewok
+from invoke.runners import Result
+
+from src.edwh.fleet import ConnectionPool, HostSpec, fleet_rows, load_inventory, parse_labels, run_fleet
+
+
+def ps_line(name: str, state: str, status: str, project: str = "demo") -> str:
+    labels = f"com.docker.compose.project={project},com.docker.compose.service={name}"
+    return json.dumps({"Names": name, "State": state, "Status": status, "Labels": labels})
+
+
+class FakeHost(ewok.Context):
+    """
+    A host that answers `docker ps` with fixed output, optionally slowly.
+    """
+
+    # class level: Context deep-copies its instance attributes, and locks can't be copied
+    lock = threading.Lock()
+    opened: t.ClassVar[list[str]] = []
+    commands: t.ClassVar[list[tuple[str, str]]] = []
+
+    def __init__(self, name: str, ps: list[str], delay: float = 0) -> None:
+        super().__init__(host=name)
+        self.ps = "\n".join(ps)
+        self.delay = delay
+        with self.lock:
+            self.opened.append(name)
+
+    def run(self, command: str, **kwargs: t.Any) -> Result:  # type: ignore[override]
+        with self.lock:
+            self.commands.append((self.host, command))
+        if self.delay > kwargs.get("timeout", 60):
+            raise TimeoutError(f"command timed out after {kwargs['timeout']} seconds")
+        time.sleep(self.delay)
+        return Result(stdout=self.ps, command=command, exited=0)
+
+    def close(self) -> None:
+        pass
+
+
+HOSTS = {
+    "web1": [ps_line("web", "running", "Up 2 hours (healthy)"), ps_line("db", "running", "Up 2 hours (unhealthy)")],
+    "web2": [ps_line("migrate", "exited", "Exited (0) 3 hours ago"), ps_line("cron", "running", "Up 5 minutes")],
+    "slow": [ps_line("web", "running", "Up 1 hour (health: starting)")],
+}
+
+
+def factory(spec: HostSpec, _connect_timeout: int) -> FakeHost:
+    if spec.host == "down":
+        raise socket.timeout("timed out connecting to down")
+    return FakeHost(spec.name, HOSTS[spec.name], delay=5 if spec.name == "slow" else 0.05)
+
+
+def setup_function():
+    FakeHost.opened.clear()
+    FakeHost.commands.clear()
+
+
+def test_inventory_file_and_inline_hosts(tmp_path):
+    inventory = tmp_path / "inventory.toml"
+    inventory.write_text('[hosts.web1]\nhost = "web1.example.com"\nuser = "deploy"\n\n[hosts.db1]\nport = 2222\n')
+
+    assert load_inventory(str(inventory)) == [
+        HostSpec("web1", "web1.example.com", "deploy"),
+        HostSpec("db1", "db1", None, 2222),
+    ]
+    assert load_inventory("web1, deploy@web2") == [HostSpec("web1", "web1"), HostSpec("deploy@web2", "web2", "deploy")]
+
+
+def test_partial_failures_and_one_connection_per_host():
+    specs = [HostSpec(name, name) for name in ("web1", "web2", "down", "slow")]
+
+    with ConnectionPool(factory=factory) as pool:
+        started = time.monotonic()
+        results = {_.host.name: _ for _ in run_fleet(pool, specs, ["health", "ps"], timeout=1)}
+        elapsed = time.monotonic() - started
+
+    assert results["web1"].ok and results["web2"].ok
+    assert results["down"].error == "TimeoutError: timed out connecting to down"
+    assert results["slow"].error == "TimeoutError: command timed out after 1 seconds"
+    # hosts were queried side by side
+    assert elapsed < 1
+    # health and ps share one connection and one docker call per host
+    assert sorted(FakeHost.opened) == ["slow", "web1", "web2"]
+    assert [host for host, _ in FakeHost.commands].count("web1") == 1
+
+
+def test_health_rows_only_show_problems():
+    with ConnectionPool(factory=factory) as pool:
+        results = run_fleet(pool, [HostSpec("web1", "web1"), HostSpec("web2", "web2")], ["health"])
+
+    rows = [(host, health) for result in results for host, _, _, health in fleet_rows("health", result)]
+    assert rows == [("web1", "degraded")]
+
+    everything = [row[-1] for result in results for row in fleet_rows("health", result, show_all=True)]
+    assert sorted(everything) == ["degraded", "healthy", "running", "stopped"]
+
+
+def test_label_values_may_contain_commas():
+    labels = "traefik.http.routers.web.rule=Host(`a.example.com`, `b.example.com`),com.docker.compose.project=demo,x="
+
+    assert parse_labels(labels) == {
+        "traefik.http.routers.web.rule": "Host(`a.example.com`, `b.example.com`)",
+        "com.docker.compose.project": "demo",
+        "x": "",
+    }
@@ -0,0 +1,134 @@
+"""
+The on-disk HTTP cache for PyPI metadata, against a local stand-in for PyPI.
+"""
+
+import http.server
+import json
+import threading
+import time
+import typing as t
+
+import pytest
+import yayarl as yarl
+
+from src.edwh import meta
+from src.edwh.http_cache import OFFLINE_ENV, TTL_ENV, HttpCache, fetch_concurrently
+
+METADATA = {"info": {"version": "1.2.3", "requires_dist": ['edwh-demo-plugin; extra == "plugins"']}, "releases": {}}
+
+
+class FakePyPI(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    requests: t.ClassVar[list[tuple[str, str | None]]] = []
+    client_ports: t.ClassVar[set[int]] = set()
+
+    def do_GET(self):
+        etag = '"v1"'
+        FakePyPI.requests.append((self.path, self.headers.get("If-None-Match")))
+        FakePyPI.client_ports.add(self.client_address[1])
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = json.dumps(METADATA).encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def pypi(tmp_path, monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakePyPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    FakePyPI.requests = []
+    FakePyPI.client_ports = set()
+    monkeypatch.setattr(meta, "PYPI_URL_BASE", yarl.URL(f"http://127.0.0.1:{server.server_port}/pypi/"))
+    monkeypatch.setattr(meta, "http_cache", HttpCache(tmp_path / "http"))
+    monkeypatch.delenv(OFFLINE_ENV, raising=False)
+    yield FakePyPI.requests
+    server.shutdown()
+    server.server_close()
+
+
+def new_run(monkeypatch, tmp_path):
+    monkeypatch.setattr(meta, "http_cache", HttpCache(tmp_path / "http"))
+
+
+def test_fetched_once_per_run_and_cached_for_the_ttl(pypi, monkeypatch, tmp_path):
+    assert meta._get_available_plugins_from_pypi("edwh", "plugins") == ["edwh-demo-plugin"]
+    assert meta._get_latest_version_from_pypi("edwh") == meta.parse_package_version("1.2.3")
+    assert pypi == [("/pypi/edwh/json", None)]
+
+    new_run(monkeypatch, tmp_path)
+    assert meta._get_pypi_info("edwh") == METADATA
+    assert len(pypi) == 1
+
+
+def test_outdated_responses_are_revalidated(pypi, monkeypatch, tmp_path):
+    monkeypatch.setenv(TTL_ENV, "0")
+    meta._get_pypi_info("edwh")
+
+    new_run(monkeypatch, tmp_path)
+    assert meta._get_pypi_info("edwh") == METADATA
+    assert pypi == [("/pypi/edwh/json", None), ("/pypi/edwh/json", '"v1"')]
+
+
+def test_offline_only_uses_the_cache(pypi, monkeypatch, tmp_path):
+    monkeypatch.setenv(TTL_ENV, "0")
+    meta._get_pypi_info("edwh")
+
+    monkeypatch.setenv(OFFLINE_ENV, "1")
+    new_run(monkeypatch, tmp_path)
+    assert meta._get_pypi_info("edwh") == METADATA
+    assert meta._get_pypi_info("edwh-unknown-plugin") == {}
+    assert len(pypi) == 1
+
+
+def test_one_connection_for_many_packages(pypi):
+    for package in ("edwh", "edwh-a-plugin", "edwh-b-plugin"):
+        meta._get_pypi_info(package)
+
+    assert len(pypi) == 3
+    assert len(FakePyPI.client_ports) == 1
+
+
+def test_failures_leave_the_other_results(capsys):
+    running = []
+    most_running = []
+    lock = threading.Lock()
+
+    def fetch(package):
+        with lock:
+            running.append(package)
+            most_running.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(package)
+        if package == "broken":
+            raise ConnectionError("connection reset")
+        return package.upper()
+
+    packages = ["a", "broken", "b", "c", "d", "a"]
+    assert fetch_concurrently(fetch, packages, jobs=2) == {"a": "A", "b": "B", "c": "C", "d": "D"}
+    assert max(most_running) <= 2
+    assert "Could not fetch broken: connection reset" in capsys.readouterr().err
+
+
+def test_metadata_of_failed_packages_is_none(monkeypatch):
+    def get_pypi_info(package):
+        if package == "edwh-broken-plugin":
+            raise TimeoutError("read timed out")
+        return METADATA
+
+    monkeypatch.setattr(meta, "_get_pypi_info", get_pypi_info)
+    assert meta._gather_package_metadata_threaded(["edwh==1.0", "edwh-broken-plugin==0.1"]) == {
+        "edwh==1.0": METADATA,
+        "edwh-broken-plugin==0.1": None,
+    }
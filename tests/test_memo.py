@@ -0,0 +1,107 @@
+"""
+Sharing docker queries between the tasks of one invocation, and dropping them when tasks change things.
+"""
+
+import functools
+import typing as t
+from pathlib import Path
+
+import ewok
+from invoke.runners import Result
+
+from src.edwh.health import _docker_inspect, _find_container_ids, docker_inspect, find_container_ids
+from src.edwh.helpers import dc_config
+from src.edwh.memo import memoize
+from src.edwh.tasks import parse_batch_lines, set_env_value, stop
+
+
+class CountingContext(ewok.Context):
+    def __init__(self) -> None:
+        super().__init__(host="localhost")
+        self.commands: list[str] = []
+
+    def run(self, command: str, **_: t.Any) -> Result:  # type: ignore[override]
+        self.commands = [*self.commands, command]
+        if "config" in command:
+            return Result(stdout="services:\n  web:\n    image: nginx\n", command=command, exited=0)
+        elif "ps -aq" in command:
+            return Result(stdout="abc\n", command=command, exited=0)
+        return Result(stdout='[{"Id": "abc"}]', command=command, exited=0)
+
+
+def test_queries_are_shared_and_copied():
+    ctx = CountingContext()
+
+    config = dc_config(ctx)
+    config["services"]["web"]["image"] = "changed by a caller"
+
+    assert dc_config(ctx) == {"services": {"web": {"image": "nginx"}}}
+    assert len(ctx.commands) == 1
+
+
+def test_cd_is_part_of_the_key():
+    ctx = CountingContext()
+    with ctx.cd("/srv/one"):
+        dc_config(ctx)
+    with ctx.cd("/srv/two"):
+        dc_config(ctx)
+        dc_config(ctx)
+
+    assert len(ctx.commands) == 2
+
+
+def test_stop_forgets_containers_but_not_config():
+    ctx = CountingContext()
+    for _ in range(2):
+        dc_config(ctx)
+        _find_container_ids(ctx, "web")
+        _docker_inspect(ctx, "abc")
+    assert len(ctx.commands) == 3
+
+    stop(ctx, service=["web"])
+    _find_container_ids(ctx, "web")
+    dc_config(ctx)
+
+    (ps,) = [_ for _ in ctx.commands[3:] if "stop" not in _]
+    assert ps.endswith("ps -aq web")
+
+
+def test_env_writes_forget_compose_config(tmp_path: Path):
+    ctx = CountingContext()
+    dc_config(ctx)
+
+    set_env_value(tmp_path / ".env", "SCHEMA_VERSION", "2")
+    dc_config(ctx)
+
+    assert len(ctx.commands) == 2
+
+
+def test_batch_lines():
+    text = """
+    # recover the database
+    edwh wipe-db --yes
+    migrate  # comment after a command
+
+    ew up -s 'py4web'
+    """
+    assert parse_batch_lines(text) == [["wipe-db", "--yes"], ["migrate"], ["up", "-s", "py4web"]]
+
+
+def test_keys_of_mixed_types_and_callables_without_a_name():
+    calls = []
+    lookup = memoize("test-mixed")(
+        functools.partial(lambda names, options: calls.append((names, options)) or len(calls))
+    )
+
+    assert lookup({1, "a", None}, options={2: "x", "y": 3}) == 1
+    assert lookup({None, "a", 1}, options={"y": 3, 2: "x"}) == 1
+    assert len(calls) == 1
+
+
+def test_public_container_queries_always_ask_docker():
+    # e.g. a plugin polling until a container is healthy
+    ctx = CountingContext()
+    for _ in range(2):
+        find_container_ids(ctx, "web")
+        docker_inspect(ctx, "abc")
+    assert len(ctx.commands) == 4
@@ -0,0 +1,131 @@
+"""
+Which services `up --smart` recreates, decided from what docker reports.
+"""
+
+import json
+import typing as t
+
+import ewok
+import pytest
+from invoke.runners import Result
+
+from src.edwh.plan import plan_services
+
+
+class ScriptedContext(ewok.Context):
+    """
+    A Context that answers commands from a script instead of running docker.
+
+    The first key that occurs in a command decides its output; anything
+    unscripted fails, like a docker call for something that doesn't exist.
+    """
+
+    def __init__(self, script: dict[str, str]) -> None:
+        super().__init__(host="localhost")
+        self.script = script
+        self.commands: list[str] = []
+
+    def run(self, command: str, **_: t.Any) -> Result:  # type: ignore[override]
+        self.commands.append(command)
+        for needle, stdout in self.script.items():
+            if needle in command:
+                return Result(stdout=stdout, command=command, exited=0)
+        return Result(stdout="", command=command, exited=1)
+
+
+def container(service: str, config_hash: str, image: str = "sha256:web", status: str = "running") -> dict:
+    return {
+        "Name": f"/demo-{service}-1",
+        "Image": image,
+        "State": {"Status": status},
+        "Config": {
+            "Labels": {
+                "com.docker.compose.service": service,
+                "com.docker.compose.config-hash": config_hash,
+            }
+        },
+    }
+
+
+CONFIG = {
+    "name": "demo",
+    "services": {
+        "web": {"image": "nginx"},
+        "db": {"image": "postgres"},
+        "worker": {"image": "nginx"},
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+
+def plan(containers: list[dict], image_ids: dict[str, str] | None = None) -> dict[str, tuple[str, list[str]]]:
+    script = {
+        "config --hash": "web aaa\ndb bbb\nworker ccc\n",
+        "ps -aq": "\n".join(_["Name"] for _ in containers),
+        "docker inspect": json.dumps(containers),
+    }
+    for image, image_id in (image_ids or {"nginx": "sha256:web", "postgres": "sha256:db"}).items():
+        script[f"}}}}' {image}"] = image_id
+
+    plans = plan_services(ScriptedContext(script), ["web", "db", "worker"], CONFIG)
+    return {_.service: (_.action, _.reasons) for _ in plans}
+
+
+def test_unchanged_services_are_kept():
+    result = plan([container("web", "aaa"), container("db", "bbb", image="sha256:db"), container("worker", "ccc")])
+
+    assert {action for action, _ in result.values()} == {"keep"}
+
+
+def test_config_change_recreates_only_that_service():
+    result = plan([container("web", "old"), container("db", "bbb", image="sha256:db"), container("worker", "ccc")])
+
+    assert result["web"][0] == "recreate"
+    assert result["db"][0] == result["worker"][0] == "keep"
+
+
+def test_new_image_and_missing_containers():
+    result = plan(
+        [container("web", "aaa"), container("db", "bbb", image="sha256:db")],
+        image_ids={"nginx": "sha256:newer", "postgres": "sha256:db"},
+    )
+
+    assert result["web"] == ("recreate", ["demo-web-1 image changed"])
+    assert result["worker"] == ("create", ["not running"])
+    assert result["db"][0] == "keep"
+
+
+def test_stopped_container_is_recreated():
+    result = plan(
+        [
+            container("web", "aaa", status="exited"),
+            container("db", "bbb", image="sha256:db"),
+            container("worker", "ccc"),
+        ]
+    )
+
+    assert result["web"] == ("recreate", ["demo-web-1 is exited"])
+
+
+def test_plan_uses_the_schema_version_up_would_write(tmp_path, monkeypatch):
+    from src.edwh import tasks
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".env").write_text("SCHEMA_VERSION=old\n")
+    monkeypatch.setenv("SCHEMA_VERSION", "from-shell")
+    monkeypatch.setattr(tasks.TomlConfig, "load", lambda *_a, **_kw: None)
+    monkeypatch.setattr(tasks, "service_names", lambda _services: ["web"])
+    monkeypatch.setattr(tasks, "calculate_schema_hash", lambda **_kw: "new")
+    monkeypatch.setattr(tasks, "dc_config", lambda _ctx: CONFIG)
+    seen = []
+    monkeypatch.setattr(tasks, "plan_services", lambda *_a: seen.append(tasks.os.environ["SCHEMA_VERSION"]) or [])
+
+    assert tasks.up(ScriptedContext({}), plan=True) == {"services": []}
+
+    assert seen == ["new"]
+    assert tasks.os.environ["SCHEMA_VERSION"] == "from-shell"
+    assert (tmp_path / ".env").read_text() == "SCHEMA_VERSION=old\n"
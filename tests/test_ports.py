@@ -0,0 +1,102 @@
+"""
+Port allocation: listening ports from /proc, .env reservations and a ledger shared by concurrent setups.
+"""
+
+import socket
+import threading
+
+import invoke
+import pytest
+
+from src.edwh import ports
+from src.edwh.tasks import check_envs, next_available_port
+
+PROC_NET_TCP = """  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 0100007F:1F90 00000000:0000 0A 00000000:00000000 00:00000000 00000000  1000        0 1 1
+   1: 0100007F:1F91 0100007F:D431 01 00000000:00000000 00:00000000 00000000  1000        0 2 1
+"""
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(ports, "listening_ports", lambda: bytearray(ports.MAX_PORT + 1))
+    return ports.PortLedger(tmp_path)
+
+
+def test_only_listening_sockets_count(tmp_path):
+    proc = tmp_path / "tcp"
+    proc.write_text(PROC_NET_TCP)
+
+    bitmap = ports.listening_ports([proc, tmp_path / "missing"])
+    assert bitmap[8080] == 1
+    assert bitmap[8081] == 0
+    assert sum(bitmap) == 1
+
+
+def test_reserved_and_unbindable_ports_are_skipped(ledger):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken_port = taken.getsockname()[1]
+
+        port = ports.allocate_port(taken_port - 1, reserved=[taken_port - 1], owner="test", ledger=ledger)
+        assert port is not None
+        assert port > taken_port
+
+
+def test_concurrent_allocations_get_different_ports(ledger):
+    allocated = []
+
+    def allocate():
+        allocated.append(ports.allocate_port(30_000, owner="test", ledger=ports.PortLedger(ledger.directory)))
+
+    threads = [threading.Thread(target=allocate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(allocated)) == 8
+    assert len(ledger.load(0)) == 8
+
+
+def test_expired_reservations_are_forgotten(ledger):
+    port = ports.allocate_port(31_000, owner="test", ttl=-1, ledger=ledger)
+    assert ports.allocate_port(31_000, owner="test", ledger=ledger) == port
+
+
+def test_looking_up_does_not_reserve(ledger):
+    port = ports.allocate_port(32_000, owner="test", ledger=ledger, reserve=False)
+    assert ports.allocate_port(32_000, owner="test", ledger=ledger, reserve=False) == port
+    assert ledger.load(0) == set()
+
+
+def test_the_ledger_is_shared_by_every_user(tmp_path, monkeypatch):
+    monkeypatch.setenv(ports.PORTS_DIR_ENV, str(tmp_path / "ports"))
+    ledger = ports.PortLedger()
+
+    with ledger.locked():
+        ledger.reserve(33_000, "test", 1e12)
+
+    assert ledger.directory.stat().st_mode & 0o7777 == 0o1777
+    assert ledger.path.stat().st_mode & 0o777 == 0o666
+
+
+def test_ports_for_the_env_are_reserved(tmp_path, monkeypatch):
+    monkeypatch.setenv(ports.PORTS_DIR_ENV, str(tmp_path / "ports"))
+    project = tmp_path / "project"
+    project.mkdir()
+    monkeypatch.chdir(project)
+    c = invoke.Context()
+
+    # computed at the same time, so only the ledger keeps them apart
+    values = check_envs(
+        [{"key": key, "default": lambda: str(next_available_port(c, "34000")), "force_default": True} for key in "AB"],
+        env_path=project / ".env",
+        jobs=2,
+    )
+
+    assert values["A"] != values["B"]
+    assert ports.PortLedger().load(0) == {int(values["A"]), int(values["B"])}
+    # looking a port up by hand doesn't reserve it
+    next_available_port(c, "35000")
+    assert len(ports.PortLedger().load(0)) == 2
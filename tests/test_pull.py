@@ -0,0 +1,117 @@
+"""
+The image pull scheduler, against a registry stand-in instead of docker.
+"""
+
+import threading
+import time
+
+from src.edwh.pull import failed_pulls, pull_image, pullable_images, schedule_pulls, updated_services
+
+
+class FakeRegistry:
+    """
+    Remote tags point to digests; pulling a tag makes the local image that digest.
+
+    `failures` makes the next n pulls of an image fail with the given message.
+    """
+
+    def __init__(self, remote: dict[str, str], local: dict[str, str] | None = None) -> None:
+        self.remote = remote
+        self.local = dict(local or {})
+        self.failures: dict[str, list[str]] = {}
+        self.pulls: list[str] = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def image_id(self, image: str) -> str | None:
+        return f"id-{self.local[image]}" if image in self.local else None
+
+    def repo_digests(self, image: str) -> set[str]:
+        return {self.local[image]} if image in self.local else set()
+
+    def remote_digest(self, image: str) -> str | None:
+        return self.remote.get(image)
+
+    def pull(self, image: str) -> tuple[bool, str]:
+        with self.lock:
+            self.pulls.append(image)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+
+        if self.failures.get(image):
+            return False, self.failures[image].pop(0)
+        if image not in self.remote:
+            return False, f"Error response from daemon: manifest for {image} not found"
+        self.local[image] = self.remote[image]
+        return True, ""
+
+
+CONFIG = {
+    "services": {
+        "web": {"image": "nginx:1"},
+        "proxy": {"image": "nginx:1"},
+        "db": {"image": "postgres:16"},
+        "app": {"image": "demo-app", "build": {"context": "."}},
+        "local": {"image": "demo-local", "pull_policy": "never"},
+    }
+}
+
+
+def test_images_are_deduplicated_and_buildables_skipped():
+    assert pullable_images(CONFIG) == {"nginx:1": ["proxy", "web"], "postgres:16": ["db"]}
+    assert pullable_images(CONFIG, ["db", "app"]) == {"postgres:16": ["db"]}
+
+
+def test_only_changed_images_are_pulled():
+    registry = FakeRegistry(
+        remote={"nginx:1": "sha256:new", "postgres:16": "sha256:pg"},
+        local={"nginx:1": "sha256:old", "postgres:16": "sha256:pg"},
+    )
+
+    results = schedule_pulls(registry, pullable_images(CONFIG))
+
+    assert registry.pulls == ["nginx:1"]
+    assert {result.image: result.status for result in results} == {"nginx:1": "updated", "postgres:16": "current"}
+    (nginx,) = [result for result in results if result.updated]
+    assert (nginx.before, nginx.after) == ("id-sha256:old", "id-sha256:new")
+    assert updated_services(results) == ["proxy", "web"]
+
+
+def test_concurrency_is_limited():
+    images = {f"image-{idx}": [f"service-{idx}"] for idx in range(8)}
+    registry = FakeRegistry(remote={image: f"sha256:{image}" for image in images})
+
+    results = schedule_pulls(registry, images, jobs=3)
+
+    assert len(registry.pulls) == 8
+    assert 1 < registry.max_running <= 3
+    assert updated_services(results) == sorted(service for (service,) in images.values())
+
+
+def test_transient_failures_are_retried_with_backoff():
+    registry = FakeRegistry(remote={"nginx:1": "sha256:new"})
+    registry.failures["nginx:1"] = ["net/http: TLS handshake timeout", "502 Bad Gateway"]
+    waits: list[float] = []
+
+    result = pull_image(registry, "nginx:1", ["web"], retries=3, backoff=0.5, sleep=waits.append)
+
+    assert result.status == "updated"
+    assert result.attempts == 3
+    assert waits == [0.5, 1.0]
+
+
+def test_permanent_failures_are_not_retried():
+    registry = FakeRegistry(remote={})
+    waits: list[float] = []
+
+    result = pull_image(registry, "typo:latest", ["web"], sleep=waits.append)
+
+    assert result.status == "failed"
+    assert result.attempts == 1
+    assert not waits
+    assert updated_services([result]) == []
+    assert failed_pulls([result]) == ["typo:latest"]
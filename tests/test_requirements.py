@@ -0,0 +1,117 @@
+"""
+Which requirements.in files `build` compiles, and compiling them side by side.
+"""
+
+import os
+import threading
+
+import pytest
+
+from src.edwh.requirements import (
+    CompiledRequirements,
+    check_requirements,
+    compile_requirements,
+    requirement_includes,
+)
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "shared").mkdir()
+    (tmp_path / "shared" / "constraints.txt").write_text("requests<3\n")
+    (tmp_path / "shared" / "base.in").write_text("-c constraints.txt\nrequests\n")
+    for name in ("web", "worker"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "requirements.in").write_text(f"-r ../shared/base.in\n{name}-lib\n")
+    return tmp_path
+
+
+def compile_all(project, jobs: int = 0):
+    def fake_compile(directory):
+        (directory / "requirements.txt").write_text("# compiled\n")
+
+    checks = [_ for _ in check_requirements(sorted(project.glob("*/requirements.in"))) if _.status != "current"]
+    return compile_requirements(checks, fake_compile, jobs=jobs)
+
+
+def test_includes_are_followed(project):
+    names = [path.name for path in requirement_includes(project / "web" / "requirements.in")]
+    assert names == ["requirements.in", "base.in", "constraints.txt"]
+
+
+def test_cycles_and_missing_includes(tmp_path):
+    (tmp_path / "a.in").write_text("-r b.in\n--requirement=missing.in\n")
+    (tmp_path / "b.in").write_text("--requirement a.in\n")
+    assert [path.name for path in requirement_includes(tmp_path / "a.in")] == ["a.in", "b.in"]
+
+
+def test_staleness_is_content_based(project):
+    assert {_.status for _ in check_requirements([project / "web" / "requirements.in"])} == {"missing"}
+
+    compile_all(project)
+    reqs = sorted(project.glob("*/requirements.in"))
+    assert {_.status for _ in check_requirements(reqs)} == {"current"}
+
+    # a touch (like a git checkout) changes nothing
+    (project / "web" / "requirements.in").write_text((project / "web" / "requirements.in").read_text())
+    assert {_.status for _ in check_requirements(reqs)} == {"current"}
+
+    # but a change in a shared constraint affects both
+    (project / "shared" / "constraints.txt").write_text("requests<4\n")
+    assert [_.status for _ in check_requirements(reqs)] == ["outdated", "outdated"]
+
+
+def test_existing_txt_without_history_is_recorded_as_is(project):
+    requirements_in = project / "web" / "requirements.in"
+    (project / "web" / "requirements.txt").write_text("# compiled elsewhere\n")
+
+    (check,) = check_requirements([requirements_in])
+    assert check.status == "current"
+    assert CompiledRequirements().get(requirements_in) == check.digest
+
+
+def test_existing_txt_without_history_older_than_an_input_is_outdated(project):
+    requirements_txt = project / "web" / "requirements.txt"
+    requirements_txt.write_text("# compiled elsewhere\n")
+    os.utime(requirements_txt, ns=(0, 0))
+
+    (check,) = check_requirements([project / "web" / "requirements.in"])
+    assert check.reasons == ["never compiled by edwh and changed after requirements.txt"]
+    assert CompiledRequirements().get(check.path) is None
+
+
+def test_compiles_in_parallel_and_isolates_failures(project):
+    barrier = threading.Barrier(2, timeout=5)
+
+    def compile_directory(directory):
+        barrier.wait()  # only passes when both directories are compiling at the same time
+        if directory.name == "worker":
+            raise RuntimeError("resolution impossible")
+
+    checks = check_requirements(sorted(project.glob("*/requirements.in")))
+    results = {
+        result.path.parent.name: result.result for result in compile_requirements(checks, compile_directory, jobs=2)
+    }
+
+    assert results == {"web": "compiled", "worker": "failed: resolution impossible"}
+    assert CompiledRequirements().get(project / "web" / "requirements.in")
+    assert CompiledRequirements().get(project / "worker" / "requirements.in") is None
+
+
+def test_one_compile_per_directory(project):
+    (project / "web" / "dev.in").write_text("-r requirements.in\npytest\n")
+    compiled = []
+
+    checks = check_requirements(sorted([*project.glob("web/*.in"), project / "worker" / "requirements.in"]))
+    results = compile_requirements(checks, compiled.append)
+
+    assert sorted(directory.name for directory in compiled) == ["web", "worker"]
+    assert {result.path.name: result.result for result in results if result.path.parent.name == "web"} == {
+        "dev.in": "compiled",
+        "requirements.in": "compiled",
+    }
@@ -0,0 +1,115 @@
+"""
+Parallel and rolling restarts, against a fake docker that keeps container state.
+"""
+
+import json
+import re
+import threading
+import time
+import typing as t
+
+import ewok
+from invoke.runners import Result
+
+from src.edwh.restart import restart_parallel, restart_rolling, restart_targets
+
+
+class FakeDocker(ewok.Context):
+    """
+    Containers restart (StartedAt moves) when signalled, and become healthy after `boot` inspects.
+    """
+
+    # class level: Context deep-copies its instance attributes, and locks can't be copied
+    lock = threading.Lock()
+
+    def __init__(self, replicas: int, boot: int = 1, broken: t.Collection[int] = ()) -> None:
+        super().__init__(host="localhost")
+        self.containers = {
+            f"id{idx}": {"number": idx, "started": 0, "inspects_left": 0, "broken": idx in broken}
+            for idx in range(1, replicas + 1)
+        }
+        self.boot = boot
+        self.events: list[str] = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    def info(self, container_id: str) -> dict:
+        container = self.containers[container_id]
+        booting = container["inspects_left"] > 0
+        health = "unhealthy" if container["broken"] else "starting" if booting else "healthy"
+        return {
+            "Id": container_id,
+            "Name": f"/demo-py4web-{container['number']}",
+            "State": {"Status": "running", "StartedAt": str(container["started"]), "Health": {"Status": health}},
+            "Config": {
+                "Labels": {
+                    "com.docker.compose.service": "py4web",
+                    "com.docker.compose.container-number": str(container["number"]),
+                }
+            },
+        }
+
+    def run(self, command: str, **_: t.Any) -> Result:  # type: ignore[override]
+        if "ps -aq" in command:
+            return Result(stdout="\n".join(self.containers), command=command, exited=0)
+        elif command.startswith("docker inspect"):
+            ids = command.split()[2:]
+            infos = []
+            for container_id in ids:
+                infos.append(self.info(container_id))
+                with self.lock:
+                    self.containers[container_id]["inspects_left"] -= 1
+            return Result(stdout=json.dumps(infos), command=command, exited=0)
+        elif match := re.match(r"docker exec (\S+) sh -c", command):
+            container_id = match.group(1)
+            with self.lock:
+                self.concurrent += 1
+                self.max_concurrent = max(self.max_concurrent, self.concurrent)
+                self.events = [*self.events, f"signal {container_id}"]
+            time.sleep(0.02)
+            with self.lock:
+                self.concurrent -= 1
+                self.containers[container_id]["started"] += 1
+                self.containers[container_id]["inspects_left"] = self.boot
+            return Result(stdout="", command=command, exited=0)
+        return Result(stdout="", command=command, exited=1)
+
+
+def test_targets_are_ordered_by_replica():
+    docker = FakeDocker(replicas=3)
+    assert [target.name for target in restart_targets(docker, ["py4web"])] == [
+        "demo-py4web-1",
+        "demo-py4web-2",
+        "demo-py4web-3",
+    ]
+
+
+def test_parallel_signals_everything_at_once():
+    docker = FakeDocker(replicas=6)
+
+    results = restart_parallel(docker, restart_targets(docker, ["py4web"]))
+
+    assert all(result.ok for result in results)
+    assert docker.max_concurrent > 1
+
+
+def test_rolling_waits_for_each_replica():
+    docker = FakeDocker(replicas=3, boot=2)
+
+    results = restart_rolling(docker, restart_targets(docker, ["py4web"]), sleep=lambda _: None)
+
+    assert [result.detail for result in results] == ["healthy"] * 3
+    assert docker.max_concurrent == 1
+    # every replica came back (and was seen healthy) before the next one was signalled
+    assert docker.events == ["signal id1", "signal id2", "signal id3"]
+    assert all(container["inspects_left"] < 0 for container in docker.containers.values())
+
+
+def test_rolling_stops_at_an_unhealthy_replica():
+    docker = FakeDocker(replicas=3, boot=0, broken={2})
+
+    results = restart_rolling(docker, restart_targets(docker, ["py4web"]), timeout=0, sleep=lambda _: None)
+
+    assert [result.ok for result in results] == [True, False]
+    assert results[1].detail == "running & unhealthy after 0s"
+    assert docker.events == ["signal id1", "signal id2"]
@@ -0,0 +1,73 @@
+"""
+The schema hash only rereads files whose stat changed, and stays stable otherwise.
+"""
+
+from contextlib import chdir
+
+import pytest
+
+from src.edwh import hashing
+from src.edwh.hashing import FileManifest, hash_files, merkle_digest
+from src.edwh.tasks import calculate_schema_hash
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def project(tmp_path):
+    shared_code = tmp_path / "project" / "shared_code"
+    (shared_code / "models").mkdir(parents=True)
+    (shared_code / "__pycache__").mkdir()
+    (shared_code / "models" / "a.py").write_text("a = 1\n")
+    (shared_code / "b.py").write_text("b = 2\n")
+    (shared_code / "__pycache__" / "b.pyc").write_bytes(b"\x00")
+    return shared_code.parent
+
+
+def test_merkle_ignores_calculation_order():
+    assert merkle_digest({"a": "1", "b": "2"}) == merkle_digest({"b": "2", "a": "1"})
+    assert merkle_digest({"a": "1", "b": "2"}) != merkle_digest({"a": "2", "b": "1"})
+
+
+def test_missing_shared_code_matches_empty_hash(tmp_path):
+    with chdir(tmp_path):
+        assert calculate_schema_hash(quiet=True) == merkle_digest({})
+
+
+def test_unchanged_files_are_not_read_again(project, monkeypatch):
+    with chdir(project):
+        first = calculate_schema_hash(quiet=True)
+
+        read = []
+        original = hashing.hash_file
+        monkeypatch.setattr(hashing, "hash_file", lambda path: read.append(path.name) or original(path))
+
+        assert calculate_schema_hash(quiet=True) == first
+        assert read == []
+
+        (project / "shared_code" / "b.py").write_text("b = 3\n")
+        assert calculate_schema_hash(quiet=True) != first
+        assert read == ["b.py"]
+
+
+def test_pycache_is_ignored(project):
+    with chdir(project):
+        before = calculate_schema_hash(quiet=True)
+        (project / "shared_code" / "__pycache__" / "b.pyc").write_bytes(b"\x01")
+        assert calculate_schema_hash(quiet=True) == before
+
+
+def test_removed_files_are_dropped_from_the_manifest(project):
+    shared_code = project / "shared_code"
+    manifest = FileManifest.for_directory(shared_code, "test")
+    hash_files(shared_code, [shared_code / "b.py", shared_code / "models" / "a.py"], manifest)
+    manifest.save()
+
+    manifest = FileManifest.for_directory(shared_code, "test")
+    hash_files(shared_code, [shared_code / "b.py"], manifest)
+    manifest.save()
+
+    assert set(FileManifest.for_directory(shared_code, "test").entries) == {"b.py"}
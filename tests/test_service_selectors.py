@@ -0,0 +1,85 @@
+"""
+-s selectors: globs, groups, exclusions and groups from compose profiles/labels.
+"""
+
+from contextlib import chdir
+
+import pytest
+
+from src.edwh.service_selectors import ServiceSelector, compose_groups, split_selectors
+from src.edwh.tasks import service_names
+
+SERVICES = ["web", "celery-mail", "celery-reports", "pgq-sync", "pg-0", "pgpool", "redis"]
+
+
+@pytest.fixture
+def selector():
+    groups = {"minimal": ["web", "pg-0", "redis"], "db": ["pg-0", "pgpool"], "workers": ["celery-*", "pgq"]}
+    return ServiceSelector(SERVICES, groups | {"pgq": ["pgq-sync"]})
+
+
+def test_globs_groups_and_exclusions(selector):
+    assert selector.select(["celery*"]) == ["celery-mail", "celery-reports"]
+    assert selector.select(["workers", "!celery-reports"]) == ["celery-mail", "pgq-sync"]
+    assert selector.select(["!celery-*", "!db"]) == ["web", "pgq-sync", "redis"]
+    assert selector.select(["minimal", "db", "!pg-0"]) == ["web", "pgpool", "redis"]
+    assert selector.select(["nope"]) == []
+    assert selector.compile(["workers"]) is selector.compile(["workers"])
+
+
+def test_compose_groups_are_only_loaded_when_needed():
+    loads = []
+
+    def derived():
+        loads.append(1)
+        return {"reports": ["celery-reports"], "web": ["redis"]}
+
+    selector = ServiceSelector(SERVICES, {}, derived)
+    assert selector.select(["web", "pg-*"]) == ["web", "pg-0"]
+    assert loads == []
+
+    # a service name wins over a compose profile with the same name
+    assert selector.select(["reports", "web"]) == ["web", "celery-reports"]
+    assert selector.select(["unknown"]) == []
+    assert loads == [1]
+
+
+def test_compose_groups():
+    compose = {
+        "services": {
+            "web": {"profiles": ["frontend"], "labels": {"edwh.groups": "public, http"}},
+            "api": {"labels": ["edwh.groups=http", "traefik.enable=true"]},
+            "db": {},
+        }
+    }
+    assert compose_groups(compose) == {"frontend": ["web"], "public": ["web"], "http": ["web", "api"]}
+
+
+def test_service_names_with_toml_groups(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    (tmp_path / "docker-compose.yml").write_text("services: {}\n")
+    (tmp_path / ".toml").write_text(
+        """[services]
+services = ["web", "celery-mail", "celery-reports", "pg-0"]
+minimal = ["web", "pg-0"]
+include_celeries_in_minimal = "true"
+include_pgq_in_minimal = "false"
+log = ["web"]
+db = ["pg-0"]
+
+[groups]
+mail = ["celery-mail", "web"]
+"""
+    )
+
+    with chdir(tmp_path):
+        assert service_names(["mail"]) == ["web", "celery-mail"]
+        assert service_names(["!celeries"], default="minimal") == ["web", "pg-0"]
+        assert service_names(None, default="logs") == ["web"]
+        assert service_names("all,!mail") == ["celery-reports", "pg-0"]
+
+
+def test_split_selectors():
+    assert split_selectors(["web,db", " /celery*/ ", ""]) == ["web", "db", "celery*"]
+    assert split_selectors("web") == ["web"]
+    assert split_selectors(None) == []
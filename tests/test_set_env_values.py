@@ -0,0 +1,73 @@
+"""
+Batched, atomic .env writes that keep the file's layout.
+"""
+
+import threading
+
+from src.edwh.tasks import read_dotenv, set_env_value, set_env_values
+
+ENV = """# database
+PGPORT=5432
+PGHOST = db
+
+# hosting
+HOSTINGDOMAIN='example.com'
+PGPORT=5433
+"""
+
+
+def test_layout_is_kept_and_every_occurrence_is_updated(tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text(ENV)
+
+    assert set_env_values(env_file, {"PGPORT": 6000, "PGHOST": None, "NEW": " value "})
+
+    assert env_file.read_text() == (
+        "# database\nPGPORT=6000\n\n# hosting\nHOSTINGDOMAIN='example.com'\nPGPORT=6000\nNEW=value\n"
+    )
+    assert read_dotenv(env_file) == {"PGPORT": "6000", "HOSTINGDOMAIN": "example.com", "NEW": "value"}
+
+
+def test_nothing_is_written_when_nothing_changes(tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text(ENV)
+    env_file.chmod(0o600)
+    before = env_file.stat()
+
+    assert not set_env_values(env_file, {"PGHOST": "db", "HOSTINGDOMAIN": "'example.com'", "MISSING": None})
+    assert env_file.stat().st_mtime_ns == before.st_mtime_ns
+    assert env_file.stat().st_ino == before.st_ino
+
+    # a real change replaces the file, with the same permissions
+    assert set_env_values(env_file, {"PGHOST": "other"})
+    assert env_file.stat().st_ino != before.st_ino
+    assert env_file.stat().st_mode & 0o777 == 0o600
+
+
+def test_concurrent_writers_do_not_lose_changes(tmp_path):
+    env_file = tmp_path / ".env"
+    env_file.write_text(ENV)
+
+    threads = [threading.Thread(target=set_env_value, args=(env_file, f"KEY_{idx}", str(idx))) for idx in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    env = read_dotenv(env_file)
+    assert {key: env[key] for key in env if key.startswith("KEY_")} == {f"KEY_{idx}": str(idx) for idx in range(20)}
+
+
+def test_a_symlinked_env_stays_a_symlink(tmp_path):
+    shared = tmp_path / "shared.env"
+    shared.write_text("A=1\n")
+    shared.chmod(0o640)
+    env_file = tmp_path / "project" / ".env"
+    env_file.parent.mkdir()
+    env_file.symlink_to(shared)
+
+    assert set_env_values(env_file, {"B": "2"})
+
+    assert env_file.is_symlink()
+    assert shared.read_text() == "A=1\nB=2\n"
+    assert shared.stat().st_mode & 0o777 == 0o640
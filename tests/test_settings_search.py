@@ -0,0 +1,41 @@
+"""
+`edwh settings --find`: substring matches first, otherwise fuzzy matches on keys and values, ranked.
+"""
+
+import json
+
+from invoke import Context
+
+from src.edwh.settings_search import SettingsSearch
+from src.edwh.tasks import settings
+
+SETTINGS = [
+    ("HOSTINGDOMAIN", "example.com"),
+    ("POSTGRES_PORT", "5432"),
+    ("PGPOOL_PORT", "5433"),
+    ("SMTP_SERVER", "mail.example.com"),
+]
+
+
+def test_substring_matches_win():
+    search = SettingsSearch(SETTINGS)
+    assert search.find("port") == [1, 2]
+    assert search.find("EXAMPLE") == [0, 3]
+    assert search.find("port", limit=1) == [1]
+
+
+def test_fuzzy_matches_are_ranked_and_include_values():
+    search = SettingsSearch(SETTINGS)
+    assert search.find("POSTGRES_PROT") == [1]
+    # no key looks like this, one value does
+    assert search.find("mail.exampel") == [3]
+    assert search.fuzzy("PGPOL", fuzz_threshold=50)[0][0] == 2
+    assert search.find("nothing like it") == []
+
+
+def test_settings_task_limits_results(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".env").write_text("".join(f"{key}={value}\n" for key, value in SETTINGS))
+
+    settings(Context(), find="port", limit=1, as_json=True)
+    assert json.loads(capsys.readouterr().out) == {"POSTGRES_PORT": "5432"}
@@ -1,13 +1,11 @@
 from contextlib import chdir
 
-from src.edwh.tasks import TomlConfig
+import pytest
 
+from src.edwh import tasks
+from src.edwh.tasks import TomlConfig, read_toml_config, toml_transaction, write_content_to_toml_file
 
-def test_toml_config_bootstrap_preserves_application_context(tmp_path):
-    """Loading a fallback config must not lose ewok's application context."""
-    (tmp_path / "docker-compose.yml").write_text("services: {}\n")
-    (tmp_path / "default.toml").write_text(
-        """[services]
+COMPLETE_TOML = """[services]
 services = []
 minimal = []
 include_celeries_in_minimal = false
@@ -15,10 +13,83 @@ include_pgq_in_minimal = false
 log = []
 db = []
 """
-    )
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+def test_toml_config_bootstrap_preserves_application_context(tmp_path):
+    """Loading a fallback config must not lose ewok's application context."""
+    (tmp_path / "docker-compose.yml").write_text("services: {}\n")
+    (tmp_path / "default.toml").write_text(COMPLETE_TOML)
 
     with chdir(tmp_path):
         config = TomlConfig.load(cache=False)
 
     assert config is not None
     assert (tmp_path / ".toml").exists()
+
+
+def test_missing_keys_run_setup_once(tmp_path, monkeypatch):
+    (tmp_path / "docker-compose.yml").write_text("services: {}\n")
+    (tmp_path / ".toml").write_text("[services]\nminimal = ['web']\n")
+
+    setups = []
+
+    def fake_setup(_ctx):
+        setups.append(1)
+        (tmp_path / ".toml").write_text(COMPLETE_TOML.replace("minimal = []", "minimal = ['web']"))
+
+    monkeypatch.setattr(tasks, "setup", fake_setup)
+    with chdir(tmp_path):
+        config = TomlConfig.load(cache=False)
+
+    assert config is not None
+    assert config.services_minimal == ["web"]
+    assert len(setups) == 1
+
+
+def test_validated_config_is_kept_between_runs(tmp_path, monkeypatch):
+    (tmp_path / "docker-compose.yml").write_text("services: {}\n")
+    (tmp_path / ".toml").write_text(COMPLETE_TOML.replace("services = []", "services = ['web']"))
+
+    with chdir(tmp_path):
+        assert TomlConfig.load().all_services == ["web"]
+
+        tasks.tomlconfig_singletons.clear()  # a new run
+        monkeypatch.setattr(tasks, "read_toml_config", lambda _: pytest.fail("should come from the cache"))
+        assert TomlConfig.load().all_services == ["web"]
+        assert TomlConfig.load() is TomlConfig.load()
+
+        # cache=False reads the .toml itself
+        with pytest.raises(pytest.fail.Exception):
+            TomlConfig.load(cache=False)
+
+        monkeypatch.undo()
+        (tmp_path / ".toml").write_text(COMPLETE_TOML.replace("services = []", "services = ['web', 'db']"))
+        assert TomlConfig.load().all_services == ["web", "db"]
+
+
+def test_writes_in_a_transaction_are_written_once(tmp_path, monkeypatch):
+    toml_file = tmp_path / ".toml"
+    toml_file.write_text("# keep me\n[services]\n")
+
+    written = []
+    real_atomic_write_text = tasks.atomic_write_text
+    monkeypatch.setattr(
+        tasks,
+        "atomic_write_text",
+        lambda path, contents: written.append(path) or real_atomic_write_text(path, contents),
+    )
+
+    with toml_transaction(toml_file):
+        write_content_to_toml_file("minimal", ["web"], toml_file)
+        write_content_to_toml_file("log", ["web", "db"], toml_file)
+        assert read_toml_config(toml_file)["services"]["log"] == ["web", "db"]
+        assert "minimal" not in toml_file.read_text()
+
+    assert written == [toml_file]
+    assert toml_file.read_text().startswith("# keep me\n")
+    assert read_toml_config(toml_file)["services"] == {"minimal": ["web"], "log": ["web", "db"]}
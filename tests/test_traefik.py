@@ -0,0 +1,70 @@
+"""
+Parsing traefik rules and finding which project serves a domain.
+"""
+
+import pytest
+
+from src.edwh.traefik import DomainIndex, HostMatch, RuleSyntaxError, host_regexp, rule_hosts, service_routers
+
+
+@pytest.mark.parametrize(
+    ("rule", "hosts"),
+    [
+        ("Host(`a.example.com`)", ["a.example.com"]),
+        ("Host(`a.example.com`, `b.example.com`) && PathPrefix(`/api`)", ["a.example.com", "b.example.com"]),
+        ("Host(`a.example.com`) || Host(`b.example.com`)", ["a.example.com", "b.example.com"]),
+        ('!Host("old.example.com") && (Host(`new.example.com`) || !(Host(`x.example.com`)))', ["new.example.com"]),
+        ("HostSNI(`db.example.com`)", ["db.example.com"]),
+        ("PathPrefix(`/`)", []),
+    ],
+)
+def test_rule_hosts(rule, hosts):
+    assert [match.host for match in rule_hosts(rule)] == hosts
+
+
+def test_host_regexp_is_marked():
+    assert rule_hosts("HostRegexp(`{sub:[a-z]+}.example.com`)") == [HostMatch("{sub:[a-z]+}.example.com", True)]
+
+
+@pytest.mark.parametrize("rule", ["Host(`a`) ||", "Host(`a`", "Host(a)", "Host(`a`) Host(`b`)"])
+def test_broken_rules_raise(rule):
+    with pytest.raises(RuleSyntaxError):
+        rule_hosts(rule)
+
+
+def project(name: str, **labels: str) -> dict:
+    return {"name": name, "services": [{"name": "web", "routers": service_routers({"labels": labels})}]}
+
+
+@pytest.mark.parametrize(
+    ("pattern", "matches", "misses"),
+    [
+        ("{sub:[a-z]+}.example.com", "docs.example.com", "docs.example.org"),
+        ("{sub}.example.com", "a-b.example.com", "a.b.example.com"),
+        (r"^[a-z]{2,3}\.example\.com$", "nl.example.com", "docs.example.com"),
+        (r"^api\d{1}\.example\.net$", "api2.example.net", "api22.example.net"),
+    ],
+)
+def test_host_regexp(pattern, matches, misses):
+    assert host_regexp(pattern).fullmatch(matches)
+    assert not host_regexp(pattern).fullmatch(misses)
+
+
+def test_domain_index():
+    index = DomainIndex.from_projects(
+        [
+            project("shop", **{"traefik.http.routers.shop.rule": "Host(`shop.example.com`, `www.shop.example.com`)"}),
+            project("wild", **{"traefik.http.routers.any.rule": "HostRegexp(`{sub:[a-z]+}.example.org`)"}),
+            project("v3", **{"traefik.http.routers.api.rule": r"HostRegexp(`^api\d\.example\.net$`)"}),
+            project("old-shop", **{"traefik.http.routers.shop.rule": "Host(`shop.example.com`)"}),
+            project("broken", **{"traefik.http.routers.x.rule": "Host(`broken.example.com`"}),
+        ]
+    )
+
+    assert [(route.project, route.router) for route in index.find("https://WWW.shop.example.com/cart")] == [
+        ("shop", "shop")
+    ]
+    assert [route.project for route in index.find("docs.example.org")] == ["wild"]
+    assert [route.project for route in index.find("api2.example.net")] == ["v3"]
+    assert index.find("broken.example.com") == []
+    assert list(index.duplicates()) == ["shop.example.com"]
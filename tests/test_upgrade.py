@@ -0,0 +1,20 @@
+"""
+`upgrade` always brings the stack up, also when nothing was rebuilt.
+"""
+
+import pytest
+from invoke import Context
+
+from src.edwh import tasks
+
+
+def test_stack_is_brought_up_when_nothing_changed(monkeypatch):
+    commands: list[str] = []
+    monkeypatch.setattr(Context, "run", lambda _ctx, command, **_kw: commands.append(command))
+    monkeypatch.setattr(tasks, "select_builds", lambda _ctx: [])
+    monkeypatch.setattr(tasks, "run_builds", lambda _ctx, _checks: [])
+    monkeypatch.setattr(tasks, "stop", lambda *_a, **_kw: pytest.fail("nothing should be stopped"))
+
+    tasks.upgrade(Context(), build=True)
+
+    assert commands == [f"{tasks.DOCKER_COMPOSE} up -d"]